@@ -0,0 +1,69 @@
+"""
+Měřicí skripty pro backend. Spouští se z příkazové řádky, např.:
+
+    python benchmark.py matcher --subscriptions 2000
+    python benchmark.py http --clients 32
+    python benchmark.py shards --workers 1 2 4
+    python benchmark.py load --blocks 1000
+    python benchmark.py e2e --blocks 500 --fan-out 3 --depth 3
+    python benchmark.py fanin --width 16 --tail 4
+    python benchmark.py analog --channels 8 64 512
+    python benchmark.py history --topics 10000 --samples 96
+    python benchmark.py ingest --endpoints 50 --rounds 20
+    python benchmark.py definitions --requests 500
+    python benchmark.py outbox --messages 20000 --topics 200 --qos 1
+    python benchmark.py generate --blocks 500 -o bench_config.json
+
+S přepínačem --json vypíše výsledek jako jeden JSON objekt; --record SOUBOR ho navíc
+připojí jako řádek (s časem a revizí) do souboru pro sledování regresí v čase.
+
+Samotná měření jsou v balíčku benchmarks/ po subsystémech; každý modul si v register()
+přidá své podpříkazy.
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+
+from benchmarks import analog, blocks, e2e, history, mqtt, web
+
+def _record(path, result):
+    """Připojí výsledek jako řádek JSON s časem a revizí gitu (pro sledování regresí v čase)."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        revision = None
+    with open(path, "a") as f:
+        f.write(json.dumps({"timestamp": time.time(), "revision": revision, **result}) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the smart home backend")
+    parser.add_argument("--json", action="store_true", help="print machine-readable JSON only")
+    parser.add_argument("--record", metavar="FILE", help="append the result as a JSON line (with timestamp and git revision)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for subsystem in (mqtt, web, blocks, e2e, analog, history):
+        subsystem.register(sub)
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if args.record:
+        _record(args.record, result)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        _print_result(result)
+
+def _print_result(result, indent=0):
+    for key, value in result.items():
+        if isinstance(value, dict) and key != "statuses":
+            print(f"{' ' * indent}{key}:")
+            _print_result(value, indent + 2)
+        elif isinstance(value, float):
+            print(f"{' ' * indent}{key:>24}: {value:.3f}")
+        else:
+            print(f"{' ' * indent}{key:>24}: {value}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Měření backendu po subsystémech, spouští se přes benchmark.py."""
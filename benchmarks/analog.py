@@ -0,0 +1,83 @@
+"""Měření úpravy signálu analogových vstupů."""
+import random
+import time
+
+from hardware_interface import HardwareInterface
+from benchmarks.common import RecordingMQTT, quiet_logging
+
+class _NoisyADC(HardwareInterface):
+    """Simulovaný ADC: pomalu se měnící signál s šumem několika LSB a občasnou špičkou."""
+    def __init__(self, channels, noise, seed):
+        super().__init__()
+        self._random = random.Random(seed)
+        self._channels = channels
+        self._noise = noise
+        self._step = 0
+
+    def advance(self):
+        self._step += 1
+        for pin in range(self._channels):
+            level = 512 + 200 * ((self._step // 50 + pin) % 3 - 1) # skoková změna každých 50 vzorků
+            value = level + self._random.randint(-self._noise, self._noise)
+            if self._random.random() < 0.01:
+                value += 300 # špička
+            self.analog_inputs[pin] = max(0, min(1023, value))
+
+def bench_analog(args):
+    """
+    Šumící analogové kanály: kolik změn dostane Lua (a MQTT) při hlášení každé změny o 1 LSB
+    oproti úpravě signálu (medián, průměr, deadband s hysterezí) a kolik stojí jeden vzorek.
+    """
+    from block_manager import BlockManager
+    from state_cache import StateCache
+
+    quiet_logging()
+    result = {"benchmark": "analog", "samples": args.samples, "noise": args.noise}
+    conditioning = {"median": 3, "smoothing": "average", "window": 8, "deadband": args.deadband,
+                    "hysteresis": args.deadband / 2, "sample_interval": 0.001}
+    for channels in args.channels:
+        row = {}
+        for mode in ("raw", "conditioned"):
+            hardware_input = {"type": "analog", "address": 0}
+            blocks = [{"id": f"adc_{pin}", "lua_script": "logic_passthrough_block.lua", "config": {},
+                       "inputs": {"trigger": {"hardware_input": {**hardware_input, "address": pin,
+                                                                 **(conditioning if mode == "conditioned" else {})}}},
+                       "outputs": {"output_1": f"bench/adc_{pin}"}}
+                      for pin in range(channels)]
+            transport = RecordingMQTT([])
+            hw = _NoisyADC(channels, args.noise, args.seed)
+            manager = BlockManager(transport, hw, StateCache(), "lua_blocks")
+            manager.load_blocks_from_config({"blocks": blocks})
+            reported = []
+            handlers = manager._scan_handlers
+            manager._scan_handlers = [lambda value, handler=handler: (reported.append(value), handler(value)) for handler in handlers]
+
+            elapsed = 0.0
+            now = time.monotonic()
+            for _ in range(args.samples):
+                hw.advance()
+                now += 0.001
+                start = time.perf_counter()
+                if mode == "raw":
+                    manager._poll_hardware_inputs()
+                else:
+                    manager._sample_conditioned_inputs(now)
+                manager._end_batch()
+                elapsed += time.perf_counter() - start
+            manager.shutdown()
+            row[mode] = {
+                "events_per_channel_sample": len(reported) / (channels * args.samples),
+                "us_per_channel_sample": elapsed / (channels * args.samples) * 1e6,
+            }
+        row["event_reduction"] = 1 - row["conditioned"]["events_per_channel_sample"] / max(row["raw"]["events_per_channel_sample"], 1e-12)
+        result[f"channels_{channels}"] = row
+    return result
+
+def register(sub):
+    p = sub.add_parser("analog", help="analog inputs: reporting every 1-LSB change vs. vectorized signal conditioning")
+    p.add_argument("--channels", type=int, nargs="+", default=[8, 64, 512])
+    p.add_argument("--samples", type=int, default=500, help="ADC samples per channel")
+    p.add_argument("--noise", type=int, default=4, help="noise amplitude in LSB")
+    p.add_argument("--deadband", type=float, default=8)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_analog)
@@ -0,0 +1,300 @@
+"""Měření běhu bloků: procesy (shardy), načítání skriptů, režie metrik a šíření hodnot grafem."""
+import os
+import time
+from types import SimpleNamespace
+
+from hardware_interface import HardwareInterface
+from benchmarks.common import CountingMQTT, RecordingMQTT, quiet_logging, timed
+
+# --- Škálování přes více procesů (ShardedRuntime) ---
+
+# Blok, který na každý vstup spálí daný počet iterací a hodnotu pošle dál
+_BUSY_BLOCK_LUA = """--[[
+@blockinfo
+title = Benchmark: Zátěž
+color = #7f8c8d
+inputs = in
+outputs = out
+fields =
+    work; Počet iterací; int; 20000
+@endblockinfo
+]]--
+
+local M = {}
+
+local block_id_g
+local work_g
+
+function M.init(id, config, inputs, outputs)
+    block_id_g = id
+    work_g = config.work or 20000
+end
+
+function M.on_input(input_name, value)
+    local acc = 0
+    for i = 1, work_g do
+        acc = acc + (i % 7)
+    end
+    py_set_mqtt_output(block_id_g, "out", value)
+end
+
+return M
+"""
+
+def bench_shards(args):
+    """Propustnost nezávislých řetězců výpočetně náročných bloků při různém počtu procesů."""
+    import os
+    import tempfile
+    from shard_runner import ShardedRuntime
+    from state_cache import StateCache
+
+    quiet_logging()
+    lua_dir = tempfile.mkdtemp(prefix="bench_lua_")
+    with open(os.path.join(lua_dir, "busy_block.lua"), "w", encoding="utf-8") as f:
+        f.write(_BUSY_BLOCK_LUA)
+
+    blocks, heads, tails = [], [], []
+    for chain in range(args.chains):
+        for depth in range(args.depth):
+            block_id = f"busy_{chain}_{depth}"
+            block = {"id": block_id, "type": "Busy", "lua_script": "busy_block.lua",
+                     "config": {"work": args.work},
+                     "inputs": {"in": {}},
+                     "outputs": {"out": f"bench/{block_id}/out"}}
+            if depth:
+                block["inputs"]["in"] = {"source_block_id": f"busy_{chain}_{depth - 1}", "source_output": "out"}
+            blocks.append(block)
+        heads.append(f"busy_{chain}_0")
+        tails.append(f"bench/busy_{chain}_{args.depth - 1}/out")
+
+    result = {"benchmark": "shards", "chains": args.chains, "depth": args.depth, "events_per_chain": args.events}
+    baseline = None
+    for workers in args.workers:
+        mqtt = CountingMQTT(tails, args.chains * args.events)
+        runtime = ShardedRuntime({"blocks": blocks}, workers, mqtt, HardwareInterface(), StateCache(), lua_dir,
+                                 # bez slučování: každá vstupní hodnota musí projít celým řetězcem
+                                 options={"log_level": "WARNING",
+                                          "dispatcher": {"policy": "drop_oldest", "max_queue": args.events * args.chains + 16}})
+        runtime.start()
+        start = time.perf_counter()
+        for n in range(args.events):
+            for head in heads:
+                runtime.inject_input(head, "in", n)
+        finished = mqtt.done.wait(args.timeout)
+        elapsed = time.perf_counter() - start
+        runtime.shutdown()
+
+        throughput = mqtt.received / elapsed
+        baseline = baseline or throughput
+        result[f"workers_{workers}"] = {"shards": len(runtime.shard_blocks), "completed": finished,
+                                        "chain_events_per_s": throughput, "speedup": throughput / baseline}
+    return result
+
+# --- Načítání bloků: kompilace skriptu pro každý blok vs. sdílený chunk ---
+
+def bench_load(args):
+    """Čas načtení a paměť Lua na instanci pro N syntetických bloků ze stávajících skriptů."""
+    from block_manager import BlockManager
+    from state_cache import StateCache
+
+    quiet_logging()
+    scripts = ["digital_input_block.lua", "logic_block.lua", "thermostat_block.lua", "digital_output_block.lua"]
+    blocks = [{"id": f"block_{i}", "lua_script": scripts[i % len(scripts)],
+               "config": {"input_pin": 4, "output_pin": 12, "set_point": 21.5, "default_state": False},
+               "inputs": {}, "outputs": {"state": f"bench/block_{i}/state"}}
+              for i in range(args.blocks)]
+
+    result = {"benchmark": "load", "blocks": args.blocks}
+    for mode in ("compile_per_block", "shared_chunk"):
+        manager = BlockManager(CountingMQTT([], 0), HardwareInterface(), StateCache(), args.lua_dir)
+        if mode == "compile_per_block":
+            # Původní chování: každý blok znovu přečte, zparsuje a zkompiluje svůj skript
+            def instantiate(lua_path, manager=manager):
+                manager._load_chunk(lua_path) # jen kvůli signatuře a typům v cache, kompiluje se jednou na skript
+                with open(lua_path, 'r', encoding='utf-8') as f:
+                    return manager.lua_runtime.execute(f.read())
+            manager._instantiate_block = instantiate
+
+        manager.lua_runtime.execute('collectgarbage("collect")')
+        memory_before = manager.lua_runtime.eval('collectgarbage("count")')
+        start = time.perf_counter()
+        manager.load_blocks_from_config({"blocks": blocks})
+        elapsed = time.perf_counter() - start
+        manager.lua_runtime.execute('collectgarbage("collect")')
+        memory_after = manager.lua_runtime.eval('collectgarbage("count")')
+        manager.shutdown()
+
+        result[mode] = {"load_ms": elapsed * 1000,
+                        "us_per_block": elapsed / args.blocks * 1e6,
+                        "lua_bytes_per_block": (memory_after - memory_before) * 1024 / args.blocks}
+    return result
+
+def bench_metrics(args):
+    """Režie měření (metrics.Metrics) na volání bloku a na příchozí MQTT zprávu: vypnuto vs. zapnuto."""
+    from block_manager import BlockManager
+    from metrics import Metrics
+    from mqtt_client import MQTTClient
+    from state_cache import StateCache
+
+    quiet_logging()
+    blocks = [{"id": f"thermostat_{i}", "lua_script": "thermostat_block.lua", "config": {"set_point": 21.5},
+               "inputs": {}, "outputs": {"heating_state": f"bench/thermostat_{i}/state"}}
+              for i in range(args.blocks)]
+    messages = [SimpleNamespace(topic=f"bench/sensor/{i % args.blocks}", payload=b"20.5") for i in range(args.calls)]
+
+    result = {"benchmark": "metrics", "blocks": args.blocks, "calls": args.calls}
+    for mode in ("disabled", "enabled"):
+        metrics = Metrics() if mode == "enabled" else None
+        manager = BlockManager(CountingMQTT([], 0), HardwareInterface(), StateCache(), "lua_blocks", metrics=metrics)
+        manager.load_blocks_from_config({"blocks": blocks})
+        block_ids = list(manager.block_instances)
+        # Teplota se nemění, blok tedy jen porovná hodnotu: měříme hlavně režii okolo volání
+        def call_blocks():
+            for n in range(args.calls):
+                manager._call_lua_input_handler(block_ids[n % len(block_ids)], "current_temperature", "20.5")
+        block_elapsed = timed(call_blocks, args.repeat)
+        manager.shutdown()
+
+        client = MQTTClient("localhost", 1883, StateCache(), metrics=metrics)
+        client.subscribe("bench/sensor/+", lambda topic, payload: None)
+        def deliver():
+            for message in messages:
+                client._on_message(None, None, message)
+        mqtt_elapsed = timed(deliver, args.repeat)
+        client.outbox.stop(timeout=0)
+
+        result[mode] = {"block_call_ns": block_elapsed / args.calls * 1e9,
+                        "mqtt_message_ns": mqtt_elapsed / args.calls * 1e9}
+        if metrics is not None:
+            result[mode]["render_ms"] = timed(metrics.render, args.repeat) * 1000
+            result[mode]["render_bytes"] = len(metrics.render())
+
+    result["overhead_block_call_ns"] = result["enabled"]["block_call_ns"] - result["disabled"]["block_call_ns"]
+    result["overhead_mqtt_message_ns"] = result["enabled"]["mqtt_message_ns"] - result["disabled"]["mqtt_message_ns"]
+    return result
+
+# --- Šíření hodnot grafem: okamžité vs. uspořádané ---
+
+_FANIN_SINK = """
+local M = {}
+local block_id_g
+local values = {}
+
+function M.init(id, config, inputs, outputs)
+    block_id_g = id
+end
+
+local function publish_sum()
+    local sum = 0
+    for _, value in pairs(values) do sum = sum + value end
+    py_set_mqtt_output(block_id_g, "sum", sum)
+end
+
+function M.on_input(input_name, value)
+    values[input_name] = tonumber(value) or 0
+    publish_sum()
+end
+%s
+return M
+"""
+
+_FANIN_ON_INPUTS = """
+function M.on_inputs(changes)
+    for input_name, value in pairs(changes) do values[input_name] = tonumber(value) or 0 end
+    publish_sum()
+end
+"""
+
+def bench_fanin(args):
+    """
+    Široký fan-in: zdroj -> N paralelních bloků -> jeden sběrný blok s N vstupy -> řetěz D bloků.
+    Porovná okamžité doručování (sběrný blok proběhne N-krát a jeho mezivýsledky se šíří dál)
+    s uspořádaným průchodem. Bez on_inputs dostane sběrný blok i tak každou hodnotu zvlášť,
+    s on_inputs proběhne jednou se všemi změněnými vstupy.
+    """
+    import shutil
+    import tempfile
+    from block_manager import BlockManager
+    from metrics import Metrics
+    from state_cache import StateCache
+
+    quiet_logging()
+    result = {"benchmark": "fanin", "width": args.width, "tail": args.tail, "events": args.events}
+    with tempfile.TemporaryDirectory() as lua_dir:
+        shutil.copy(os.path.join("lua_blocks", "logic_passthrough_block.lua"), lua_dir)
+        for name, extra in (("fanin_sink.lua", ""), ("fanin_sink_batched.lua", _FANIN_ON_INPUTS)):
+            with open(os.path.join(lua_dir, name), "w") as f:
+                f.write(_FANIN_SINK % extra)
+
+        for mode in ("immediate", "ordered", "ordered_on_inputs"):
+            def passthrough(block_id, source):
+                return {"id": block_id, "lua_script": "logic_passthrough_block.lua", "config": {},
+                        "inputs": {"trigger": {"source_block_id": source, "source_output": "output_1"}} if source else {},
+                        "outputs": {"output_1": f"bench/{block_id}"}}
+            blocks = [passthrough("src", None)]
+            blocks += [passthrough(f"mid_{i}", "src") for i in range(args.width)]
+            blocks.append({"id": "sink", "lua_script": "fanin_sink_batched.lua" if mode == "ordered_on_inputs" else "fanin_sink.lua",
+                           "config": {}, "outputs": {"output_1": "bench/sink"},
+                           "inputs": {f"in_{i}": {"source_block_id": f"mid_{i}", "source_output": "output_1"} for i in range(args.width)}})
+            # Sběrný blok publikuje výstup 'sum'; řetěz za ním bere 'output_1', proto ho přejmenujeme
+            blocks[-1]["outputs"] = {"sum": "bench/sink"}
+            previous, previous_output = "sink", "sum"
+            for i in range(args.tail):
+                blocks.append({"id": f"tail_{i}", "lua_script": "logic_passthrough_block.lua", "config": {},
+                               "inputs": {"trigger": {"source_block_id": previous, "source_output": previous_output}},
+                               "outputs": {"output_1": f"bench/tail_{i}"}})
+                previous, previous_output = f"tail_{i}", "output_1"
+
+            metrics = Metrics()
+            transport = RecordingMQTT(["bench/sink"])
+            manager = BlockManager(transport, HardwareInterface(), StateCache(), lua_dir,
+                                   metrics=metrics, ordered_propagation=(mode != "immediate"))
+            manager.load_blocks_from_config({"blocks": blocks})
+            transport.payloads.clear()
+            calls_before = sum(h.count for (_, callback), h in metrics.block_calls.items() if callback != "init")
+
+            start = time.perf_counter()
+            for event in range(1, args.events + 1):
+                manager.inject_input("src", "trigger", event)
+                manager.process_events(0)
+            elapsed = time.perf_counter() - start
+            calls = sum(h.count for (_, callback), h in metrics.block_calls.items() if callback != "init") - calls_before
+            manager.shutdown()
+
+            expected = {float(args.width * event) for event in range(1, args.events + 1)}
+            result[mode] = {
+                "invocations_per_event": calls / args.events,
+                "sink_outputs_per_event": len(transport.payloads) / args.events,
+                # Mezivýsledky sběrného bloku spočítané z částečně aktualizovaných vstupů
+                "glitches": sum(1 for payload in transport.payloads if float(payload) not in expected),
+                "us_per_event": elapsed / args.events * 1e6,
+            }
+    result["invocation_reduction"] = 1 - result["ordered_on_inputs"]["invocations_per_event"] / result["immediate"]["invocations_per_event"]
+    return result
+
+def register(sub):
+    p = sub.add_parser("shards", help="throughput scaling of ShardedRuntime with the number of worker processes")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--chains", type=int, default=8, help="independent block chains (connected components)")
+    p.add_argument("--depth", type=int, default=3, help="blocks per chain")
+    p.add_argument("--events", type=int, default=100, help="inputs injected into each chain")
+    p.add_argument("--work", type=int, default=20000, help="Lua loop iterations per block invocation")
+    p.add_argument("--timeout", type=float, default=120)
+    p.set_defaults(func=bench_shards)
+
+    p = sub.add_parser("load", help="block loading: compiling each script per block vs. a shared compiled chunk")
+    p.add_argument("--blocks", type=int, default=1000)
+    p.add_argument("--lua-dir", default="lua_blocks")
+    p.set_defaults(func=bench_load)
+
+    p = sub.add_parser("metrics", help="overhead of per-block and MQTT instrumentation: disabled vs. enabled")
+    p.add_argument("--blocks", type=int, default=100)
+    p.add_argument("--calls", type=int, default=50000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser("fanin", help="dataflow propagation on a wide fan-in graph: immediate vs. topologically ordered")
+    p.add_argument("--width", type=int, default=16, help="parallel blocks feeding the fan-in block")
+    p.add_argument("--tail", type=int, default=4, help="blocks chained after the fan-in block")
+    p.add_argument("--events", type=int, default=200)
+    p.set_defaults(func=bench_fanin)
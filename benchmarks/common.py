@@ -0,0 +1,61 @@
+"""Pomocné funkce a náhrady MQTT klienta sdílené měřeními."""
+import os
+import threading
+import time
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def percentiles(samples, points=(50, 90, 99)):
+    """Vrátí {'p50_ms': ..., ...} v milisekundách ze seznamu vzorků v sekundách."""
+    if not samples:
+        return {f"p{p}_ms": None for p in points}
+    ordered = sorted(samples)
+    return {f"p{p}_ms": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000 for p in points}
+
+def quiet_logging():
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+def resident_bytes():
+    """Rezidentní paměť procesu (jen Linux, jinak None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class CountingMQTT:
+    """Minimální náhrada MQTTClient pro rodičovský proces: jen počítá publikace na sledovaná témata."""
+    def __init__(self, watched_topics, expected):
+        self.watched = set(watched_topics)
+        self.expected = expected
+        self.received = 0
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if topic in self.watched:
+            with self._lock:
+                self.received += 1
+                if self.received >= self.expected:
+                    self.done.set()
+
+    def subscribe(self, topic, callback_func):
+        pass
+
+    def unsubscribe(self, topic, callback_func=None):
+        pass
+
+class RecordingMQTT(CountingMQTT):
+    def __init__(self, watched_topics):
+        super().__init__(watched_topics, float("inf"))
+        self.payloads = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if topic in self.watched:
+            self.payloads.append(payload)
@@ -0,0 +1,266 @@
+"""End-to-end měření nad syntetickým grafem bloků s náhradou brokeru a hardwaru."""
+import json
+import queue
+import threading
+import time
+
+from hardware_interface import HardwareInterface
+from benchmarks.common import percentiles, quiet_logging, resident_bytes
+
+# --- Syntetický graf bloků, náhrada brokeru a hardwaru pro end-to-end měření ---
+
+def generate_graph(blocks=100, fan_out=2, depth=3, mqtt_prefix="bench"):
+    """
+    Vytvoří konfiguraci (jako config.json) ze stávajících bloků v lua_blocks/: les stromů
+    DigitalInput -> LogicPassthrough (depth - 1 úrovní, každý uzel má fan_out potomků) -> DigitalOutput.
+    Počet stromů se volí tak, aby celkový počet bloků byl co nejblíž `blocks`.
+    Vrací (config, trees), kde trees je [(vstupní pin, [výstupní piny listů])].
+    """
+    if fan_out < 1 or depth < 1:
+        raise ValueError("fan_out and depth must be at least 1")
+    tree_size = sum(fan_out ** level for level in range(depth + 1))
+    num_trees = max(1, round(blocks / tree_size))
+    config_blocks, trees = [], []
+    next_output_pin = 1000
+
+    for tree in range(num_trees):
+        input_pin = 2 + tree
+        root_id = f"t{tree}_in"
+        config_blocks.append({
+            "id": root_id, "type": "DigitalInput", "lua_script": "digital_input_block.lua",
+            "config": {"input_pin": input_pin},
+            "inputs": {"pin": {"hardware_input": {"type": "digital", "address": input_pin}}},
+            "outputs": {"state": f"{mqtt_prefix}/{root_id}/state", "double_click": f"{mqtt_prefix}/{root_id}/double_click"},
+        })
+        parents = [(root_id, "state")]
+        for level in range(1, depth):
+            children = []
+            for index, (parent_id, parent_output) in enumerate(parents):
+                for child in range(fan_out):
+                    block_id = f"t{tree}_l{level}_{index * fan_out + child}"
+                    config_blocks.append({
+                        "id": block_id, "type": "LogicPassthrough", "lua_script": "logic_passthrough_block.lua",
+                        "config": {},
+                        "inputs": {"trigger": {"source_block_id": parent_id, "source_output": parent_output}},
+                        "outputs": {"output_1": f"{mqtt_prefix}/{block_id}/output_1"},
+                    })
+                    children.append((block_id, "output_1"))
+            parents = children
+
+        leaf_pins = []
+        for index, (parent_id, parent_output) in enumerate(parents):
+            for child in range(fan_out):
+                block_id = f"t{tree}_out{index * fan_out + child}"
+                config_blocks.append({
+                    "id": block_id, "type": "DigitalOutput", "lua_script": "digital_output_block.lua",
+                    "config": {"output_pin": next_output_pin},
+                    "inputs": {"set_state": {"source_block_id": parent_id, "source_output": parent_output}},
+                    "outputs": {},
+                })
+                leaf_pins.append(next_output_pin)
+                next_output_pin += 1
+        trees.append((input_pin, leaf_pins))
+
+    return {"mqtt_broker_host": "localhost", "mqtt_broker_port": 1883, "blocks": config_blocks}, trees
+
+class InMemoryMQTT:
+    """
+    Náhrada MQTTClient bez brokeru. Má stejné rozhraní (connect, disconnect, publish,
+    subscribe, unsubscribe) a stejně jako paho doručuje zprávy z vlastního síťového vlákna,
+    včetně ozvěny vlastních publikací a plnění StateCache podle cache_topics.
+    """
+    echoes_publishes = True
+
+    def __init__(self, state_cache=None, cache_topics=("#",)):
+        from topic_matcher import TopicMatcher
+        self.state_cache = state_cache
+        self.message_handlers = {}
+        self._matcher = TopicMatcher()
+        self._cache_matcher = TopicMatcher()
+        for cache_topic in cache_topics:
+            self._cache_matcher.add(cache_topic, True)
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self.published = 0
+        self.delivered = 0
+
+    def connect(self):
+        self._thread = threading.Thread(target=self._loop, name="inmemory-mqtt", daemon=True)
+        self._thread.start()
+
+    def disconnect(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        from mqtt_client import encode_payload
+        self.published += 1
+        self._queue.put((topic, encode_payload(payload)))
+
+    def subscribe(self, topic, callback_func):
+        handlers = self.message_handlers.setdefault(topic, [])
+        if callback_func not in handlers:
+            handlers.append(callback_func)
+            self._matcher.add(topic, callback_func)
+
+    def unsubscribe(self, topic, callback_func=None):
+        handlers = self.message_handlers.get(topic, [])
+        for handler in list(handlers):
+            if callback_func is None or handler == callback_func:
+                handlers.remove(handler)
+                self._matcher.remove(topic, handler)
+        if topic in self.message_handlers and not handlers:
+            del self.message_handlers[topic]
+
+    def _loop(self):
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+            topic, payload = message
+            if self.state_cache is not None and self._cache_matcher.match(topic):
+                self.state_cache.set(topic, payload)
+            for handler in self._matcher.match(topic):
+                handler(topic, payload)
+            self.delivered += 1
+
+class _Countdown:
+    def __init__(self, count):
+        self.remaining = count
+        self.done = threading.Event()
+        if count <= 0:
+            self.done.set()
+
+    def hit(self):
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.done.set()
+
+class _BenchHardware(HardwareInterface):
+    """Simulovaný hardware s libovolným počtem vstupních pinů, který hlásí zápis očekávaných výstupů."""
+    def __init__(self, input_pins):
+        super().__init__()
+        for pin in input_pins:
+            self.digital_inputs[pin] = False
+        self._expected = {} # pin -> (stav, _Countdown)
+
+    def expect(self, pins, state):
+        countdown = _Countdown(len(pins))
+        for pin in pins:
+            self._expected[pin] = (state, countdown)
+        return countdown
+
+    def flush_outputs(self):
+        # Volá se jen z vlákna dispečera, stejně jako zápisy do stínového registru
+        pending = dict(self._pending_outputs)
+        written = super().flush_outputs()
+        for pin, state in pending.items():
+            expected = self._expected.get(pin)
+            if expected is not None and expected[0] == state:
+                del self._expected[pin]
+                expected[1].hit()
+        return written
+
+def bench_e2e(args):
+    """
+    Latence od hrany na vstupu (simulate_digital_input_change) po poslední zápis výstupu
+    ve stromu, propustnost a paměť, pro lokální doručování i cestu přes (falešný) broker.
+    """
+    from block_manager import BlockManager
+    from state_cache import StateCache
+
+    quiet_logging()
+    config, trees = generate_graph(args.blocks, args.fan_out, args.depth)
+    result = {"benchmark": "e2e", "blocks": len(config["blocks"]), "trees": len(trees),
+              "fan_out": args.fan_out, "depth": args.depth, "events": args.events}
+
+    for mode in args.modes:
+        rss_before = resident_bytes()
+        state_cache = StateCache()
+        transport = InMemoryMQTT(state_cache)
+        transport.connect()
+        hardware = _BenchHardware([pin for pin, _ in trees])
+        manager = BlockManager(transport, hardware, state_cache, "lua_blocks", local_dispatch=(mode == "local"))
+        start = time.perf_counter()
+        manager.load_blocks_from_config(config)
+        load_ms = (time.perf_counter() - start) * 1000
+        loop = threading.Thread(target=manager.run_forever, daemon=True)
+        loop.start()
+
+        states = {pin: False for pin, _ in trees}
+        timeouts = 0
+
+        def toggle(tree_index):
+            pin, leaves = trees[tree_index]
+            states[pin] = not states[pin]
+            waiter = hardware.expect(leaves, states[pin])
+            hardware.simulate_digital_input_change(pin, states[pin])
+            return waiter
+
+        # Latence: jedna hrana po druhé, čekáme na zápis všech listů stromu
+        latencies = []
+        for event in range(args.events):
+            start = time.perf_counter()
+            waiter = toggle(event % len(trees))
+            if not waiter.done.wait(args.timeout):
+                timeouts += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+        # Propustnost: v každém kole přepneme vstupy všech stromů najednou
+        rounds = max(1, args.events // len(trees))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            waiters = [toggle(index) for index in range(len(trees))]
+            for waiter in waiters:
+                if not waiter.done.wait(args.timeout):
+                    timeouts += 1
+        elapsed = time.perf_counter() - start
+        leaf_writes = rounds * sum(len(leaves) for _, leaves in trees)
+
+        manager.stop()
+        loop.join()
+        lua_kb = manager.lua_runtime.eval('collectgarbage("count")')
+        rss_after = resident_bytes()
+        manager.shutdown()
+        transport.disconnect()
+
+        result[mode] = {
+            "load_ms": load_ms,
+            **percentiles(latencies),
+            "edges_per_s": rounds * len(trees) / elapsed,
+            "output_writes_per_s": leaf_writes / elapsed,
+            "mqtt_messages": transport.published,
+            "lua_memory_kb": lua_kb,
+            "rss_delta_kb": (rss_after - rss_before) / 1024 if rss_before is not None else None,
+            "timeouts": timeouts,
+        }
+    return result
+
+def bench_generate(args):
+    """Zapíše syntetickou konfiguraci do souboru (pro ruční spuštění main.py nad velkým grafem)."""
+    config, trees = generate_graph(args.blocks, args.fan_out, args.depth)
+    with open(args.output, "w") as f:
+        json.dump(config, f, indent=2)
+    return {"benchmark": "generate", "output": args.output, "blocks": len(config["blocks"]), "trees": len(trees),
+            "input_pins": [pin for pin, _ in trees][:10]}
+
+def register(sub):
+    p = sub.add_parser("e2e", help="end-to-end latency from input edge to output write on a synthetic block graph")
+    p.add_argument("--blocks", type=int, default=300, help="approximate number of blocks")
+    p.add_argument("--fan-out", type=int, default=2)
+    p.add_argument("--depth", type=int, default=3, help="hops from input to output")
+    p.add_argument("--events", type=int, default=500)
+    p.add_argument("--modes", nargs="+", choices=["local", "mqtt"], default=["local", "mqtt"],
+                   help="local = in-process dispatch, mqtt = through the in-memory broker")
+    p.add_argument("--timeout", type=float, default=5.0)
+    p.set_defaults(func=bench_e2e)
+
+    p = sub.add_parser("generate", help="write a synthetic config.json graph")
+    p.add_argument("--blocks", type=int, default=300)
+    p.add_argument("--fan-out", type=int, default=2)
+    p.add_argument("--depth", type=int, default=3)
+    p.add_argument("-o", "--output", default="bench_config.json")
+    p.set_defaults(func=bench_generate)
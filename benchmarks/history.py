@@ -0,0 +1,66 @@
+"""Měření historie témat (history_store) a dotazů /api/history."""
+import os
+import random
+import time
+
+from benchmarks.common import percentiles, quiet_logging, resident_bytes
+
+def bench_history(args):
+    """
+    HistoryStore s N tématy: cena zápisu vzorku, paměť (namapované segmenty vs. rezidentní) a latence
+    dotazů přes GET /api/history (posledních 24 h surově, po minutách a po 15 minutách).
+    """
+    import shutil
+    import tempfile
+    from history_store import HistoryStore
+    from state_cache import StateCache
+    from web_server import create_app
+
+    quiet_logging()
+    path = tempfile.mkdtemp(prefix="history-bench-")
+    rng = random.Random(args.seed)
+    try:
+        resident_before = resident_bytes()
+        store = HistoryStore(path, raw_capacity=args.raw_capacity, max_topics=args.topics)
+        topics = [f"bench/sensor_{i}/temperature" for i in range(args.topics)]
+        now = time.time()
+        interval = 86400 / args.samples
+
+        start = time.perf_counter()
+        for sample in range(args.samples):
+            timestamp = now - 86400 + sample * interval
+            # Hodnoty jako textové payloady z MQTT
+            store.record_many([(topic, f"{20 + rng.random() * 5:.2f}", timestamp) for topic in topics])
+        record_seconds = time.perf_counter() - start
+        resident_after = resident_bytes()
+
+        client = create_app(None, [], StateCache(), "lua_blocks", history=store).test_client()
+        result = {
+            "benchmark": "history", "topics": args.topics, "samples_per_topic": args.samples,
+            "record_us_per_sample": record_seconds / (args.topics * args.samples) * 1e6,
+            "mapped_mb": store.stats()["mapped_bytes"] / 2**20,
+            "disk_mb": sum(os.stat(os.path.join(path, name)).st_blocks * 512 for name in os.listdir(path)) / 2**20,
+            "resident_growth_mb": (resident_after - resident_before) / 2**20 if resident_before is not None else None,
+        }
+        for name, query in (("raw_24h", ""), ("step_60_24h", "&step=60"), ("step_900_24h", "&step=900")):
+            latencies, points = [], 0
+            for _ in range(args.queries):
+                topic = rng.choice(topics)
+                begin = time.perf_counter()
+                response = client.get(f"/api/history/{topic}?from={now - 86400}&to={now}{query}")
+                latencies.append(time.perf_counter() - begin)
+                points = len(response.get_json()["timestamps"])
+            result[name] = {"points": points, **percentiles(latencies)}
+        store.stop()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    return result
+
+def register(sub):
+    p = sub.add_parser("history", help="topic history store: write cost, memory and /api/history query latency")
+    p.add_argument("--topics", type=int, default=10000)
+    p.add_argument("--samples", type=int, default=96, help="samples per topic, spread over the last 24 hours")
+    p.add_argument("--raw-capacity", type=int, default=256)
+    p.add_argument("--queries", type=int, default=200, help="queries of each kind")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_history)
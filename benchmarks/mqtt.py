@@ -0,0 +1,248 @@
+"""Měření MQTT vrstvy: hledání odběrů a odchozí fronta."""
+import os
+import queue
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from benchmarks.common import quiet_logging, timed
+
+# --- Hledání odběrů MQTT ---
+
+def bench_matcher(args):
+    """Porovná lineární průchod odběry (původní _on_message) se stromovým TopicMatcher."""
+    import paho.mqtt.client as mqtt
+    from topic_matcher import TopicMatcher
+
+    rnd = random.Random(args.seed)
+    rooms = [f"room{i}" for i in range(50)]
+    kinds = ["light", "button", "sensor", "relay", "thermostat"]
+
+    def random_topic():
+        return f"smarthome/{rnd.choice(kinds)}/{rnd.choice(rooms)}/{rnd.randrange(20)}/state"
+
+    subscriptions = []
+    for i in range(args.subscriptions):
+        roll = rnd.random()
+        if roll < 0.8:
+            subscriptions.append(random_topic())
+        elif roll < 0.95:
+            subscriptions.append(f"smarthome/{rnd.choice(kinds)}/+/{rnd.randrange(20)}/state")
+        else:
+            subscriptions.append(f"smarthome/{rnd.choice(kinds)}/{rnd.choice(rooms)}/#")
+    topics = [random_topic() for _ in range(args.messages)]
+
+    handlers = {}
+    matcher = TopicMatcher()
+    for sub in subscriptions:
+        handler = object()
+        handlers.setdefault(sub, []).append(handler)
+        matcher.add(sub, handler)
+
+    def linear():
+        for topic in topics:
+            found = list(handlers.get(topic, ()))
+            for sub_topic, sub_handlers in handlers.items():
+                if '#' in sub_topic or '+' in sub_topic:
+                    if mqtt.topic_matches_sub(sub_topic, topic) and sub_topic != topic:
+                        found.extend(sub_handlers)
+
+    def trie():
+        for topic in topics:
+            matcher.match(topic)
+
+    # Kontrola, že obě varianty najdou totéž
+    for topic in topics[:200]:
+        expected = list(handlers.get(topic, ()))
+        for sub_topic, sub_handlers in handlers.items():
+            if ('#' in sub_topic or '+' in sub_topic) and mqtt.topic_matches_sub(sub_topic, topic):
+                expected.extend(sub_handlers)
+        assert sorted(map(id, expected)) == sorted(map(id, matcher.match(topic))), topic
+
+    linear_s = timed(linear, args.repeat)
+    trie_s = timed(trie, args.repeat)
+    return {
+        "benchmark": "matcher",
+        "subscriptions": args.subscriptions,
+        "messages": args.messages,
+        "linear_us_per_message": linear_s / args.messages * 1e6,
+        "trie_us_per_message": trie_s / args.messages * 1e6,
+        "speedup": linear_s / trie_s,
+    }
+
+# --- Odchozí fronta MQTT (mqtt_outbox) ---
+
+class StandInBroker:
+    """
+    Náhrada paho klienta i s brokerem pro zkoušení odchozí fronty MQTTClient bez sítě.
+    publish() vrací MQTTMessageInfo-like objekt (rc, mid) jako paho; QoS 1/2 potvrzuje
+    (on_publish) z vlastního vlákna po ack_delay sekundách. down()/up() simulují výpadek:
+    bez spojení QoS 0 vrací MQTT_ERR_NO_CONN a QoS 1/2 si podrží do znovupřipojení, stejně jako paho.
+    """
+    def __init__(self, ack_delay=0.0):
+        import paho.mqtt.client as mqtt
+        self._mqtt = mqtt
+        self.ack_delay = ack_delay
+        self.on_connect = self.on_disconnect = self.on_publish = self.on_message = None
+        self.received = [] # (topic, payload) v pořadí příchodu na broker
+        self._connected = False
+        self._held = []
+        self._mid = 0
+        self._lock = threading.Lock()
+        self._acks = queue.SimpleQueue()
+        threading.Thread(target=self._ack_loop, name="standin-acks", daemon=True).start()
+
+    def attach(self, client):
+        """Nahradí paho klienta v MQTTClient a převezme jeho callbacky."""
+        self.on_connect, self.on_disconnect = client._on_connect, client._on_disconnect
+        self.on_publish, self.on_message = client._on_publish, client._on_message
+        client.client = self
+
+    def connect(self, host, port, keepalive=60):
+        self.up()
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        self.down(rc=0)
+
+    def is_connected(self):
+        return self._connected
+
+    def subscribe(self, topic):
+        pass
+
+    def unsubscribe(self, topic):
+        pass
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            self._mid += 1
+            info = SimpleNamespace(mid=self._mid, rc=self._mqtt.MQTT_ERR_SUCCESS)
+            if not self._connected:
+                info.rc = self._mqtt.MQTT_ERR_NO_CONN
+                if qos > 0:
+                    self._held.append((info.mid, topic, payload))
+                return info
+            self.received.append((topic, payload))
+        if qos > 0:
+            self._acks.put((time.perf_counter() + self.ack_delay, info.mid))
+        return info
+
+    def down(self, rc=1):
+        with self._lock:
+            self._connected = False
+        if self.on_disconnect:
+            self.on_disconnect(self, None, rc)
+
+    def up(self):
+        with self._lock:
+            self._connected = True
+            held, self._held = self._held, []
+            self.received.extend((topic, payload) for _, topic, payload in held)
+        for mid, _, _ in held:
+            self._acks.put((time.perf_counter() + self.ack_delay, mid))
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    def _ack_loop(self):
+        while True:
+            due, mid = self._acks.get()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if self.on_publish:
+                self.on_publish(self, None, mid)
+
+def bench_outbox(args):
+    """
+    Odchozí fronta MQTTClient proti StandInBroker: cena publish() pro producenta a propustnost
+    při spojení, pak výpadek brokeru (fronta slučuje, přetečení jde do spoolu) a jeho dohnání
+    po znovupřipojení. Kontroluje, že každé téma skončí na poslední hodnotě a hodnoty jdou po sobě.
+    """
+    import tempfile
+    from mqtt_client import MQTTClient
+
+    quiet_logging()
+    result = {"benchmark": "outbox", "messages": args.messages, "topics": args.topics, "qos": args.qos}
+    with tempfile.TemporaryDirectory() as tmp:
+        broker = StandInBroker(args.ack_delay)
+        client = MQTTClient("stand-in", 0, None, outbound_config={
+            "max_queue": args.max_queue, "batch_size": args.batch_size, "max_inflight": args.max_inflight,
+            "spool_path": os.path.join(tmp, "spool.bin"), "spool_max_bytes": args.spool_max_bytes})
+        broker.attach(client)
+        client.connect()
+
+        def publish_all(offset):
+            start = time.perf_counter()
+            for n in range(args.messages):
+                client.publish(f"bench/out/{n % args.topics}", offset + n, qos=args.qos)
+            return time.perf_counter() - start
+
+        def drain():
+            start = time.perf_counter()
+            while True:
+                stats = client.outbox.stats()
+                if not stats["queue_depth"] and not stats["spool_bytes"] and not stats["inflight"]:
+                    return time.perf_counter() - start
+                time.sleep(0.001)
+
+        publish_s = publish_all(0)
+        drain_s = drain()
+        connected = client.outbox.stats()
+        result["connected"] = {"publish_ns": publish_s / args.messages * 1e9,
+                               "messages_per_s": args.messages / (publish_s + drain_s),
+                               "sent": connected["sent"], "coalesced": connected["coalesced"],
+                               "batches": connected["batches"]}
+
+        broker.down()
+        publish_s = publish_all(args.messages)
+        during = client.outbox.stats()
+        broker.up()
+        drain_s = drain()
+        after = client.outbox.stats()
+        result["outage"] = {"publish_ns": publish_s / args.messages * 1e9,
+                            "queue_depth": during["queue_depth"], "spool_bytes": during["spool_bytes"],
+                            "replay_ms": drain_s * 1000,
+                            "coalesced": after["coalesced"] - connected["coalesced"],
+                            "spooled": after["spooled"], "spool_dropped": after["spool_dropped"],
+                            "replayed": after["replayed"], "dropped": after["dropped"]}
+        client.disconnect()
+
+    last, ordered = {}, True
+    for topic, payload in broker.received:
+        value = int(payload)
+        if value <= last.get(topic, -1):
+            ordered = False
+        last[topic] = value
+    expected = {f"bench/out/{n % args.topics}": args.messages + n for n in range(args.messages)}
+    result["delivered"] = len(broker.received)
+    result["acked"] = after["acked"]
+    result["ack_timeouts"] = after["ack_timeouts"]
+    result["in_order"] = ordered
+    result["final_values_ok"] = last == expected
+    return result
+
+def register(sub):
+    p = sub.add_parser("matcher", help="MQTT subscription matching: linear scan vs. trie")
+    p.add_argument("--subscriptions", type=int, default=1000)
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=bench_matcher)
+
+    p = sub.add_parser("outbox", help="outgoing MQTT queue: publish cost, coalescing and spool replay after a broker outage")
+    p.add_argument("--messages", type=int, default=20000, help="messages published in each phase")
+    p.add_argument("--topics", type=int, default=200)
+    p.add_argument("--qos", type=int, choices=[0, 1, 2], default=1)
+    p.add_argument("--ack-delay", type=float, default=0.001, help="stand-in broker acknowledgement delay in seconds")
+    p.add_argument("--max-queue", type=int, default=100, help="in-memory queue size (smaller than --topics forces spooling)")
+    p.add_argument("--batch-size", type=int, default=100)
+    p.add_argument("--max-inflight", type=int, default=100)
+    p.add_argument("--spool-max-bytes", type=int, default=10 * 1024 * 1024)
+    p.set_defaults(func=bench_outbox)
@@ -0,0 +1,187 @@
+"""Měření webového serveru: HTTP zátěž, definice bloků pro editor a dávkový příjem vstupů."""
+import random
+import threading
+import time
+
+from hardware_interface import HardwareInterface
+from benchmarks.common import RecordingMQTT, percentiles, quiet_logging, timed
+
+# --- HTTP server: vývojový vs. 'pooled' ---
+
+def bench_http(args):
+    """Zátěžový test GET /api/status a /api/status/<topic> proti oběma režimům serveru."""
+    import requests
+    from http_server import DevelopmentWSGIServer, PooledWSGIServer
+    from state_cache import StateCache
+    from web_server import create_app
+
+    quiet_logging()
+    cache = StateCache()
+    topics = [f"smarthome/sensor/{i}/state" for i in range(args.topics)]
+    for i, topic in enumerate(topics):
+        cache.set(topic, str(i))
+    app = create_app(None, [], cache, "lua_blocks")
+
+    result = {"benchmark": "http", "clients": args.clients, "requests_per_client": args.requests}
+    for mode in ("development", "pooled"):
+        if mode == "development":
+            server = DevelopmentWSGIServer("127.0.0.1", 0, app)
+        else:
+            server = PooledWSGIServer("127.0.0.1", 0, app, workers=args.workers, queue_size=args.queue_size)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}/api/status"
+
+        latencies, statuses, errors = [], {}, [0]
+        lock = threading.Lock()
+
+        def client(seed):
+            rnd = random.Random(seed)
+            session = requests.Session()
+            local_latencies, local_statuses = [], {}
+            for n in range(args.requests):
+                url = base_url if n % 10 == 0 else f"{base_url}/{rnd.choice(topics)}"
+                start = time.perf_counter()
+                try:
+                    status = session.get(url, timeout=10).status_code
+                except requests.exceptions.RequestException:
+                    with lock:
+                        errors[0] += 1
+                    continue
+                local_latencies.append(time.perf_counter() - start)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+            with lock:
+                latencies.extend(local_latencies)
+                for status, count in local_statuses.items():
+                    statuses[status] = statuses.get(status, 0) + count
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        server.stop()
+
+        result[mode] = {"requests_per_s": len(latencies) / elapsed, "statuses": statuses, "errors": errors[0], **percentiles(latencies)}
+    return result
+
+# --- Definice bloků pro editor ---
+
+def bench_definitions(args):
+    """
+    GET /api/block-definitions: původní parsování všech skriptů při každém požadavku
+    vs. BlockDefinitionRegistry (hotové tělo, gzip, 304 na If-None-Match).
+    """
+    from flask import Flask, jsonify
+    from block_parser import BlockDefinitionRegistry, get_all_block_definitions
+    from state_cache import StateCache
+    from web_server import create_app
+
+    quiet_logging()
+    legacy_app = Flask("legacy")
+    legacy_app.add_url_rule("/api/block-definitions", "defs", lambda: jsonify(get_all_block_definitions(args.lua_dir)))
+    registry = BlockDefinitionRegistry(args.lua_dir)
+    app = create_app(None, [], StateCache(), args.lua_dir, definitions=registry)
+
+    legacy_client, client = legacy_app.test_client(), app.test_client()
+    plain = client.get("/api/block-definitions")
+    etag = plain.headers["ETag"]
+    compressed = client.get("/api/block-definitions", headers={"Accept-Encoding": "gzip"})
+    parses_before = registry.parses
+
+    def request_legacy():
+        legacy_client.get("/api/block-definitions")
+    def request_full():
+        client.get("/api/block-definitions", headers={"Accept-Encoding": "gzip"})
+    def request_conditional():
+        client.get("/api/block-definitions", headers={"If-None-Match": etag})
+
+    return {
+        "benchmark": "definitions", "requests": args.requests,
+        "body_bytes": len(plain.data), "gzip_bytes": len(compressed.data),
+        "legacy_us": timed(request_legacy, args.requests) * 1e6,
+        "registry_200_gzip_us": timed(request_full, args.requests) * 1e6,
+        "registry_304_us": timed(request_conditional, args.requests) * 1e6,
+        "conditional_status": client.get("/api/block-definitions", headers={"If-None-Match": etag}).status_code,
+        "reparsed_files": registry.parses - parses_before,
+    }
+
+# --- Dávkový příjem HTTP vstupů ---
+
+def bench_ingest(args):
+    """
+    Integrace posílající N hodnot najednou: N samostatných POST /api/input/<endpoint> vs. jeden
+    POST /api/input/batch (čas na hodnotu včetně zpracování v blocích). Pak přetížení: fronta
+    dispečera se nevybírá a počítá se, kolik dávek dostalo 429.
+    """
+    from block_manager import BlockManager
+    from state_cache import StateCache
+    from web_server import create_app
+
+    quiet_logging()
+    blocks = [{"id": f"http_{i}", "type": "HttpInput", "lua_script": "http_input_block.lua",
+               "config": {"endpoint": f"/bench/{i}"}, "outputs": {"value": f"bench/http_{i}"}}
+              for i in range(args.endpoints)]
+    result = {"benchmark": "ingest", "endpoints": args.endpoints, "rounds": args.rounds}
+
+    manager = BlockManager(RecordingMQTT([]), HardwareInterface(), StateCache(), "lua_blocks",
+                           dispatcher_config={"max_queue": args.max_queue})
+    manager.load_blocks_from_config({"blocks": blocks})
+    client = create_app(manager, blocks, StateCache(), "lua_blocks").test_client()
+
+    def drain():
+        while manager.process_events(0):
+            pass
+
+    start = time.perf_counter()
+    for round_ in range(args.rounds):
+        for i in range(args.endpoints):
+            client.post(f"/api/input/bench/{i}", json={"value": round_})
+        drain()
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for round_ in range(args.rounds):
+        response = client.post("/api/input/batch", json={"items": [{"endpoint": f"/bench/{i}", "value": round_}
+                                                                   for i in range(args.endpoints)]})
+        drain()
+    batched = time.perf_counter() - start
+    values = args.endpoints * args.rounds
+    result["single_us_per_value"] = single / values * 1e6
+    result["batch_us_per_value"] = batched / values * 1e6
+    result["speedup"] = single / batched
+    result["batch_status"] = response.status_code
+
+    # Přetížení: hlavní smyčka nestíhá, fronta se plní, dokud dávky nezačnou dostávat 429
+    statuses = {}
+    for round_ in range(args.rounds):
+        response = client.post("/api/input/batch", json=[{"block_id": f"http_{i}", "value": round_} for i in range(args.endpoints)])
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    result["overload"] = {"max_queue": args.max_queue, "statuses": {str(code): count for code, count in sorted(statuses.items())},
+                          "retry_after": response.headers.get("Retry-After"),
+                          "queued_items": manager.dispatcher.depth(), "dropped": manager.dispatcher.dropped}
+    drain()
+    manager.shutdown()
+    return result
+
+def register(sub):
+    p = sub.add_parser("http", help="HTTP load test: Flask development server vs. pooled server")
+    p.add_argument("--clients", type=int, default=16)
+    p.add_argument("--requests", type=int, default=200, help="requests per client")
+    p.add_argument("--topics", type=int, default=500)
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--queue-size", type=int, default=64)
+    p.set_defaults(func=bench_http)
+
+    p = sub.add_parser("definitions", help="block definitions endpoint: parse per request vs. cached registry with ETag")
+    p.add_argument("--requests", type=int, default=500)
+    p.add_argument("--lua-dir", default="lua_blocks")
+    p.set_defaults(func=bench_definitions)
+
+    p = sub.add_parser("ingest", help="HTTP input ingestion: one request per value vs. POST /api/input/batch with admission control")
+    p.add_argument("--endpoints", type=int, default=50, help="HTTP input blocks, one value each per round")
+    p.add_argument("--rounds", type=int, default=20)
+    p.add_argument("--max-queue", type=int, default=256, help="dispatcher queue capacity in items")
+    p.set_defaults(func=bench_ingest)
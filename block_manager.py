@@ -2,20 +2,147 @@ import lupa
 import os
 import json
 import logging
-import requests # Potřebné pro HTTP požadavky
+import threading
+import heapq
+import itertools
+import time
+from collections import deque
+
+from http_output import HttpOutputPool
+from lua_dispatcher import LuaDispatcher
+from block_parser import BlockDefinitionRegistry
+from mqtt_client import encode_payload
+from publish_policy import DEFER, PUBLISH, parse_publish_policies
+from signal_conditioning import build_conditioners, parse_conditioning, to_python_number
+from value_codec import build_decoders, build_encoders
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Kolik lokálně doručených hodnot na jedno téma si pamatujeme, než je broker vrátí zpět.
+# Pokud broker neběží, ozvěny nikdy nepřijdou, proto je fronta omezená.
+MAX_PENDING_ECHOES = 64
+# Jak dlouho (s) čekáme na ozvěnu jedné publikace. Co broker nevrátí do té doby, už za ozvěnu nepovažujeme.
+ECHO_TTL = 2.0
+
+# Výchozí hodnota slotu v plánu čtení, odlišná od jakékoli skutečné hodnoty vstupu
+_UNSET = object()
+
+class EchoFilter:
+    """
+    Pamatuje si hodnoty, které už byly doručeny lokálně a zároveň publikovány na broker,
+    aby se jejich ozvěna z brokeru nedoručila podruhé.
+
+    Každé očekávání zahodí nejvýš jednu zprávu z brokeru a platí jen ttl sekund. Zprávy se
+    rozlišují jen podle tématu a payloadu: když v tomto okně pošle na stejné téma stejnou
+    hodnotu někdo jiný a naše ozvěna ještě nedorazila, zahodí se místo ní ta cizí. Bloky
+    ji ale už dostaly lokálně se stejnou hodnotou, takže se ztratí jen opakování.
+    """
+    def __init__(self, max_pending=MAX_PENDING_ECHOES, ttl=ECHO_TTL):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._pending = {} # topic -> deque (payload, platnost do), které broker ještě nevrátil
+        self._lock = threading.Lock()
+
+    def expect(self, topic, value):
+        """Zapamatuje si payload, který se vrátí z brokeru a který už byl doručen lokálně."""
+        with self._lock:
+            pending = self._pending.get(topic)
+            if pending is None:
+                pending = self._pending[topic] = deque(maxlen=self.max_pending)
+            pending.append((encode_payload(value), time.monotonic() + self.ttl))
+
+    def consume(self, topic, payload):
+        """Vrátí True, pokud je zpráva z brokeru jen ozvěnou hodnoty, která už byla doručena lokálně."""
+        with self._lock:
+            pending = self._pending.get(topic)
+            if not pending:
+                return False
+            now = time.monotonic()
+            while pending and pending[0][1] < now:
+                pending.popleft()
+            for index, (expected, _) in enumerate(pending):
+                if expected == payload:
+                    # Vše před nalezenou ozvěnou už broker zjevně nevrátí (QoS 0), takže to zahodíme.
+                    for _ in range(index + 1):
+                        pending.popleft()
+                    return True
+            if not pending:
+                del self._pending[topic]
+        return False
+
 class BlockManager:
-    def __init__(self, mqtt_client, hardware_interface, state_cache, lua_block_dir="lua_blocks"):
+    def __init__(self, mqtt_client, hardware_interface, state_cache, lua_block_dir="lua_blocks", local_dispatch=True, http_output_config=None, dispatcher_config=None, metrics=None, definitions=None, ordered_propagation=True):
         self.mqtt_client = mqtt_client
         self.hardware_interface = hardware_interface
         self.state_cache = state_cache
         self.lua_block_dir = lua_block_dir
         self.block_instances = {}
         self.topic_map = {}
-        self.last_hw_states = {}
+        self._chunk_cache = {} # cesta ke skriptu -> ((mtime_ns, size), zkompilovaný chunk, (typy vstupů, typy výstupů))
+        self.last_reload_report = None
+        # Odložené publikace výstupů (zásady coalesce / min_interval): halda (due, pořadí, block_id, output_name)
+        self._deferred_outputs = []
+        self._deferred_seq = itertools.count()
+        # Měření doby volání bloků (metrics.Metrics); None = vypnuto, volání jdou napřímo
+        self.metrics = metrics
+        # Metadata skriptů (@blockinfo) se parsují jednou na verzi souboru; registr může sdílet i webový server
+        self.definitions = definitions if definitions is not None else BlockDefinitionRegistry(lua_block_dir)
+
+        # Lokální doručování mezi bloky: (source_block_id, source_output) -> [{'block_id', 'input_name'}]
+        # MQTT publikace pak slouží jen jako zrcadlo pro vnější pozorovatele.
+        self.local_dispatch = local_dispatch
+        self.local_links = {}
+        # Transport, který publikace nevrací zpět (např. rodičovský proces při běhu v shardech), ozvěny nehlídá
+        self._echoes = EchoFilter() if getattr(mqtt_client, 'echoes_publishes', True) else None
+
+        # Graf toku dat (hrany source_block_id -> blok) a uspořádané šíření lokálních hodnot.
+        # Hodnoty pro lokální příjemce se během dávky jen odloží a na jejím konci se doručí v jednom
+        # průchodu v topologickém pořadí: blok proběhne až po všech svých zdrojích. Žádná hodnota se
+        # neslučuje (krátký stisk tlačítka = dvě hrany); blok s 'on_inputs' dostane změněné vstupy
+        # najednou. ordered_propagation=False = původní okamžité doručování.
+        self.ordered_propagation = ordered_propagation
+        self.dataflow_cycles = []    # [[block_id, ...]] silně souvislé komponenty grafu s cyklem
+        self._block_rank = {}        # block_id -> pořadí v topologickém uspořádání
+        self._staged_inputs = {}     # block_id -> [(input_name, hodnota)] v pořadí příchodu
+        self._staged_heap = []       # (pořadí, block_id) bloků s čekajícími vstupy
+        self._propagated = None      # bloky, které už v právě běžícím průchodu proběhly
+        self._next_pass = []         # bloky z cyklu, které dostaly hodnotu až po svém běhu
+        self._restoring = None       # (block_id, {výstup: hodnota}) během init + load_state, viz _init_block
+        self.propagation_passes = 0
+        self.propagation_staged = 0
+        self.propagation_invocations = 0
+        self.propagation_deferred = 0
+
+        # HTTP výstupy bloků se odesílají asynchronně, odpověď se vrátí do bloku přes on_http_response
+        http_output_config = http_output_config or {}
+        self.http_output = HttpOutputPool(workers=http_output_config.get('workers', 4),
+                                          per_block_limit=http_output_config.get('per_block_limit', 1),
+                                          timeout=http_output_config.get('timeout', 5),
+                                          on_response=self._on_http_response,
+                                          metrics=metrics)
+
+        # Předkompilovaný plán čtení hardwarových vstupů (viz _compile_scan_plan)
+        self._scan_plan = []         # [(bank_reader, [address, ...], [slot, ...])] po typech hardwaru
+        self._scan_last_values = []  # slot -> poslední známá hodnota
+        self._scan_handlers = []     # slot -> callable(value)
+        self._scan_slot_keys = []    # slot -> (block_id, input_name, typ, adresa)
+        self._run_handlers = []      # [(block_id, run)] jen bloky, které 'run' opravdu definují
+        self._analog_conditioners = [] # analogové vstupy s úpravou signálu, vzorkují se podle vlastní periody
+        self.hw_input_map = {}       # (input_type, address) -> [slot, ...] pro událostmi řízené vstupy
+        self._stop_requested = False
+        self._running = False
+
+        # Do Lua runtime vstupuje jen vlákno hlavní smyčky. Ostatní vlákna (MQTT, HTTP, hardware)
+        # jen zařazují události do fronty dispečera.
+        dispatcher_config = dispatcher_config or {}
+        self.dispatcher = LuaDispatcher(max_queue=dispatcher_config.get('max_queue', 1024),
+                                        policy=dispatcher_config.get('policy', 'drop_oldest'),
+                                        max_batch=dispatcher_config.get('max_batch', 64),
+                                        after_batch=self._end_batch)
+        if getattr(self.hardware_interface, 'supports_change_notification', False):
+            self.hardware_interface.add_input_listener(self._on_hardware_input_event)
+
         self.lua_runtime = lupa.LuaRuntime(unpack_returned_tuples=True)
 
         # Globálně zpřístupníme Python funkce, které budou Lua bloky volat.
@@ -26,14 +153,91 @@ class BlockManager:
         self.lua_runtime.globals().py_send_http_request = self._lua_send_http_request # Nová funkce
 
     def _lua_set_mqtt_output(self, block_id, output_name, value):
-        """Voláno z Lua. Publikuje zprávu na MQTT a aktualizuje interní cache."""
+        """
+        Voláno z Lua. Doručí hodnotu propojeným blokům a publikuje ji na MQTT (aktualizuje i cache).
+        Zásady publikace výstupu omezují jen publikaci; propojené bloky dostanou každou hodnotu hned.
+        """
+        restoring = self._restoring
+        if restoring is not None and restoring[0] == block_id:
+            restoring[1][output_name] = value # publikuje se až obnovená hodnota
+            return
         block_info = self.block_instances.get(block_id)
-        if block_info and output_name in block_info['outputs']:
-            topic = block_info['outputs'][output_name]
-            self.state_cache.set(topic, str(value))
-            self.mqtt_client.publish(topic, value)
-        else:
+        if not block_info or output_name not in block_info['outputs']:
             logger.warning(f"Lua block {block_id} tried to publish on unknown output '{output_name}'")
+            return
+        encoded = self._encode_output(block_id, output_name, value)
+        if encoded is None:
+            return
+        value, payload = encoded
+
+        policy = block_info['publish_policies'].get(output_name)
+        if policy is None:
+            self._publish_output(block_id, output_name, payload)
+        else:
+            now = time.monotonic()
+            decision = policy.offer(value, now)
+            if decision == PUBLISH:
+                policy.mark_published(value, now)
+                self._publish_output(block_id, output_name, payload)
+            elif decision == DEFER:
+                heapq.heappush(self._deferred_outputs, (policy.due, next(self._deferred_seq), block_id, output_name))
+        self._deliver_output(block_id, output_name, value)
+
+    def _encode_output(self, block_id, output_name, value):
+        """Vrátí (hodnota pro propojené bloky, payload pro MQTT), nebo None, pokud hodnota neodpovídá typu výstupu."""
+        encoder = self.block_instances[block_id]['encoders'].get(output_name)
+        if encoder is None:
+            return value, value
+        # Typovaný výstup: payload se naformátuje jednou, lokální příjemci dostanou nativní hodnotu
+        if encoder.type_name == 'json' and lupa.lua_type(value) == 'table':
+            value = self._lua_to_python(value)
+        try:
+            return encoder(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Block {block_id}: value {value!r} for output '{output_name}' is not {encoder.type_name}: {e}")
+            return None
+
+    def _publish_output(self, block_id, output_name, payload):
+        topic = self.block_instances[block_id]['outputs'][output_name]
+        self.state_cache.set(topic, str(payload))
+        if self.local_dispatch and self._echoes is not None and self.local_links.get((block_id, output_name)):
+            # Ozvěnu si poznamenáme ještě před publikací, broker může odpovědět dřív, než doručíme lokálně.
+            self._echoes.expect(topic, payload)
+        self.mqtt_client.publish(topic, payload)
+
+    def _deliver_output(self, block_id, output_name, value):
+        targets = self.local_links.get((block_id, output_name)) if self.local_dispatch else None
+        if not targets:
+            return
+        if self.ordered_propagation:
+            for target in targets:
+                self._stage_input(target['block_id'], target['input_name'], value)
+        else:
+            for target in targets:
+                self._call_lua_input_handler(target['block_id'], target['input_name'], value)
+
+    def _flush_deferred_outputs(self):
+        """Publikuje odložené hodnoty výstupů, jejichž okno (coalesce / min_interval) už uplynulo."""
+        now = time.monotonic()
+        while self._deferred_outputs and self._deferred_outputs[0][0] <= now:
+            _, _, block_id, output_name = heapq.heappop(self._deferred_outputs)
+            block_info = self.block_instances.get(block_id)
+            if block_info is None:
+                continue # blok byl mezitím odebrán (hot reload)
+            policy = block_info['publish_policies'].get(output_name)
+            if policy is None or policy.due is None or policy.due > now:
+                continue # záznam patří předchozí instanci bloku
+            ready, value = policy.take_pending()
+            if ready:
+                policy.mark_published(value, now)
+                # Propojené bloky hodnotu dostaly už při zápisu, tady jde jen o publikaci
+                self._publish_output(block_id, output_name, self._encode_output(block_id, output_name, value)[1])
+
+    def publish_stats(self):
+        """Počítadla zásad publikace: [(block_id, output_name, published, suppressed, coalesced)]."""
+        return [(block_id, output_name, policy.published, policy.suppressed, policy.coalesced)
+                for block_id, block_info in list(self.block_instances.items())
+                for output_name, policy in block_info['publish_policies'].items()]
 
     def _lua_get_hardware_input(self, block_id, input_type, pin_or_addr):
         """Voláno z Lua. Čte hodnotu z hardwarového rozhraní."""
@@ -48,132 +252,801 @@ class BlockManager:
     def _lua_set_hardware_output(self, block_id, output_type, pin_or_addr, value):
         """Voláno z Lua. Nastavuje hodnotu na hardwarovém rozhraní."""
         if output_type == "digital":
-            self.hardware_interface.write_digital_output(pin_or_addr, value)
+            # Zápis jde do stínového registru; smyčka ho odešle na konci cyklu spolu s ostatními.
+            self.hardware_interface.stage_digital_output(pin_or_addr, value)
         elif output_type == "dali_brightness":
             self.hardware_interface.set_dali_brightness(pin_or_addr, value)
         else:
             logger.warning(f"Lua block {block_id} requested unknown hardware output type: {output_type}")
     
     def _lua_send_http_request(self, block_id, method, url, payload):
-        """Voláno z Lua. Odešle HTTP požadavek."""
-        try:
-            method = method.upper()
-            headers = {'Content-Type': 'application/json'}
-
-            if method == 'POST':
-                response = requests.post(url, data=payload, headers=headers, timeout=5)
-            elif method == 'GET':
-                # GET požadavky obvykle nemají payload, ale některé API ho podporují
-                response = requests.get(url, data=payload, headers=headers, timeout=5)
-            else:
-                logger.warning(f"Unsupported HTTP method '{method}' for block {block_id}")
-                return
+        """Voláno z Lua. Zařadí HTTP požadavek k asynchronnímu odeslání a hned se vrátí."""
+        self.http_output.submit(block_id, method, url, payload)
+
+    def _on_http_response(self, block_id, status, body):
+        """Voláno z vlákna HTTP výstupu po dokončení požadavku. Výsledek předá bloku přes dispečera."""
+        self.dispatcher.submit(None, self._deliver_http_response, block_id, status, body)
 
-            response.raise_for_status() # Vyvolá chybu pro status kódy 4xx nebo 5xx
-            logger.info(f"HTTP request from block {block_id} to {url} successful.")
+    def _deliver_http_response(self, block_id, status, body):
+        block_instance = self.block_instances.get(block_id)
+        if block_instance and 'on_http_response' in block_instance['lua_module']:
+            try:
+                self._call_block(block_id, 'on_http_response', block_instance['lua_module'].on_http_response, status, body)
+            except Exception as e:
+                logger.error(f"Error calling on_http_response for block {block_id}: {e}")
+
+    def inject_input(self, block_id, input_name, value):
+        """Předá hodnotu vstupu bloku z libovolného vlákna (HTTP, MQTT). Blok ji zpracuje v hlavní smyčce."""
+        self.dispatcher.submit(('input', block_id, input_name), self._call_lua_input_handler, block_id, input_name, value)
+
+    def inject_inputs(self, items, reserved=False):
+        """
+        Zařadí dávku [(block_id, input_name, value)] jako jeden celek: bloky ji zpracují v jedné
+        dávce hlavní smyčky a výstupy se šíří a odesílají až po poslední položce.
+        Vrací False (a nezařadí nic), pokud ve frontě dispečera není místo pro celou dávku.
+        reserved=True: místo už vyhradil dispatcher.reserve() (dávka rozložená do shardů).
+        """
+        return self.dispatcher.submit_unit(self._process_input_batch, items, weight=max(1, len(items)), reserved=reserved)
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"HTTP request from block {block_id} to '{url}' failed: {e}")
+    def _process_input_batch(self, items):
+        for block_id, input_name, value in items:
+            self._call_lua_input_handler(block_id, input_name, value)
+
+    def _call_block(self, block_id, callback, func, *args):
+        """Zavolá Lua funkci bloku; se zapnutými metrikami změří dobu volání."""
+        metrics = self.metrics
+        if metrics is None:
+            return func(*args)
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            metrics.observe_block_call(block_id, callback, time.perf_counter() - start)
+
+    def _decode_input(self, block_id, block_instance, input_name, value):
+        """Převede hodnotu vstupu pro Lua. Vrací (True, hodnota), nebo (False, None), pokud se má zahodit."""
+        decoder = block_instance['decoders'].get(input_name)
+        if decoder is not None:
+            # Typovaný vstup (@blockinfo 'jméno:typ'): blok dostane rovnou nativní hodnotu
+            try:
+                value = decoder(value)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Block {block_id}: dropping value {value!r} for input '{input_name}', not {decoder.type_name}: {e}")
+                return False, None
+            if isinstance(value, (dict, list)):
+                value = self.lua_runtime.table_from(value, recursive=True)
+        elif isinstance(value, str):
+            if value.lower() == 'true': value = True
+            elif value.lower() == 'false': value = False
+        return True, value
 
     def _call_lua_input_handler(self, block_id, input_name, value):
         """Interní metoda pro bezpečné zavolání funkce 'on_input' v Lua modulu bloku."""
         block_instance = self.block_instances.get(block_id)
-        if block_instance and 'on_input' in block_instance['lua_module']:
-            try:
-                if isinstance(value, str):
-                    if value.lower() == 'true': value = True
-                    elif value.lower() == 'false': value = False
-                block_instance['lua_module'].on_input(input_name, value)
-            except Exception as e:
-                logger.error(f"Error calling on_input for block {block_id}, input {input_name}: {e}")
-
-    def load_blocks_from_config(self, config_data):
-        """Načte a inicializuje všechny bloky definované v konfiguračním objektu."""
-        # ... (Tato metoda zůstává beze změny) ...
-        for block_data in config_data.get("blocks", []):
-            block_id = block_data['id']
-            lua_script_file = block_data.get('lua_script')
-            
-            if not lua_script_file:
-                logger.warning(f"Block {block_id} has no 'lua_script' specified. Skipping.")
-                continue
+        if block_instance is None:
+            return
+        lua_module = block_instance['lua_module']
+        if 'on_input' not in lua_module:
+            if 'on_inputs' in lua_module:
+                self._call_lua_inputs_handler(block_id, {input_name: value})
+            return
+        ok, value = self._decode_input(block_id, block_instance, input_name, value)
+        if not ok:
+            return
+        try:
+            self._call_block(block_id, 'on_input', lua_module.on_input, input_name, value)
+        except Exception as e:
+            logger.error(f"Error calling on_input for block {block_id}, input {input_name}: {e}")
+
+    def _call_lua_inputs_handler(self, block_id, inputs):
+        """Zavolá volitelné 'on_inputs' bloku jednou se všemi změněnými vstupy (tabulka jméno -> hodnota)."""
+        block_instance = self.block_instances[block_id]
+        decoded = {}
+        for input_name, value in inputs.items():
+            ok, value = self._decode_input(block_id, block_instance, input_name, value)
+            if ok:
+                decoded[input_name] = value
+        if not decoded:
+            return
+        try:
+            self._call_block(block_id, 'on_inputs', block_instance['lua_module'].on_inputs, self.lua_runtime.table_from(decoded))
+        except Exception as e:
+            logger.error(f"Error calling on_inputs for block {block_id}, inputs {sorted(decoded)}: {e}")
+
+    # --- Uspořádané šíření hodnot grafem bloků ---
+
+    def _stage_input(self, block_id, input_name, value):
+        """Odloží hodnotu lokálního vstupu do konce dávky (všechny hodnoty, v pořadí příchodu)."""
+        self.propagation_staged += 1
+        pending = self._staged_inputs.get(block_id)
+        if pending is not None:
+            pending.append((input_name, value))
+            return
+        self._staged_inputs[block_id] = [(input_name, value)]
+        if self._propagated is not None and block_id in self._propagated:
+            # Zpětná hrana cyklu: blok už v tomto průchodu proběhl, hodnotu dostane v dalším
+            self._next_pass.append(block_id)
+        else:
+            heapq.heappush(self._staged_heap, (self._block_rank.get(block_id, 0), block_id))
+
+    def _propagate(self):
+        """
+        Jeden průchod: doručí odložené vstupy blokům v topologickém pořadí. Blok s 'on_inputs' ho dostane
+        jednou se všemi změněnými vstupy; změnil-li se některý vstup v dávce víckrát, následuje další
+        volání s jeho další hodnotou. Blok bez 'on_inputs' dostane každou hodnotu přes on_input.
+        """
+        if not self._staged_heap:
+            return
+        self.propagation_passes += 1
+        self._propagated = set()
+        try:
+            while self._staged_heap:
+                _, block_id = heapq.heappop(self._staged_heap)
+                inputs = self._staged_inputs.pop(block_id, None)
+                if inputs is None or block_id not in self.block_instances:
+                    continue
+                self._propagated.add(block_id)
+                if 'on_inputs' in self.block_instances[block_id]['lua_module']:
+                    changed = {}
+                    for input_name, value in inputs:
+                        if input_name in changed:
+                            self.propagation_invocations += 1
+                            self._call_lua_inputs_handler(block_id, changed)
+                            changed = {}
+                        changed[input_name] = value
+                    self.propagation_invocations += 1
+                    self._call_lua_inputs_handler(block_id, changed)
+                else:
+                    for input_name, value in inputs:
+                        self.propagation_invocations += 1
+                        self._call_lua_input_handler(block_id, input_name, value)
+        finally:
+            self._propagated = None
+            if self._next_pass:
+                self.propagation_deferred += len(self._next_pass)
+                for block_id in self._next_pass:
+                    heapq.heappush(self._staged_heap, (self._block_rank.get(block_id, 0), block_id))
+                self._next_pass = []
+                self.dispatcher.wake() # další průchod proběhne v příštím kole smyčky
+
+    def _end_batch(self):
+        """Konec dávky událostí: průchod grafem a odeslání stínového registru výstupů."""
+        self._propagate()
+        self.flush_hardware_outputs()
 
-            lua_path = os.path.join(self.lua_block_dir, lua_script_file)
-            if not os.path.exists(lua_path):
-                logger.error(f"Lua script '{lua_path}' for block {block_id} not found.")
+    def propagation_stats(self):
+        return {
+            "passes": self.propagation_passes,
+            "staged": self.propagation_staged,
+            "invocations": self.propagation_invocations,
+            "deferred": self.propagation_deferred,
+            "pending": len(self._staged_inputs),
+            "cycles": len(self.dataflow_cycles),
+        }
+
+    def _compile_dataflow(self):
+        """
+        Sestaví graf toku dat z hran source_block_id, najde cykly (silně souvislé komponenty,
+        Tarjanův algoritmus bez rekurze) a bloky topologicky seřadí. Bloky v cyklu dostanou
+        sousední pořadí; hodnoty po zpětné hraně cyklu se šíří až v dalším průchodu.
+        """
+        successors = {block_id: [] for block_id in self.block_instances}
+        for block_id, block_info in self.block_instances.items():
+            for input_info in block_info['inputs'].values():
+                source_id = input_info.get("source_block_id")
+                source = self.block_instances.get(source_id)
+                if source is not None and input_info.get("source_output") in source['outputs']:
+                    if block_id not in successors[source_id]:
+                        successors[source_id].append(block_id)
+
+        index_of, lowlink, on_stack, stack, components = {}, {}, set(), [], []
+        for root in successors:
+            if root in index_of:
                 continue
+            work = [(root, iter(successors[root]))]
+            index_of[root] = lowlink[root] = len(index_of)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                for child in children:
+                    if child not in index_of:
+                        index_of[child] = lowlink[child] = len(index_of)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(successors[child])))
+                        break
+                    if child in on_stack:
+                        lowlink[node] = min(lowlink[node], index_of[child])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index_of[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        components.append(component)
+
+        # Tarjan vydává komponenty v obráceném topologickém pořadí
+        order = list(self.block_instances)
+        position = {block_id: index for index, block_id in enumerate(order)}
+        self._block_rank = {}
+        cycles = []
+        for component in reversed(components):
+            component.sort(key=position.get)
+            if len(component) > 1 or component[0] in successors[component[0]]:
+                cycles.append(component)
+            for block_id in component:
+                self._block_rank[block_id] = len(self._block_rank)
+
+        if cycles and cycles != self.dataflow_cycles:
+            for cycle in cycles:
+                logger.warning(f"Dataflow cycle between blocks {', '.join(cycle)}: "
+                               f"values on the cycle propagate one step per event batch")
+        self.dataflow_cycles = cycles
+
+    def load_blocks_from_config(self, config_data, block_states=None):
+        """
+        Načte a inicializuje všechny bloky definované v konfiguračním objektu.
+        block_states ({block_id: stav}, např. ze snímku) se po init předají blokům, které definují load_state.
+        """
+        block_states = block_states or {}
+        created = self._create_blocks(config_data.get("blocks", []))
+        self._compile_dataflow()
+        for block_id in created:
+            self._init_block(block_id, block_states.get(block_id))
+        self._compile_scan_plan()
+        # Výstupy publikované v init dostanou lokální příjemci hned (ne až v první dávce)
+        self._propagate()
+
+    def _create_blocks(self, blocks):
+        """Vytvoří instance bloků (bez volání init). Vrací seznam ID úspěšně vytvořených bloků."""
+        created = []
+        for block_data in blocks:
+            block_instance = self._build_block(block_data)
+            if block_instance is not None:
+                self.block_instances[block_data['id']] = block_instance
+                created.append(block_data['id'])
+        return created
+
+    def _build_block(self, block_data):
+        """Zkompiluje skript a vytvoří instanci bloku, zatím bez registrace a init. Při chybě vrací None."""
+        block_id = block_data['id']
+        lua_script_file = block_data.get('lua_script')
+
+        if not lua_script_file:
+            logger.warning(f"Block {block_id} has no 'lua_script' specified. Skipping.")
+            return None
+
+        lua_path = os.path.join(self.lua_block_dir, lua_script_file)
+        if not os.path.exists(lua_path):
+            logger.error(f"Lua script '{lua_path}' for block {block_id} not found.")
+            return None
+
+        try:
+            lua_module = self._instantiate_block(lua_path)
+            input_types, output_types = self._chunk_cache[lua_path][2]
+
+            if lua_module is None:
+                logger.error(f"Lua script '{lua_script_file}' for block '{block_id}' did not return a module table. Make sure the script ends with 'return M'.")
+                return None
+
+            return {
+                'lua_module': lua_module,
+                'config': block_data.get('config', {}),
+                'inputs': block_data.get('inputs', {}),
+                'outputs': block_data.get('outputs', {}),
+                'publish_policies': parse_publish_policies(block_id, block_data.get('config', {}), block_data.get('outputs', {})),
+                # Předkompilované převody hodnot pro typované vstupy a výstupy (viz value_codec.py)
+                'decoders': build_decoders(input_types),
+                'encoders': build_encoders(output_types),
+                # Pro hot reload: původní definice a verze skriptu, ze které blok vznikl
+                'definition': block_data,
+                'script_signature': self._chunk_cache[lua_path][0],
+            }
+        except Exception as e:
+            logger.error(f"Error executing Lua script for block {block_id}: {e}", exc_info=True)
+            return None
+
+    def _init_block(self, block_id, saved_state=None):
+        """
+        Zavolá init bloku (a případně load_state s uloženým stavem) a propojí jeho vstupy se zdrojovými bloky.
+        Vrací False, když init selhal (blok pak zůstane nepropojený).
+        """
+        block_info = self.block_instances[block_id]
+        # Při obnově stavu by init nejdřív publikoval výchozí hodnoty a load_state pak obnovené
+        # (výstupy by překmitly). Publikace z obou se proto podrží a každý výstup se odešle jednou.
+        restoring = saved_state is not None and 'load_state' in block_info['lua_module']
+        if restoring:
+            self._restoring = (block_id, {})
+        try:
+            if 'init' in block_info['lua_module']:
+                self._call_block(block_id, 'init', block_info['lua_module'].init,
+                                 block_id, block_info['config'], block_info['inputs'], block_info['outputs'])
+            if saved_state is not None:
+                self._load_block_state(block_id, saved_state)
             
-            try:
-                with open(lua_path, 'r', encoding='utf-8') as f:
-                    lua_code = f.read()
+            logger.info(f"Loaded and initialized Lua block '{block_id}'")
+            self._wire_block(block_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error initializing Lua block {block_id}: {e}", exc_info=True)
+            return False
+        finally:
+            if restoring:
+                _, outputs = self._restoring
+                self._restoring = None
+                for output_name, value in outputs.items():
+                    self._lua_set_mqtt_output(block_id, output_name, value)
 
-                lua_module = self.lua_runtime.execute(lua_code)
-                
-                if lua_module is None:
-                    logger.error(f"Lua script '{lua_script_file}' for block '{block_id}' did not return a module table. Make sure the script ends with 'return M'.")
-                    continue
+    # --- Ukládání stavu bloků (volitelné M.save_state / M.load_state) ---
+    # Blok, jehož stav má přežít restart (snímek, viz snapshot.py) i hot reload, definuje
+    # M.save_state() vracející tabulku prostých hodnot a M.load_state(state), které se zavolá
+    # po init s dříve uloženou tabulkou; výstupy publikované z obou se odešlou jednou (viz _init_block).
 
-                self.block_instances[block_id] = {
-                    'lua_module': lua_module,
-                    'config': block_data.get('config', {}),
-                    'inputs': block_data.get('inputs', {}),
-                    'outputs': block_data.get('outputs', {})
-                }
-            except Exception as e:
-                logger.error(f"Error executing Lua script for block {block_id}: {e}", exc_info=True)
+    def save_block_states(self):
+        """
+        Vrátí {block_id: stav} pro bloky, které definují save_state (stav převedený na Python hodnoty).
+        Volá Lua, smí tedy běžet jen ve vlákně dispečera nebo když hlavní smyčka neběží.
+        """
+        states = {}
+        for block_id in self.block_instances:
+            state = self._save_block_state(block_id)
+            if state is not None:
+                states[block_id] = state
+        return states
+
+    def collect_block_states(self, timeout=5):
+        """save_block_states volatelné z libovolného vlákna (během run_forever přes dispečera)."""
+        if self._running:
+            return self.dispatcher.call(self.save_block_states, timeout=timeout)
+        return self.save_block_states()
+
+    def _save_block_state(self, block_id):
+        lua_module = self.block_instances[block_id]['lua_module']
+        if 'save_state' not in lua_module:
+            return None
+        try:
+            return self._lua_to_python(lua_module.save_state())
+        except Exception as e:
+            logger.error(f"Error calling save_state for block {block_id}: {e}")
+            return None
+
+    def _load_block_state(self, block_id, state):
+        lua_module = self.block_instances[block_id]['lua_module']
+        if 'load_state' not in lua_module:
+            return
+        try:
+            value = self.lua_runtime.table_from(state, recursive=True) if isinstance(state, (dict, list)) else state
+            lua_module.load_state(value)
+            logger.info(f"Restored saved state of block '{block_id}'")
+        except Exception as e:
+            logger.error(f"Error calling load_state for block {block_id}: {e}")
+
+    def _lua_to_python(self, value):
+        """Převede hodnotu z Lua (i vnořené tabulky) na Python: tabulka 1..n -> list, jinak dict."""
+        if lupa.lua_type(value) != 'table':
+            return value
+        items = list(value.items())
+        if all(key == index for index, (key, _) in enumerate(items, 1)):
+            return [self._lua_to_python(item) for _, item in items]
+        return {key: self._lua_to_python(item) for key, item in items}
+
+    def _wire_block(self, block_id):
+        """Zaregistruje odběry a lokální propojení pro vstupy bloku, které mají source_block_id."""
+        for input_name, input_info in self.block_instances[block_id]['inputs'].items():
+            if "source_block_id" in input_info:
+                source_block = self.block_instances.get(input_info["source_block_id"])
+                if source_block and input_info["source_output"] in source_block['outputs']:
+                    topic = source_block['outputs'][input_info["source_output"]]
+                    # Odběr zůstává i při lokálním doručování, aby blok viděl i zprávy od jiných klientů.
+                    self.mqtt_client.subscribe(topic, self._handle_mqtt_message_for_block)
+
+                    link_key = (input_info["source_block_id"], input_info["source_output"])
+                    self.local_links.setdefault(link_key, []).append({'block_id': block_id, 'input_name': input_name})
+                    
+                    if topic not in self.topic_map: self.topic_map[topic] = []
+                    self.topic_map[topic].append({'block_id': block_id, 'input_name': input_name})
+                else:
+                    logger.warning(f"Input '{input_name}' for block {block_id} refers to non-existent source.")
+
+    def _unwire_block(self, block_id):
+        """Zruší odběry a lokální propojení, ve kterých je blok příjemcem. Prázdná témata se odhlásí."""
+        for topic in list(self.topic_map):
+            targets = [t for t in self.topic_map[topic] if t['block_id'] != block_id]
+            if targets:
+                self.topic_map[topic] = targets
+            else:
+                del self.topic_map[topic]
+                self.mqtt_client.unsubscribe(topic, self._handle_mqtt_message_for_block)
+
+        for link_key in list(self.local_links):
+            targets = [t for t in self.local_links[link_key] if t['block_id'] != block_id]
+            if targets:
+                self.local_links[link_key] = targets
+            else:
+                del self.local_links[link_key]
+
+    def _load_chunk(self, lua_path):
+        """
+        Vrátí zkompilovaný chunk Lua skriptu. Každý soubor se parsuje a kompiluje jen jednou;
+        znovu až tehdy, když se změní jeho mtime nebo velikost.
+        """
+        stat = os.stat(lua_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._chunk_cache.get(lua_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(lua_path, 'r', encoding='utf-8') as f:
+            lua_code = f.read()
+        chunk = self.lua_runtime.compile(lua_code)
+        info = self.definitions.script_info(lua_path, signature, lua_code) or {}
+        self._chunk_cache[lua_path] = (signature, chunk, (info.get('input_types', {}), info.get('output_types', {})))
+        return chunk
+
+    def _instantiate_block(self, lua_path):
+        """
+        Vytvoří novou instanci bloku zavoláním zkompilovaného chunku (chunk je továrna).
+        Každé volání vytvoří nové lokální proměnné skriptu i novou tabulku M, takže
+        stav instancí stejného skriptu zůstává oddělený, i když se kód kompiluje jen jednou.
+        """
+        return self._load_chunk(lua_path)()
+
+    def unload_block(self, block_id):
+        """Odebere blok z běžícího systému včetně jeho odběrů a lokálních propojení."""
+        if not self._remove_block(block_id):
+            return False
+        self._compile_dataflow()
+        self._compile_scan_plan()
+        return True
+
+    def _remove_block(self, block_id):
+        if self.block_instances.pop(block_id, None) is None:
+            return False
+
+        self._unwire_block(block_id)
+        # Propojení, kde byl blok zdrojem, už nemají kdo plnit
+        for link_key in [key for key in self.local_links if key[0] == block_id]:
+            del self.local_links[link_key]
+
+        logger.info(f"Unloaded Lua block '{block_id}'")
+        return True
+
+    def apply_config(self, config_data):
+        """
+        Přírůstkově přejde na novou konfiguraci bez restartu. Znovu vytvoří jen přidané,
+        odebrané a změněné bloky (změněná definice nebo Lua skript); ostatní si ponechají
+        svůj stav v Lua. Bloky, jejichž zdroj se změnil, se jen znovu propojí.
+        Změněný blok, jehož nový skript nejde zkompilovat nebo inicializovat, běží dál
+        v původní instanci a objeví se ve zprávě jako 'failed' (další reload ho zkusí znovu).
+        Musí běžet ve vlákně dispečera (viz reload_config). Vrací zprávu o změnách.
+        """
+        start = time.perf_counter()
+        new_blocks = {block['id']: block for block in config_data.get("blocks", []) if 'id' in block}
+
+        removed = [block_id for block_id in self.block_instances if block_id not in new_blocks]
+        added = [block_id for block_id in new_blocks if block_id not in self.block_instances]
+        changed = [block_id for block_id in new_blocks
+                   if block_id in self.block_instances and self._block_changed(block_id, new_blocks[block_id])]
+
+        # Nové instance se připraví dřív, než se cokoli odebere: blok, jehož skript nejde
+        # zkompilovat, zůstane v původní instanci (předchozí chunk zůstává v cache)
+        prepared = {}
+        for block_id in added + changed:
+            block_instance = self._build_block(new_blocks[block_id])
+            if block_instance is not None:
+                prepared[block_id] = block_instance
+        failed = [block_id for block_id in added + changed if block_id not in prepared]
+        added = [block_id for block_id in added if block_id in prepared]
+        changed = [block_id for block_id in changed if block_id in prepared]
+        replaced = set(removed) | set(changed)
+
+        # Nezměněné bloky, které berou vstup z některého vyměněného bloku, je potřeba znovu propojit
+        rewired = [block_id for block_id, block_info in self.block_instances.items()
+                   if block_id not in replaced and
+                   any(info.get("source_block_id") in replaced or info.get("source_block_id") in added
+                       for info in block_info['inputs'].values())]
+
+        # Změněné bloky si přes save_state/load_state přenesou stav do nové instance
+        saved_states = {block_id: self._save_block_state(block_id) for block_id in changed}
+        previous = {block_id: self.block_instances[block_id] for block_id in changed}
+        for block_id in removed + changed:
+            self._remove_block(block_id)
+        for block_id in rewired:
+            self._unwire_block(block_id)
+
+        self.block_instances.update(prepared)
+        self._compile_dataflow()
+        init_failed = [block_id for block_id in prepared if not self._init_block(block_id, saved_states.get(block_id))]
+        if init_failed:
+            # Init nové instance selhal: přidaný blok se zahodí, změněný se vrátí k původní instanci
+            for block_id in init_failed:
+                self._remove_block(block_id)
+            for block_id in init_failed:
+                if block_id in previous:
+                    self.block_instances[block_id] = previous[block_id]
+                    self._wire_block(block_id)
+            # Příjemci, které init mezitím napojil na zahozenou instanci, přišli o lokální propojení
+            for block_id, block_info in self.block_instances.items():
+                if block_id not in rewired and block_id not in init_failed and \
+                        any(info.get("source_block_id") in init_failed for info in block_info['inputs'].values()):
+                    self._unwire_block(block_id)
+                    self._wire_block(block_id)
+            self._compile_dataflow()
+            failed += init_failed
+        for block_id in rewired:
+            self._wire_block(block_id)
+        self._compile_scan_plan()
+        self._propagate()
+        # Nové hardwarové vstupy dostanou počáteční stav (nezměněné sloty si hodnotu ponechaly)
+        self._poll_hardware_inputs()
+
+        report = {
+            "added": [block_id for block_id in added if block_id not in failed],
+            "removed": removed,
+            "changed": [block_id for block_id in changed if block_id not in failed],
+            "rewired": rewired,
+            "failed": failed,
+            "unchanged": len(self.block_instances.keys() - set(added) - set(changed) - set(failed)),
+            "duration_ms": (time.perf_counter() - start) * 1000,
+        }
+        self.last_reload_report = report
+        logger.info(f"Configuration reloaded in {report['duration_ms']:.1f} ms: "
+                    f"added {report['added']}, removed {removed}, changed {report['changed']}, rewired {rewired}")
+        if failed:
+            logger.error(f"Blocks {failed} failed to load; changed blocks keep running their previous instance")
+        return report
+
+    def _block_changed(self, block_id, block_data):
+        block_info = self.block_instances[block_id]
+        if block_info['definition'] != block_data:
+            return True
+        lua_path = os.path.join(self.lua_block_dir, block_data.get('lua_script', ''))
+        try:
+            stat = os.stat(lua_path)
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) != block_info['script_signature']
+
+    def reload_config(self, config_data, timeout=30):
+        """Provede apply_config ve vlákně dispečera (lze volat z libovolného vlákna) a vrátí zprávu."""
+        return self.dispatcher.call(self.apply_config, config_data, timeout=timeout)
+
+    def _compile_scan_plan(self):
+        """
+        Připraví ploché pole vstupů ke čtení, aby smyčka nemusela při každém průchodu
+        procházet slovníky konfigurace všech bloků. Každý hardwarový vstup dostane 'slot'
+        (index do pole posledních hodnot a handlerů).
+        """
+        readers = {
+            "digital": self._read_digital_bank,
+            "analog": self._read_analog_bank,
+        }
+        grouped = {} # input_type -> ([address, ...], [slot, ...])
+        conditioned = [] # [(slot, adresa, nastavení)] analogové vstupy s úpravou signálu
+        # Poslední hodnoty se při přestavbě plánu (hot reload) přenesou, aby nezměněné bloky nedostaly falešnou změnu
+        previous_values = dict(zip(self._scan_slot_keys, self._scan_last_values))
+        self._scan_handlers = []
+        self._scan_slot_keys = []
+        self.hw_input_map = {}
 
         for block_id, block_info in self.block_instances.items():
+            for input_name, input_def in block_info['inputs'].items():
+                if "hardware_input" not in input_def:
+                    continue
+                hw_type = input_def["hardware_input"]["type"]
+                hw_address = input_def["hardware_input"]["address"]
+                if hw_type not in readers:
+                    logger.warning(f"Block {block_id} requested unknown hardware input type: {hw_type}")
+                    continue
+
+                slot = len(self._scan_handlers)
+                self._scan_slot_keys.append((block_id, input_name, hw_type, hw_address))
+                self._scan_handlers.append(self._make_hardware_input_handler(block_id, input_name, block_info['lua_module']))
+                if hw_type == "analog":
+                    spec = parse_conditioning(block_id, input_name, input_def["hardware_input"])
+                    if spec is not None:
+                        # Čte se podle sample_interval, ne při každém dotazování ani při hlášení změny z hardwaru
+                        conditioned.append((slot, hw_address, spec))
+                        continue
+                addresses, slots = grouped.setdefault(hw_type, ([], []))
+                addresses.append(hw_address)
+                slots.append(slot)
+                self.hw_input_map.setdefault((hw_type, hw_address), []).append(slot)
+
+        self._scan_last_values = [previous_values.get(key, _UNSET) for key in self._scan_slot_keys]
+        self._analog_conditioners = []
+        if conditioned:
+            initial_values = {slot: self._scan_last_values[slot] for slot, _, _ in conditioned
+                              if self._scan_last_values[slot] is not _UNSET}
             try:
-                if 'init' in block_info['lua_module']:
-                    block_info['lua_module'].init(block_id, block_info['config'], block_info['inputs'], block_info['outputs'])
-                
-                logger.info(f"Loaded and initialized Lua block '{block_id}'")
-
-                for input_name, input_info in block_info['inputs'].items():
-                    if "source_block_id" in input_info:
-                        source_block = self.block_instances.get(input_info["source_block_id"])
-                        if source_block and input_info["source_output"] in source_block['outputs']:
-                            topic = source_block['outputs'][input_info["source_output"]]
-                            self.mqtt_client.subscribe(topic, self._handle_mqtt_message_for_block)
-                            
-                            if topic not in self.topic_map: self.topic_map[topic] = []
-                            self.topic_map[topic].append({'block_id': block_id, 'input_name': input_name})
-                        else:
-                            logger.warning(f"Input '{input_name}' for block {block_id} refers to non-existent source.")
-            
-            except Exception as e:
-                logger.error(f"Error initializing Lua block {block_id}: {e}", exc_info=True)
+                self._analog_conditioners = build_conditioners(conditioned, initial_values)
+            except RuntimeError as e:
+                logger.error(f"Analog signal conditioning disabled: {e}")
+                for slot, hw_address, _ in conditioned:
+                    addresses, slots = grouped.setdefault("analog", ([], []))
+                    addresses.append(hw_address)
+                    slots.append(slot)
+                    self.hw_input_map.setdefault(("analog", hw_address), []).append(slot)
+        self._scan_plan = [(readers[hw_type], addresses, slots) for hw_type, (addresses, slots) in grouped.items()]
+        self._run_handlers = [(block_id, block_info['lua_module'].run)
+                              for block_id, block_info in self.block_instances.items()
+                              if 'run' in block_info['lua_module']]
+
+    def _read_digital_bank(self, addresses):
+        """Přečte všechny digitální vstupy jednou transakcí a rozdělí masku na jednotlivé piny."""
+        hw = self.hardware_interface
+        if not hasattr(hw, 'read_digital_inputs'):
+            return [hw.read_digital_input(address) for address in addresses]
+        mask = hw.read_digital_inputs()
+        return [bool((mask >> address) & 1) for address in addresses]
+
+    def _read_analog_bank(self, addresses):
+        hw = self.hardware_interface
+        if not hasattr(hw, 'read_analog_inputs'):
+            return [hw.read_analog_input(address) for address in addresses]
+        return hw.read_analog_inputs(addresses)
+
+    def _make_hardware_input_handler(self, block_id, input_name, lua_module):
+        if 'on_hardware_input_change' in lua_module:
+            on_change = lua_module.on_hardware_input_change
+            def handler(value):
+                try:
+                    self._call_block(block_id, 'on_hardware_input_change', on_change, input_name, value)
+                except Exception as e:
+                    logger.error(f"Error calling on_hardware_input_change for block {block_id}, input {input_name}: {e}")
+        else:
+            def handler(value):
+                self._call_lua_input_handler(block_id, input_name, value)
+        return handler
 
     def _handle_mqtt_message_for_block(self, topic, payload):
         """Callback pro MQTT. Najde správný blok a předá mu zprávu."""
+        if self.local_dispatch and self._echoes is not None and self._echoes.consume(topic, payload):
+            return
         if topic in self.topic_map:
             for target in self.topic_map[topic]:
-                self._call_lua_input_handler(target['block_id'], target['input_name'], payload)
+                self.inject_input(target['block_id'], target['input_name'], payload)
+
+    def _on_hardware_input_event(self, input_type, pin, value):
+        """Voláno hardwarovým rozhraním (z libovolného vlákna). Jen zařadí změnu do fronty a probudí smyčku."""
+        # Hrany se neslučují (klíč None), jinak by se krátký stisk tlačítka mohl ztratit
+        self.dispatcher.submit(None, self._deliver_hardware_event, input_type, pin, value)
+
+    def _deliver_hardware_event(self, input_type, pin, value):
+        for slot in self.hw_input_map.get((input_type, pin), ()):
+            self._deliver_hardware_input(slot, value)
+
+    def _deliver_hardware_input(self, slot, current_value):
+        """Předá změnu hardwarového vstupu bloku, pokud se hodnota opravdu změnila."""
+        if current_value == self._scan_last_values[slot]:
+            return
+        self._scan_last_values[slot] = current_value
+        self._scan_handlers[slot](current_value)
+
+    def process_events(self, timeout=None):
+        """
+        Počká na události (nejdéle `timeout` sekund, None = bez omezení) a zpracuje jednu dávku
+        ve vlákně volajícího, který se tím stává jediným uživatelem Lua runtime. Vrací počet událostí.
+        """
+        processed = self.dispatcher.process(timeout)
+        if self._deferred_outputs:
+            self._flush_deferred_outputs()
+        return processed
+
+    def _poll_hardware_inputs(self):
+        """Záložní dotazování vstupů pro hardware, který neumí hlásit změny."""
+        last_values = self._scan_last_values
+        handlers = self._scan_handlers
+        for bank_reader, addresses, slots in self._scan_plan:
+            for current_value, slot in zip(bank_reader(addresses), slots):
+                if current_value is not None and current_value != last_values[slot]:
+                    last_values[slot] = current_value
+                    handlers[slot](current_value)
+        if self._analog_conditioners:
+            self._sample_conditioned_inputs(time.monotonic())
+
+    def _sample_conditioned_inputs(self, now):
+        """Přečte skupiny analogových vstupů s úpravou signálu, kterým uplynula perioda, a nahlásí změny."""
+        for conditioner in self._analog_conditioners:
+            if now < conditioner.next_due:
+                continue
+            conditioner.next_due += conditioner.sample_interval
+            if conditioner.next_due <= now:
+                conditioner.next_due = now + conditioner.sample_interval # nestíháme, periodu posuneme
+            indexes, values = conditioner.update(self._read_analog_bank(conditioner.addresses), now)
+            for index, value in zip(indexes, values):
+                self._deliver_hardware_input(conditioner.slots[index], to_python_number(value))
+
+    def conditioning_stats(self):
+        return {
+            "channels": sum(len(conditioner.slots) for conditioner in self._analog_conditioners),
+            "samples": sum(conditioner.samples * len(conditioner.slots) for conditioner in self._analog_conditioners),
+            "reports": sum(conditioner.reports for conditioner in self._analog_conditioners),
+        }
+
+    def _run_blocks(self):
+        for block_id, run in self._run_handlers:
+            try:
+                self._call_block(block_id, 'run', run)
+            except Exception as e:
+                logger.error(f"Error calling run for block {block_id}: {e}")
+
+    def flush_hardware_outputs(self):
+        """Odešle stínový registr výstupů na hardware (jednou za cyklus plánovače)."""
+        flush = getattr(self.hardware_interface, 'flush_outputs', None)
+        if flush is not None:
+            flush()
 
     def process_block_logic(self):
-        """Hlavní logická smyčka, volaná periodicky."""
-        # ... (Tato metoda zůstává beze změny) ...
-        for block_id, block_info in self.block_instances.items():
-            for input_name, input_def in block_info['inputs'].items():
-                if "hardware_input" in input_def:
-                    hw_type = input_def["hardware_input"]["type"]
-                    hw_pin_or_addr = input_def["hardware_input"]["address"]
-                    
-                    current_value = self._lua_get_hardware_input(block_id, hw_type, hw_pin_or_addr)
-                    
-                    if current_value is not None:
-                        state_key = (block_id, input_name)
-                        last_value = self.last_hw_states.get(state_key)
-                        
-                        if current_value != last_value:
-                            self.last_hw_states[state_key] = current_value
-                            if 'on_hardware_input_change' in block_info['lua_module']:
-                                block_info['lua_module'].on_hardware_input_change(input_name, current_value)
-                            else:
-                                self._call_lua_input_handler(block_id, input_name, current_value)
-
-            if 'run' in block_info['lua_module']:
-                try:
-                    block_info['lua_module'].run()
-                except Exception as e:
-                    logger.error(f"Error calling run for block {block_id}: {e}")
\ No newline at end of file
+        """Jeden průchod dotazovací smyčkou: přečte všechny vstupy, zavolá 'run' u bloků a odešle výstupy."""
+        self._poll_hardware_inputs()
+        self._run_blocks()
+        self._end_batch()
+
+    def run_forever(self, poll_interval=0.1):
+        """
+        Hlavní smyčka řízená událostmi. Změny vstupů zpracuje okamžitě a v klidu blokuje.
+        Periodicky (po `poll_interval`) se budí jen tehdy, když hardware neumí hlásit změny
+        nebo když některý blok definuje funkci 'run'.
+        """
+        self._stop_requested = False
+        notifies = getattr(self.hardware_interface, 'supports_change_notification', False)
+        next_tick = time.monotonic()
+
+        if notifies:
+            # Počáteční stav vstupů (změny před registrací posluchače bychom jinak neviděli)
+            self._poll_hardware_inputs()
+
+        self._running = True
+        try:
+            while not self._stop_requested:
+                # Přepočítává se v každém průchodu, hot reload mohl přidat nebo odebrat bloky s 'run'
+                needs_tick = not notifies or bool(self._run_handlers)
+                timeout = max(0.0, next_tick - time.monotonic()) if needs_tick else None
+                if self._deferred_outputs:
+                    # Probudíme se i kvůli nejbližší odložené publikaci výstupu
+                    deferred_timeout = max(0.0, self._deferred_outputs[0][0] - time.monotonic())
+                    timeout = deferred_timeout if timeout is None else min(timeout, deferred_timeout)
+                if self._analog_conditioners:
+                    # ... i kvůli vzorkování analogových vstupů s úpravou signálu
+                    sample_timeout = max(0.0, min(c.next_due for c in self._analog_conditioners) - time.monotonic())
+                    timeout = sample_timeout if timeout is None else min(timeout, sample_timeout)
+                self.process_events(timeout)
+
+                now = time.monotonic()
+                if self._analog_conditioners:
+                    self._sample_conditioned_inputs(now)
+                if needs_tick and now >= next_tick:
+                    if not notifies:
+                        self._poll_hardware_inputs()
+                    self._run_blocks()
+                    next_tick += poll_interval
+                    finished = time.monotonic()
+                    overrun = next_tick < finished
+                    if overrun:
+                        next_tick = finished + poll_interval
+                    if self.metrics is not None:
+                        self.metrics.observe_tick(finished - now, overrun)
+
+                # Hodnoty z ticku a z odložených publikací projdou grafem, pak se odešlou výstupy
+                self._end_batch()
+        finally:
+            self._running = False
+
+    def stop(self):
+        """Ukončí run_forever (lze volat z jiného vlákna)."""
+        self._stop_requested = True
+        self.dispatcher.wake()
+
+    def shutdown(self):
+        """Uvolní prostředky správce (vlákna HTTP výstupů). Volá se při ukončení aplikace."""
+        self.stop()
+        self.http_output.stop()
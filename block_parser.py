@@ -1,50 +1,159 @@
 # FILE: block_parser.py
+import gzip
+import hashlib
+import json
 import os
 import re
+import threading
+
+from value_codec import parse_typed_names
 
 def parse_lua_block_info(file_path):
     """ Přečte a naparsuje speciální @blockinfo komentář z Lua souboru. """
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
-
-        match = re.search(r'--\[\[\s*@blockinfo(.*?)@endblockinfo\s*\]\]--', content, re.DOTALL)
-        if not match:
-            return None
-
-        info_str = match.group(1)
-        info = {'inputs': [], 'outputs': [], 'fields': []}
-        
-        for line in info_str.strip().split('\n'):
-            if '=' in line:
-                key, value = [p.strip() for p in line.split('=', 1)]
-                if key in ['inputs', 'outputs']:
-                    if value: info[key] = [v.strip() for v in value.split(',')]
-                else:
-                    info[key] = value
-
-            elif line.strip().startswith((' ' * 4)): # Detekce pole
-                parts = [p.strip() for p in line.strip().split(';')]
-                if len(parts) >= 3:
-                    field = {'name': parts[0], 'label': parts[1], 'type': parts[2]}
-                    if len(parts) > 3: field['placeholder'] = parts[3]
-                    info['fields'].append(field)
-        
-        return info
+        return parse_block_info_source(content)
 
     except Exception:
         return None
 
+def parse_block_info_source(content):
+    """
+    Naparsuje @blockinfo ze zdrojového kódu bloku. Vstupy a výstupy mohou mít typ ('teplota:float');
+    'inputs'/'outputs' pak obsahují jen jména a typy jsou v 'input_types'/'output_types'.
+    """
+    match = re.search(r'--\[\[\s*@blockinfo(.*?)@endblockinfo\s*\]\]--', content, re.DOTALL)
+    if not match:
+        return None
+
+    info_str = match.group(1)
+    info = {'inputs': [], 'outputs': [], 'fields': [], 'input_types': {}, 'output_types': {}}
+
+    for line in info_str.strip().split('\n'):
+        if '=' in line:
+            key, value = [p.strip() for p in line.split('=', 1)]
+            if key in ['inputs', 'outputs']:
+                if value:
+                    info[key], info[key[:-1] + '_types'] = parse_typed_names(value.split(','))
+            else:
+                info[key] = value
+
+        elif line.strip().startswith((' ' * 4)): # Detekce pole
+            parts = [p.strip() for p in line.strip().split(';')]
+            if len(parts) >= 3:
+                field = {'name': parts[0], 'label': parts[1], 'type': parts[2]}
+                if len(parts) > 3: field['placeholder'] = parts[3]
+                info['fields'].append(field)
+
+    return info
+
+def _type_name(filename):
+    # Interní jméno typu bloku odvodíme od názvu souboru bez "_block"
+    block_name = filename.replace('.lua', '')
+    return ''.join(word.capitalize() for word in block_name.replace('_block','').split('_'))
+
 def get_all_block_definitions(lua_dir):
     """ Projde složku a vytvoří slovník definic pro všechny platné Lua bloky. """
     definitions = {}
     for filename in os.listdir(lua_dir):
         if filename.endswith('.lua'):
-            block_name = filename.replace('.lua', '')
             info = parse_lua_block_info(os.path.join(lua_dir, filename))
             if info:
-                # Interní jméno typu bloku odvodíme od názvu souboru bez "_block"
-                type_name = ''.join(word.capitalize() for word in block_name.replace('_block','').split('_'))
                 info['lua'] = filename
-                definitions[type_name] = info
-    return definitions
\ No newline at end of file
+                definitions[_type_name(filename)] = info
+    return definitions
+
+class BlockDefinitionRegistry:
+    """
+    Definice bloků (@blockinfo) ze složky Lua skriptů, sdílené webovým serverem a BlockManagerem.
+
+    Každý soubor se parsuje jen tehdy, když se změní jeho mtime nebo velikost; při dotazu se složka
+    jen projde přes os.scandir. Z definic se předem připraví JSON tělo odpovědi, jeho ETag
+    a gzip varianta, takže /api/block-definitions nemusí nic serializovat a na If-None-Match
+    odpovídá 304.
+    """
+    def __init__(self, lua_dir):
+        self.lua_dir = os.path.abspath(lua_dir)
+        self.parses = 0 # kolikrát se opravdu parsoval soubor (pro měření)
+
+        self._lock = threading.Lock()
+        self._files = {} # absolutní cesta -> ((mtime_ns, size), info nebo None)
+        self._dirty = True
+        self._definitions = {}
+        self._body = b"{}"
+        self._gzip_body = None
+        self._etag = None
+
+    def _info(self, path, signature, source=None):
+        """Vrátí naparsované info souboru, parsuje jen při změně signatury (volá se pod zámkem)."""
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        info = parse_block_info_source(source) if source is not None else parse_lua_block_info(path)
+        self._files[path] = (signature, info)
+        self.parses += 1
+        self._dirty = True
+        return info
+
+    def script_info(self, lua_path, signature=None, source=None):
+        """
+        Info jednoho skriptu pro BlockManager. Ten už soubor čte kvůli kompilaci, může tedy předat
+        signaturu (mtime_ns, size) i zdrojový kód, aby se soubor nečetl podruhé.
+        """
+        path = os.path.abspath(lua_path)
+        if signature is None:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            return self._info(path, signature, source)
+
+    def refresh(self):
+        """Projde složku a přeparsuje jen změněné soubory. Při změně znovu sestaví JSON tělo a ETag."""
+        with self._lock:
+            present = {}
+            with os.scandir(self.lua_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.lua') and entry.is_file():
+                        stat = entry.stat()
+                        present[os.path.join(self.lua_dir, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+
+            for path in [path for path in self._files if path not in present and os.path.dirname(path) == self.lua_dir]:
+                del self._files[path]
+                self._dirty = True
+            for path, signature in present.items():
+                self._info(path, signature)
+
+            if self._dirty:
+                self._rebuild(present)
+
+    def _rebuild(self, present):
+        definitions = {}
+        for path in sorted(present):
+            info = self._files[path][1]
+            if info:
+                filename = os.path.basename(path)
+                definitions[_type_name(filename)] = {**info, 'lua': filename}
+        self._definitions = definitions
+        self._body = json.dumps(definitions, sort_keys=True).encode('utf-8')
+        self._etag = hashlib.sha1(self._body).hexdigest()
+        self._gzip_body = None # komprimuje se až při prvním požadavku, který gzip přijme
+        self._dirty = False
+
+    def definitions(self):
+        self.refresh()
+        return self._definitions
+
+    def response_body(self, compressed=False):
+        """
+        Vrátí (tělo JSON odpovědi, ETag bez uvozovek); s compressed=True tělo zkomprimované gzipem.
+
+        Gzip varianta je jiná reprezentace (jiné bajty), proto má vlastní silný ETag s příponou -gz.
+        """
+        self.refresh()
+        with self._lock:
+            if not compressed:
+                return self._body, self._etag
+            if self._gzip_body is None:
+                self._gzip_body = gzip.compress(self._body, 6, mtime=0)
+            return self._gzip_body, self._etag + "-gz"
\ No newline at end of file
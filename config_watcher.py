@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class ConfigWatcher:
+    """
+    Hlídá změny config.json a Lua skriptů bloků a po změně zavolá on_change().
+
+    Kontroluje jen mtime a velikost souborů každých `interval` sekund (bez závislosti
+    na inotify). Změna se ohlásí, až jsou soubory `settle` sekund v klidu, aby se
+    nenačítal napůl uložený soubor z editoru. on_change běží ve vlákně hlídače.
+
+    Když on_change vyhodí výjimku (např. dispečer nestihl reload do timeoutu) nebo vrátí
+    False, změněné soubory zůstanou čekat a reload se zopakuje po `retry_interval`
+    sekundách (s každým dalším neúspěchem dvakrát později, nejvýš po `max_retry_interval`),
+    případně hned při další změně.
+    """
+    def __init__(self, config_file, lua_block_dir, on_change, interval=1.0, settle=0.5, retry_interval=2.0,
+                 max_retry_interval=60.0):
+        self.config_file = config_file
+        self.lua_block_dir = lua_block_dir
+        self.on_change = on_change
+        self.interval = interval
+        self.settle = settle
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.retries = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._signature = self._scan()
+        self._pending = set() # změněné soubory, jejichž reload zatím neprošel
+        self._retry_delay = retry_interval
+        self._retry_at = None
+
+    def _scan(self):
+        """Vrátí {cesta: (mtime_ns, size)} pro konfiguraci a všechny Lua skripty."""
+        paths = [self.config_file]
+        try:
+            paths += [os.path.join(self.lua_block_dir, name) for name in os.listdir(self.lua_block_dir) if name.endswith('.lua')]
+        except OSError:
+            pass
+        signature = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature[path] = (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, name="config-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.config_file} and {self.lua_block_dir}/*.lua for changes")
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            signature = self._scan()
+            if signature == self._signature:
+                if self._retry_at is not None and time.monotonic() >= self._retry_at:
+                    self.retries += 1
+                    logger.info(f"Retrying reload of {sorted(self._pending)}")
+                    self._reload()
+                continue
+            # Počkáme, až se soubory přestanou měnit
+            while not self._stop.wait(self.settle):
+                settled = self._scan()
+                if settled == signature:
+                    break
+                signature = settled
+            if self._stop.is_set():
+                return
+
+            self._pending.update(path for path in signature.keys() | self._signature.keys()
+                                 if signature.get(path) != self._signature.get(path))
+            self._signature = signature
+            logger.info(f"Detected changes in {sorted(self._pending)}, reloading")
+            self._reload()
+
+    def _reload(self):
+        try:
+            ok = self.on_change(sorted(self._pending)) is not False
+        except Exception as e:
+            logger.error(f"Hot reload failed: {e}", exc_info=True)
+            ok = False
+        if ok:
+            self._pending.clear()
+            self._retry_at = None
+            self._retry_delay = self.retry_interval
+            return
+        logger.warning(f"Reload of {sorted(self._pending)} will be retried in {self._retry_delay:.0f} s")
+        self._retry_at = time.monotonic() + self._retry_delay
+        self._retry_delay = min(self._retry_delay * 2, self.max_retry_interval)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
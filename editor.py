@@ -1,4 +1,5 @@
 import sys
+import os
 import json
 import requests
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QListWidget, QGraphicsView, 
@@ -11,6 +12,8 @@ from PyQt5.QtCore import Qt, QRectF, QPointF, pyqtSignal, QMimeData
 # --- Globální proměnné ---
 NODE_DEFINITIONS = {}
 SERVER_URL = "http://localhost:5001"
+# Poslední stažené definice s jejich ETagem; při dalším startu stačí serveru odpovědět 304
+DEFINITIONS_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "smarthome_editor_definitions.json")
 
 # --- Grafické prvky ---
 
@@ -280,9 +283,15 @@ class MainWindow(QMainWindow):
     def load_definitions(self):
         global NODE_DEFINITIONS
         try:
-            response = requests.get(f"{SERVER_URL}/api/block-definitions", timeout=3)
-            response.raise_for_status()
-            NODE_DEFINITIONS = response.json()
+            cached = self.load_cached_definitions()
+            headers = {"If-None-Match": cached["etag"]} if cached else {}
+            response = requests.get(f"{SERVER_URL}/api/block-definitions", headers=headers, timeout=3)
+            if response.status_code == 304 and cached:
+                NODE_DEFINITIONS = cached["definitions"]
+            else:
+                response.raise_for_status()
+                NODE_DEFINITIONS = response.json()
+                self.save_cached_definitions(response.headers.get("ETag"), NODE_DEFINITIONS)
             if not NODE_DEFINITIONS:
                 raise ValueError("Server vrátil prázdný seznam definic.")
             self.block_list.populate(NODE_DEFINITIONS)
@@ -291,6 +300,24 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Chyba Spojení", f"Nepodařilo se načíst definice bloků ze serveru.\n{e}\n\nUjistěte se, že backend běží na {SERVER_URL} a že Lua soubory mají správně formátované @blockinfo hlavičky.")
             self.close()
 
+    def load_cached_definitions(self):
+        try:
+            with open(DEFINITIONS_CACHE_FILE, encoding="utf-8") as f:
+                cached = json.load(f)
+            return cached if cached.get("etag") and cached.get("definitions") else None
+        except (OSError, ValueError):
+            return None
+
+    def save_cached_definitions(self, etag, definitions):
+        if not etag:
+            return
+        try:
+            os.makedirs(os.path.dirname(DEFINITIONS_CACHE_FILE), exist_ok=True)
+            with open(DEFINITIONS_CACHE_FILE, "w", encoding="utf-8") as f:
+                json.dump({"etag": etag, "definitions": definitions}, f)
+        except OSError:
+            pass # cache je jen zrychlení, bez ní se definice prostě stáhnou znovu
+
     def on_selection_changed(self):
         items = self.scene.selectedItems()
         if len(items) == 1 and isinstance(items[0], Block):
@@ -1,4 +1,5 @@
 import logging
+import threading
 import time
 
 logging.basicConfig(level=logging.INFO)
@@ -8,13 +9,28 @@ logger = logging.getLogger(__name__)
 # Pro účely tohoto příkladu pouze simulujeme vstup a výstup.
 
 class HardwareInterface:
-    def __init__(self):
+    def __init__(self, transaction_latency=0.0):
         logger.info("Initializing Hardware Interface (simulated)...")
         self.digital_inputs = {}  # pin -> current_state
         self.digital_outputs = {} # pin -> current_state
         self.analog_inputs = {}   # pin -> current_value (0-1023 pro simulaci ADC)
         self.dali_devices = {}    # device_address -> brightness
 
+        # Posluchači změn vstupů: callback(input_type, pin, value)
+        # Simulace umí změny hlásit sama; backend, který to neumí, nastaví False a správce bloků ho bude dotazovat.
+        self.supports_change_notification = True
+        self._input_listeners = []
+
+        # Stínový registr výstupů: zápisy ze stage_digital_output() se sbírají a na sběrnici odejdou najednou ve flush_outputs().
+        # Více zápisů na stejný pin v jednom cyklu se sloučí do jednoho.
+        self._pending_outputs = {} # pin -> state
+        self._outputs_lock = threading.Lock()
+
+        # Model ceny sběrnice: každá transakce (čtení/zápis pinu nebo celé banky) stojí transaction_latency sekund.
+        # Reálné I/O expandéry a ADC mají podobnou režii na transakci, ne na pin.
+        self.transaction_latency = transaction_latency
+        self.transaction_count = 0
+
         # Simulace GPIO pinů (např. BCM číslování)
         # Reálná implementace by volala RPi.GPIO.setup()
         for i in range(2, 28): # Zhruba dostupné GPIO piny
@@ -40,21 +56,89 @@ class HardwareInterface:
             logger.warning(f"Unknown pin mode: {mode} for pin {pin}")
 
 
+    def add_input_listener(self, callback):
+        """Zaregistruje callback(input_type, pin, value), který se zavolá při každé změně vstupu."""
+        if callback not in self._input_listeners:
+            self._input_listeners.append(callback)
+
+    def remove_input_listener(self, callback):
+        if callback in self._input_listeners:
+            self._input_listeners.remove(callback)
+
+    def _notify_input_change(self, input_type, pin, value):
+        # V reálu by se volalo z obsluhy přerušení (např. GPIO.add_event_detect)
+        for callback in list(self._input_listeners):
+            try:
+                callback(input_type, pin, value)
+            except Exception as e:
+                logger.error(f"Input listener failed for {input_type} pin {pin}: {e}")
+
+    def _transaction(self):
+        self.transaction_count += 1
+        if self.transaction_latency:
+            time.sleep(self.transaction_latency)
+
     def read_digital_input(self, pin):
         # V reálu by četlo z GPIO pinu
         # print(f"Simulating digital input read from pin {pin}: {self.digital_inputs.get(pin, False)}")
+        self._transaction()
         return self.digital_inputs.get(pin, False)
 
+    def read_digital_inputs(self):
+        """Přečte všechny digitální vstupy jednou transakcí. Vrací bitovou masku (bit N = pin N)."""
+        # V reálu jedno čtení registru portu (např. GPLEV0 nebo INPUT registr MCP23017)
+        self._transaction()
+        mask = 0
+        for pin, state in self.digital_inputs.items():
+            if state:
+                mask |= 1 << pin
+        return mask
+
     def write_digital_output(self, pin, state):
+        """Zapíše stav na pin hned (jedna transakce). Starší nepropsaný zápis téhož pinu ze stínového registru se zahodí."""
+        with self._outputs_lock:
+            self._pending_outputs.pop(pin, None)
         # V reálu by zapsalo na GPIO pin
+        self._transaction()
         self.digital_outputs[pin] = bool(state)
         logger.info(f"Simulating digital output write to pin {pin}: {'HIGH' if state else 'LOW'}")
 
+    def stage_digital_output(self, pin, state):
+        """Zapíše stav do stínového registru. Na pin se dostane až při nejbližším flush_outputs()."""
+        with self._outputs_lock:
+            self._pending_outputs[pin] = bool(state)
+
+    def flush_outputs(self):
+        """
+        Odešle čekající zápisy ze stínového registru jednou transakcí. Piny, jejichž stav se
+        nemění, se vynechají; když se nemění žádný, na sběrnici nejde nic. Vrací počet změněných pinů.
+        """
+        with self._outputs_lock:
+            if not self._pending_outputs:
+                return 0
+            pending, self._pending_outputs = self._pending_outputs, {}
+        changed = {pin: state for pin, state in pending.items() if self.digital_outputs.get(pin) != state}
+        if not changed:
+            return 0
+
+        # V reálu jeden zápis celého portu (např. GPSET0/GPCLR0)
+        self._transaction()
+        for pin, state in changed.items():
+            self.digital_outputs[pin] = state
+            logger.info(f"Simulating digital output write to pin {pin}: {'HIGH' if state else 'LOW'}")
+        return len(changed)
+
     def read_analog_input(self, pin):
         # V reálu by četlo z ADC převodníku
         # print(f"Simulating analog input read from pin {pin}: {self.analog_inputs.get(pin, 0)}")
+        self._transaction()
         return self.analog_inputs.get(pin, 0) # Předpokládáme hodnotu 0-1023 pro simulaci
 
+    def read_analog_inputs(self, pins):
+        """Přečte více analogových kanálů jednou transakcí (např. skenovací režim ADC)."""
+        self._transaction()
+        return [self.analog_inputs.get(pin, 0) for pin in pins]
+
     def set_dali_brightness(self, device_address, brightness):
         # V reálu by odeslalo DALI příkaz
         self.dali_devices[device_address] = max(0, min(254, brightness)) # DALI 0-254
@@ -73,6 +157,7 @@ class HardwareInterface:
             self.digital_inputs[pin] = state
             if old_state != state:
                 logger.info(f"*** SIMULATION: Digital input pin {pin} changed to {state} ***")
+                self._notify_input_change("digital", pin, state)
                 return True
         return False
 
@@ -82,5 +167,6 @@ class HardwareInterface:
             self.analog_inputs[pin] = value
             if old_value != value:
                 logger.info(f"*** SIMULATION: Analog input pin {pin} changed to {value} ***")
+                self._notify_input_change("analog", pin, value)
                 return True
         return False
\ No newline at end of file
@@ -0,0 +1,390 @@
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Segment = soubor (nebo anonymní paměť) s kruhovými buffery pro SEGMENT_SLOTS témat, namapovaný přes mmap.
+# Rozložení: hlavička | meta (pro každé téma: hlava a počet surových vzorků, int64)
+#            | surové vzorky (čas, hodnota) | 1min agregace | 15min agregace (řádky _ROLLUP_WIDTH doublů)
+MAGIC = b"SHHIST01"
+_HEADER = struct.Struct("<8sIIII") # magic, témat v segmentu, kapacita surových vzorků, 1min a 15min agregací
+_HEADER_SIZE = 64
+SEGMENT_SLOTS = 256
+INDEX_FILE = "topics.idx"          # jedno téma (JSON řetězec) na řádek, číslo řádku = slot
+ROLLUP_INTERVALS = (60, 900)
+_ROLLUP_WIDTH = 5                  # začátek intervalu, součet, počet, minimum, maximum
+MAX_POINTS = 10000                 # nejvíc bodů v jedné odpovědi dotazu se 'step'
+
+_BOOL_STRINGS = {'true': 1.0, 'false': 0.0, 'on': 1.0, 'off': 0.0}
+
+def numeric_value(value):
+    """Hodnota vzorku jako float (bool jako 1.0 / 0.0), nebo None pro text, JSON a nekonečna."""
+    if value is True or value is False:
+        return float(value)
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        text = value.strip()
+        boolean = _BOOL_STRINGS.get(text.lower())
+        if boolean is not None:
+            return boolean
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+class _Segment:
+    def __init__(self, path, raw_capacity, rollup_capacities):
+        header = _HEADER.pack(MAGIC, SEGMENT_SLOTS, raw_capacity, *rollup_capacities)
+        sizes = [SEGMENT_SLOTS * 2 * 8, SEGMENT_SLOTS * raw_capacity * 2 * 8]
+        sizes += [SEGMENT_SLOTS * capacity * _ROLLUP_WIDTH * 8 for capacity in rollup_capacities]
+        self.size = _HEADER_SIZE + sum(sizes)
+        self.path = path
+
+        if path is None:
+            self._mm = mmap.mmap(-1, self.size)
+        else:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                existing = os.fstat(fd).st_size
+                if existing != self.size or os.pread(fd, _HEADER.size, 0) != header:
+                    if existing:
+                        logger.warning(f"History segment {path} has a different layout, starting it empty")
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, header, 0)
+                # Místo na disku se vyhradí hned: zápis do řídkého souboru na plném disku (SD karta)
+                # by přes mmap skončil signálem SIGBUS a pádem celého procesu, tady je to jen OSError
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fd, 0, self.size)
+                self._mm = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+
+        view = memoryview(self._mm)
+        offset = _HEADER_SIZE
+        self._views = [view]
+        regions = []
+        for size, fmt in zip(sizes, ['q'] + ['d'] * (len(sizes) - 1)):
+            region = view[offset:offset + size].cast(fmt)
+            self._views.append(region)
+            regions.append(region)
+            offset += size
+        self.meta, self.raw, *self.rollups = regions
+
+    def flush(self):
+        if self.path is not None:
+            self._mm.flush()
+
+    def close(self):
+        self.flush()
+        # Pohledy do mmap se musí uvolnit před jeho zavřením
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+
+class HistoryStore:
+    """
+    Časové řady číselných a logických témat z cache (hodnoty jako '21.5', 'true', 'off').
+
+    Každé téma má v segmentu pevný slot se třemi kruhovými buffery bez Python objektů na vzorek:
+    surové vzorky (raw_capacity posledních), 1min agregace (minute_capacity intervalů, výchozí 6 h)
+    a 15min agregace (quarter_capacity intervalů, výchozí 3 dny). Agregace se počítají průběžně při
+    zápisu (součet, počet, min, max aktuálního intervalu přímo v jeho řádku), takže dotaz na den
+    čte 96 řádků místo všech vzorků.
+
+    Paměť a disk: téma zabírá raw_capacity * 16 + (minute_capacity + quarter_capacity) * 40 + 16 bajtů,
+    s výchozími kapacitami asi 29 KiB, segment (256 témat) 7,3 MiB. 1000 témat = 29 MiB,
+    10 000 témat = 293 MiB namapovaných a na disku předem vyhrazených (viz bench 'history').
+
+    S path se segmenty mapují ze souborů v adresáři path a historie přežije restart; data zapisuje
+    na disk jádro (při stop() se vynutí flush). Bez path je vše jen v paměti.
+    Nová témata nad max_topics se do historie nepřidají.
+    """
+    def __init__(self, path=None, raw_capacity=256, minute_capacity=360, quarter_capacity=288, max_topics=1000):
+        self.path = path
+        self.raw_capacity = raw_capacity
+        self._rollups = tuple(zip(ROLLUP_INTERVALS, (minute_capacity, quarter_capacity)))
+        self.max_topics = max_topics
+        self._slots = {}             # téma -> slot (index segmentu * SEGMENT_SLOTS + pozice v segmentu)
+        self._segments = []
+        self._lock = threading.Lock()
+        self._index = None
+
+        self.samples = 0
+        self.ignored = 0             # nečíselné hodnoty
+        self.rejected_topics = 0     # témata nad max_topics
+        self.overflows = 0           # kolikrát zápis do cache předběhl historii (vzorky se ztratily)
+        self.errors = 0              # chyby při zápisu ve vlákně history-writer
+
+        self._subscription = None
+        self._thread = None
+        self._stop = threading.Event()
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        topic = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"History index {index_path} has a damaged line, ignoring the rest")
+                        break
+                    self._slots[topic] = len(self._slots)
+        except FileNotFoundError:
+            pass
+        for segment in range((len(self._slots) + SEGMENT_SLOTS - 1) // SEGMENT_SLOTS):
+            self._open_segment(segment)
+        # Index se přepíše, aby po poškozeném řádku nenavazovaly nové zápisy
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(topic) + "\n" for topic in self._slots)
+        os.replace(index_path + ".tmp", index_path)
+        self._index = open(index_path, "a", encoding="utf-8")
+        if self._slots:
+            logger.info(f"History opened from {self.path}: {len(self._slots)} topics")
+
+    def _open_segment(self, number):
+        path = None if self.path is None else os.path.join(self.path, f"segment-{number:05d}.seg")
+        self._segments.append(_Segment(path, self.raw_capacity, [capacity for _, capacity in self._rollups]))
+
+    def _add_topic(self, topic):
+        # Volající drží zámek
+        if len(self._slots) >= self.max_topics:
+            if not self.rejected_topics:
+                logger.warning(f"History is full ({self.max_topics} topics), new topics are not recorded")
+            self.rejected_topics += 1
+            return None
+        slot = len(self._slots)
+        if slot // SEGMENT_SLOTS >= len(self._segments):
+            try:
+                self._open_segment(len(self._segments))
+            except OSError as e:
+                # Typicky plný disk; zkusí se znovu u dalšího nového tématu
+                self.rejected_topics += 1
+                logger.error(f"Cannot create history segment for topic {topic}: {e}")
+                return None
+        self._slots[topic] = slot
+        if self._index is not None:
+            self._index.write(json.dumps(topic) + "\n")
+            self._index.flush()
+        return slot
+
+    def record(self, topic, value, timestamp):
+        """Uloží vzorek tématu. Vrací False, pokud hodnota není číselná nebo je historie plná."""
+        number = numeric_value(value)
+        if number is None:
+            self.ignored += 1
+            return False
+        with self._lock:
+            return self._record_locked(topic, number, timestamp)
+
+    def record_many(self, samples):
+        """Uloží [(téma, hodnota, čas)] pod jedním zámkem."""
+        numbers = []
+        for topic, value, timestamp in samples:
+            number = numeric_value(value)
+            if number is None:
+                self.ignored += 1
+            else:
+                numbers.append((topic, number, timestamp))
+        with self._lock:
+            for topic, number, timestamp in numbers:
+                self._record_locked(topic, number, timestamp)
+
+    def _record_locked(self, topic, number, timestamp):
+        slot = self._slots.get(topic)
+        if slot is None:
+            slot = self._add_topic(topic)
+            if slot is None:
+                return False
+        segment = self._segments[slot // SEGMENT_SLOTS]
+        local = slot % SEGMENT_SLOTS
+
+        meta, raw, capacity = segment.meta, segment.raw, self.raw_capacity
+        head = meta[2 * local]
+        base = (local * capacity + head) * 2
+        raw[base] = timestamp
+        raw[base + 1] = number
+        meta[2 * local] = (head + 1) % capacity
+        if meta[2 * local + 1] < capacity:
+            meta[2 * local + 1] += 1
+
+        for (interval, capacity), rows in zip(self._rollups, segment.rollups):
+            bucket = int(timestamp // interval)
+            start = float(bucket * interval)
+            base = (local * capacity + bucket % capacity) * _ROLLUP_WIDTH
+            current = rows[base]
+            if current == start and rows[base + 2]:
+                rows[base + 1] += number
+                rows[base + 2] += 1
+                if number < rows[base + 3]:
+                    rows[base + 3] = number
+                if number > rows[base + 4]:
+                    rows[base + 4] = number
+            elif current <= start:
+                # Řádek patří intervalu o celý kruh staršímu (nebo je prázdný), začíná nový interval
+                rows[base] = start
+                rows[base + 1] = number
+                rows[base + 2] = 1.0
+                rows[base + 3] = number
+                rows[base + 4] = number
+            # current > start: opožděný vzorek do intervalu, který už byl přepsán novějším
+        self.samples += 1
+        return True
+
+    def query(self, topic, start, end, step=None, now=None):
+        """
+        Vrátí historii tématu v intervalu <start, end> (unixové časy) nebo None, pokud téma v historii není.
+
+        Bez step se vrátí nejpodrobnější úroveň, která start ještě pokrývá. Se step (sekundy) se vybere
+        nejhrubší úroveň nejvýš se step a body se agregují do intervalů délky step.
+        Výsledek: {"resolution": 0 / 60 / 900, "step", "timestamps", "values"} a u agregací i "min", "max"
+        (values je pak průměr intervalu).
+        """
+        if step is not None and step > 0 and (end - start) / step > MAX_POINTS:
+            raise ValueError(f"Too many points, use a step of at least {math.ceil((end - start) / MAX_POINTS)} s")
+        now = end if now is None else now
+        with self._lock:
+            slot = self._slots.get(topic)
+            if slot is None:
+                return None
+            segment = self._segments[slot // SEGMENT_SLOTS]
+            local = slot % SEGMENT_SLOTS
+            tier = self._choose_tier(segment, local, start, step or 0, now)
+            if tier == 0:
+                rows = self._raw_rows(segment, local)
+            else:
+                rows = self._rollup_rows(segment, local, tier - 1)
+        return self._format(rows, tier, start, end, step)
+
+    def _choose_tier(self, segment, local, start, step, now):
+        intervals = (0,) + tuple(interval for interval, _ in self._rollups)
+        first = max(tier for tier, interval in enumerate(intervals) if interval <= step)
+        for tier in range(first, len(intervals)):
+            if tier == 0:
+                count = segment.meta[2 * local + 1]
+                if count < self.raw_capacity:
+                    return 0 # kruh ještě nepřetekl, jsou v něm všechny vzorky
+                oldest = segment.raw[(local * self.raw_capacity + segment.meta[2 * local]) * 2]
+                if oldest <= start:
+                    return 0
+            else:
+                interval, capacity = self._rollups[tier - 1]
+                if (int(now // interval) - capacity + 1) * interval <= start:
+                    return tier
+        return len(intervals) - 1
+
+    def _raw_rows(self, segment, local):
+        """[(čas, hodnota)] od nejstaršího."""
+        capacity = self.raw_capacity
+        head, count = segment.meta[2 * local], segment.meta[2 * local + 1]
+        data = segment.raw[local * capacity * 2:(local + 1) * capacity * 2].tolist()
+        pairs = list(zip(data[0::2], data[1::2]))
+        return pairs[:count] if count < capacity else pairs[head:] + pairs[:head]
+
+    def _rollup_rows(self, segment, local, index):
+        """[(začátek, součet, počet, min, max)] platných intervalů od nejstaršího."""
+        capacity = self._rollups[index][1]
+        data = segment.rollups[index][local * capacity * _ROLLUP_WIDTH:(local + 1) * capacity * _ROLLUP_WIDTH].tolist()
+        rows = [tuple(data[i:i + _ROLLUP_WIDTH]) for i in range(0, len(data), _ROLLUP_WIDTH)]
+        rows = [row for row in rows if row[2] > 0]
+        rows.sort()
+        return rows
+
+    def _format(self, rows, tier, start, end, step):
+        resolution = 0 if tier == 0 else self._rollups[tier - 1][0]
+        if tier == 0:
+            rows = [(t, v, 1.0, v, v) for t, v in rows if start <= t <= end]
+            if not step:
+                return {"resolution": 0, "step": None,
+                        "timestamps": [row[0] for row in rows], "values": [row[1] for row in rows]}
+        else:
+            rows = [row for row in rows if row[0] + resolution > start and row[0] <= end]
+
+        if step and step > resolution:
+            merged = {}
+            for t, total, count, low, high in rows:
+                bucket = math.floor(t / step) * step
+                previous = merged.get(bucket)
+                if previous is None:
+                    merged[bucket] = [total, count, low, high]
+                else:
+                    previous[0] += total
+                    previous[1] += count
+                    previous[2] = min(previous[2], low)
+                    previous[3] = max(previous[3], high)
+            rows = [(bucket, *values) for bucket, values in sorted(merged.items())]
+        return {
+            "resolution": resolution,
+            "step": step or resolution,
+            "timestamps": [row[0] for row in rows],
+            "values": [row[1] / row[2] for row in rows],
+            "min": [row[3] for row in rows],
+            "max": [row[4] for row in rows],
+        }
+
+    def topics(self):
+        with self._lock:
+            return list(self._slots)
+
+    def attach(self, state_cache, prefix="", max_buffer=65536):
+        """Začne ukládat změny cache (témat s prefixem) ve vlastním vlákně, zápis do cache na historii nečeká."""
+        self._subscription = state_cache.subscribe(prefix, max_buffer=max_buffer)
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            changes, resync_seq = self._subscription.get(timeout=0.5)
+            if resync_seq is not None:
+                self.overflows += 1
+                continue
+            if not changes:
+                continue
+            try:
+                self.record_many([(topic, entry.value, entry.timestamp) for topic, entry in changes])
+            except Exception as e:
+                # Vlákno musí běžet dál, jinak by historie potichu přestala zapisovat
+                self.errors += 1
+                logger.error(f"Recording history failed: {e}", exc_info=True)
+
+    def stop(self, timeout=5.0):
+        """Odpojí se od cache, zapíše namapované segmenty na disk a zavře je."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._subscription is not None:
+            self._subscription.close()
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            self._segments = []
+            self._slots = {}
+            if self._index is not None:
+                self._index.close()
+                self._index = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "topics": len(self._slots),
+                "samples": self.samples,
+                "ignored": self.ignored,
+                "rejected_topics": self.rejected_topics,
+                "overflows": self.overflows,
+                "errors": self.errors,
+                "mapped_bytes": sum(segment.size for segment in self._segments),
+            }
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+class HttpOutputPool:
+    """
+    Asynchronní odesílání HTTP požadavků z bloků (py_send_http_request).
+
+    - Požadavky vyřizuje omezený počet pracovních vláken, volající (Lua) nikdy nečeká na síť.
+    - Pro každý cílový host se drží jedna requests.Session, takže se TCP spojení znovu používají (keep-alive).
+    - Každý blok smí mít najednou rozpracováno nejvýše `per_block_limit` požadavků.
+    - Na jeden blok čeká ve frontě nejvýše jeden požadavek: novější nahradí starší, který ještě
+      neodešel (u relé nás zajímá jen poslední stav).
+    - Po dokončení se zavolá on_response(block_id, status, body); status je None, pokud požadavek selhal.
+    """
+    def __init__(self, workers=4, per_block_limit=1, timeout=5, on_response=None, metrics=None):
+        self.per_block_limit = per_block_limit
+        self.timeout = timeout
+        self.on_response = on_response
+        self.metrics = metrics
+
+        self._sessions = {}   # (scheme, netloc) -> requests.Session
+        self._sessions_lock = threading.Lock()
+        self._pending = {}    # block_id -> (method, url, payload), jen nejnovější požadavek
+        self._ready = deque() # block_id v pořadí příchodu, každý nejvýše jednou
+        self._active = {}     # block_id -> počet rozpracovaných požadavků
+        self._cond = threading.Condition()
+        self._stopping = False
+
+        self.submitted = 0
+        self.superseded = 0
+        self.completed = 0
+        self.failed = 0
+
+        self._workers = [threading.Thread(target=self._worker, name=f"http-output-{i}", daemon=True) for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, block_id, method, url, payload):
+        """Zařadí požadavek bloku k odeslání. Nikdy neblokuje na síti."""
+        with self._cond:
+            self.submitted += 1
+            if block_id in self._pending:
+                self.superseded += 1
+            else:
+                self._ready.append(block_id)
+            self._pending[block_id] = (method.upper(), url, payload)
+            self._cond.notify()
+
+    def _next_request(self):
+        # Volající drží self._cond. Vybere první blok, který ještě nevyčerpal svůj limit.
+        for block_id in self._ready:
+            if self._active.get(block_id, 0) < self.per_block_limit:
+                self._ready.remove(block_id)
+                self._active[block_id] = self._active.get(block_id, 0) + 1
+                return block_id, self._pending.pop(block_id)
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_request()
+                while job is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    job = self._next_request()
+
+            block_id, (method, url, payload) = job
+            try:
+                self._send(block_id, method, url, payload)
+            finally:
+                with self._cond:
+                    self._active[block_id] -= 1
+                    if not self._active[block_id]:
+                        del self._active[block_id]
+                    self._cond.notify_all()
+
+    def _session_for(self, url):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=len(self._workers))
+                session.mount(f"{parts.scheme}://", adapter)
+                self._sessions[key] = session
+            return session
+
+    def _send(self, block_id, method, url, payload):
+        status, body = None, None
+        start = time.perf_counter()
+        if method not in ('POST', 'GET'):
+            # Blok se o neúspěchu dozví stejně jako u síťové chyby (status None)
+            body = f"Unsupported HTTP method '{method}'"
+            with self._cond:
+                self.failed += 1
+            logger.warning(f"{body} for block {block_id}")
+        else:
+            try:
+                headers = {'Content-Type': 'application/json'}
+                # GET požadavky obvykle nemají payload, ale některé API ho podporují
+                response = self._session_for(url).request(method, url, data=payload, headers=headers, timeout=self.timeout)
+                status, body = response.status_code, response.text
+                response.raise_for_status() # Vyvolá chybu pro status kódy 4xx nebo 5xx
+                with self._cond:
+                    self.completed += 1
+                logger.info(f"HTTP request from block {block_id} to {url} successful.")
+            except requests.exceptions.RequestException as e:
+                with self._cond:
+                    self.failed += 1
+                if body is None:
+                    body = str(e)
+                logger.error(f"HTTP request from block {block_id} to '{url}' failed: {e}")
+
+        if self.metrics is not None:
+            self.metrics.observe_http_output(time.perf_counter() - start, status is not None and status < 400)
+
+        if self.on_response is not None:
+            try:
+                self.on_response(block_id, status, body)
+            except Exception as e:
+                logger.error(f"HTTP response callback for block {block_id} failed: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "submitted": self.submitted,
+                "superseded": self.superseded,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queued": len(self._pending),
+                "in_flight": sum(self._active.values()),
+            }
+
+    def stop(self, timeout=5.0):
+        """Dokončí rozpracované požadavky, zahodí čekající a ukončí vlákna."""
+        with self._cond:
+            self._stopping = True
+            self._pending.clear()
+            self._ready.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        for session in self._sessions.values():
+            session.close()
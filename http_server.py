@@ -0,0 +1,159 @@
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from werkzeug.serving import BaseWSGIServer, ThreadedWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger(__name__)
+
+class _KeepAliveRequestHandler(WSGIRequestHandler):
+    # HTTP/1.1 = spojení zůstává otevřené pro další požadavky (keep-alive)
+    protocol_version = "HTTP/1.1"
+
+class _PooledRequestHandler(_KeepAliveRequestHandler):
+    def run_wsgi(self):
+        # Stream se obsluhuje mimo pool: vlákno se z poolu vyčlení (a pool dostane náhradu),
+        # nebo se při vyčerpaném limitu streamů rovnou odpoví 503
+        if urlsplit(self.path).path in self.server.stream_paths and not self.server._detach_for_stream(self.request):
+            self.close_connection = True
+            self.wfile.write(_busy_response())
+            return
+        super().run_wsgi()
+
+def _busy_response():
+    body = json.dumps({"status": "error", "message": "Server busy, try again later"}).encode()
+    return ("HTTP/1.1 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            "Retry-After: 1\r\n"
+            "Connection: close\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    Produkční WSGI server s pevným počtem pracovních vláken a omezenou frontou spojení.
+
+    Přijímací vlákno jen řadí nová spojení do fronty. Když je fronta plná, odpoví
+    rovnou 503 a spojení zavře, takže přetížení nezpůsobí nekonečné čekání.
+    Jedno keep-alive spojení drží pracovní vlákno, dokud je aktivní; nečinné spojení
+    se uvolní po `keepalive_timeout` sekundách.
+
+    Dlouhé streamy (`stream_paths`, výchozí /api/stream) by vlákna poolu držely natrvalo,
+    proto vlákno, které stream převezme, z poolu odejde a místo něj se spustí nové.
+    Současných streamů smí být nejvýš `max_streams`, další dostanou 503.
+    """
+    def __init__(self, host, port, app, workers=8, queue_size=64, keepalive_timeout=5.0, max_streams=32,
+                 stream_paths=("/api/stream",)):
+        handler = type('PooledRequestHandler', (_PooledRequestHandler,), {'timeout': keepalive_timeout})
+        super().__init__(host, port, app, handler=handler)
+        self.rejected = 0
+        self.stream_paths = frozenset(stream_paths)
+        self.max_streams = max_streams
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._streams = {} # vlákno -> socket streamu, který obsluhuje
+        self._workers = []
+        self._worker_count = 0
+        self._stopping = False
+        for _ in range(workers):
+            self._start_worker()
+
+    @property
+    def active_streams(self):
+        return len(self._streams)
+
+    def _start_worker(self):
+        """Spustí pracovní vlákno poolu (volá se v konstruktoru nebo pod zámkem)."""
+        worker = threading.Thread(target=self._worker, name=f"http-worker-{self._worker_count}", daemon=True)
+        self._worker_count += 1
+        self._workers.append(worker)
+        worker.start()
+
+    def _detach_for_stream(self, request):
+        """Vyčlení aktuální vlákno z poolu pro stream; False, když je limit streamů vyčerpaný."""
+        with self._lock:
+            if self._stopping or len(self._streams) >= self.max_streams:
+                self.rejected += 1
+                return False
+            current = threading.current_thread()
+            self._streams[current] = request
+            self._workers.remove(current)
+            self._start_worker()
+        self._local.detached = True
+        return True
+
+    def process_request(self, request, client_address):
+        try:
+            self._queue.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected += 1
+            self._reject(request)
+
+    def _reject(self, request):
+        try:
+            request.sendall(_busy_response())
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+            if getattr(self._local, 'detached', False):
+                # Vlákno streamu po skončení spojení zaniká, jeho místo v poolu už má náhrada
+                with self._lock:
+                    self._streams.pop(threading.current_thread(), None)
+                return
+
+    def stop(self, timeout=5.0):
+        """
+        Přestane přijímat spojení, nechá dokončit rozpracované požadavky a ukončí vlákna.
+
+        Nejdřív dostanou signál všechna vlákna poolu, pak se na ně čeká se společným limitem
+        `timeout` sekund, ne s limitem pro každé vlákno zvlášť. Streamům se jen zavře socket;
+        jejich vlákna (daemon) skončí při dalším zápisu a na ty se nečeká.
+        """
+        self.shutdown()
+        with self._lock:
+            self._stopping = True
+            workers = list(self._workers)
+            streams = dict(self._streams)
+        for _ in workers:
+            self._queue.put(None)
+        for request in streams.values():
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self.server_close()
+        logger.info("HTTP server stopped.")
+
+class DevelopmentWSGIServer(ThreadedWSGIServer):
+    """
+    Vývojový server (vlákno na každý požadavek, stejně jako app.run), který jde na rozdíl
+    od app.run zastavit voláním stop().
+    """
+    def __init__(self, host, port, app):
+        super().__init__(host, port, app)
+
+    def stop(self, timeout=5.0):
+        """Přestane přijímat spojení; rozpracované požadavky doběhnou ve svých vláknech."""
+        self.shutdown()
+        self.server_close()
+        logger.info("HTTP server stopped.")
@@ -3,7 +3,7 @@
 title = Digitální Vstup
 color = #27ae60
 inputs = 
-outputs = state, double_click
+outputs = state:bool, double_click:bool
 fields = 
     input_pin; Hardware Pin; int; 5
 @endblockinfo
@@ -2,7 +2,7 @@
 @blockinfo
 title = Fyzický Výstup
 color = #c0392b
-inputs = set_state
+inputs = set_state:bool
 outputs = 
 fields = 
     output_pin; Výstupní Pin; int; 12
@@ -22,9 +22,8 @@ end
 
 function M.on_input(input_name, value)
     if input_name == "set_state" then
-        local state_bool = (value == true or value == "true")
-        py_log_from_lua("Digital Output '" .. block_id_g .. "' setting pin " .. block_config_g.output_pin .. " to " .. tostring(state_bool))
-        py_set_hardware_output(block_id_g, "digital", block_config_g.output_pin, state_bool)
+        py_log_from_lua("Digital Output '" .. block_id_g .. "' setting pin " .. block_config_g.output_pin .. " to " .. tostring(value))
+        py_set_hardware_output(block_id_g, "digital", block_config_g.output_pin, value)
     end
 end
 
@@ -2,7 +2,7 @@
 @blockinfo
 title = HTTP Výstup
 color = #d35400
-inputs = set_state
+inputs = set_state:bool
 outputs = 
 fields = 
     url; Cílová URL; str; http://192.168.1.50/relay/0
@@ -25,10 +25,9 @@ end
 
 function M.on_input(input_name, value)
     if input_name == "set_state" then
-        local state_bool = (value == true or value == "true")
         local payload = ""
         
-        if state_bool then
+        if value then
             payload = block_config_g.payload_on or ""
         else
             payload = block_config_g.payload_off or ""
@@ -39,4 +38,11 @@ function M.on_input(input_name, value)
     end
 end
 
+-- Volá se asynchronně po dokončení požadavku (status je nil, pokud se nepodařilo spojit)
+function M.on_http_response(status, body)
+    if not status or status >= 400 then
+        py_log_from_lua("HTTP Output '" .. block_id_g .. "' request failed: " .. tostring(status) .. " " .. tostring(body))
+    end
+end
+
 return M
\ No newline at end of file
@@ -2,8 +2,8 @@
 @blockinfo
 title = Logika: Osvětlení
 color = #f1c40f
-inputs = power_button, motion_sensor, daylight_sensor, master_switch, temperature_check
-outputs = state, brightness
+inputs = power_button:bool, motion_sensor, daylight_sensor, master_switch, temperature_check
+outputs = state:bool, brightness:int
 fields = 
     default_on; Výchozí stav ZAPNUTO; bool
     default_brightness; Výchozí jas (%); int; 100
@@ -32,7 +32,7 @@ end
 
 function M.on_input(input_name, value)
     if input_name == "power_button" then
-        if value == true or value == "true" then
+        if value then
             is_on = not is_on
             py_log_from_lua("Lighting Logic '" .. block_id_g .. "' toggled. New state: " .. tostring(is_on))
             py_set_mqtt_output(block_id_g, "state", is_on)
@@ -40,4 +40,15 @@ function M.on_input(input_name, value)
     end
 end
 
+function M.save_state()
+    return { is_on = is_on, brightness = brightness }
+end
+
+function M.load_state(state)
+    if state.is_on ~= nil then is_on = (state.is_on == true) end
+    if state.brightness ~= nil then brightness = state.brightness end
+    py_set_mqtt_output(block_id_g, "state", is_on)
+    py_set_mqtt_output(block_id_g, "brightness", brightness)
+end
+
 return M
\ No newline at end of file
@@ -2,8 +2,8 @@
 @blockinfo
 title = Logika: Hlavní vypínač
 color = #8e44ad
-inputs = toggle
-outputs = state
+inputs = toggle:bool
+outputs = state:bool
 fields = 
     default_state; Výchozí stav ZAPNUTO; bool
 @endblockinfo
@@ -23,7 +23,7 @@ end
 
 function M.on_input(input_name, value)
     if input_name == "toggle" then
-        if value == true or value == "true" then
+        if value then
             is_on = not is_on
             py_log_from_lua("Logic block '" .. block_id_g .. "' toggled. New state: " .. tostring(is_on))
             py_set_mqtt_output(block_id_g, "state", is_on)
@@ -31,4 +31,15 @@ function M.on_input(input_name, value)
     end
 end
 
+function M.save_state()
+    return { is_on = is_on }
+end
+
+function M.load_state(state)
+    if state.is_on ~= nil then
+        is_on = (state.is_on == true)
+        py_set_mqtt_output(block_id_g, "state", is_on)
+    end
+end
+
 return M
\ No newline at end of file
@@ -22,7 +22,8 @@ end
 function M.on_input(input_name, value)
     py_log_from_lua("Passthrough block '" .. block_id_g .. "' received value: " .. tostring(value) .. ". Forwarding to all outputs.")
     
-    for output_name, _ in pairs(outputs_g) do
+    -- outputs je Python slovník (ne Lua tabulka), pairs() ho neprojde
+    for output_name in python.iter(outputs_g) do
         py_set_mqtt_output(block_id_g, output_name, value)
     end
 end
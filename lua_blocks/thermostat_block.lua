@@ -2,8 +2,8 @@
 @blockinfo
 title = Termostat
 color = #e67e22
-inputs = current_temperature
-outputs = heating_state
+inputs = current_temperature:float
+outputs = heating_state:bool
 fields = 
     set_point; Cílová teplota; float; 21.5
 @endblockinfo
@@ -23,10 +23,7 @@ end
 
 function M.on_input(input_name, value)
     if input_name == "current_temperature" then
-        local temp = tonumber(value)
-        if not temp then return end
-
-        local should_be_on = (temp < set_point)
+        local should_be_on = (value < set_point)
 
         if should_be_on ~= heating_on then
             heating_on = should_be_on
@@ -36,4 +33,15 @@ function M.on_input(input_name, value)
     end
 end
 
+function M.save_state()
+    return { heating_on = heating_on }
+end
+
+function M.load_state(state)
+    if state.heating_on ~= nil then
+        heating_on = (state.heating_on == true)
+        py_set_mqtt_output(block_id_g, "heating_state", heating_on)
+    end
+end
+
 return M
\ No newline at end of file
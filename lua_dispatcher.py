@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Zásady při přetečení fronty
+DROP_OLDEST = "drop_oldest"   # zahodí nejstarší čekající událost; dokud fronta není plná, nic se neztrácí
+COALESCE = "coalesce"         # při zaplnění fronty aspoň z poloviny událost se stejným klíčem (blok + vstup)
+                              # jen přepíše hodnotu (vhodné pro stavové vstupy, ne pro hrany a čítače);
+                              # při plné frontě zahodí nejstarší
+
+class _Event:
+    __slots__ = ('key', 'func', 'args', 'enqueued_at', 'weight', 'droppable')
+
+    def __init__(self, key, func, args, weight=1, droppable=True):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.enqueued_at = time.monotonic()
+        self.weight = weight       # kolik míst ve frontě událost zabírá (dávka vstupů = počet položek)
+        self.droppable = droppable # přijatá dávka se při přetečení nezahazuje
+
+class LuaDispatcher:
+    """
+    Jediný konzument všech volání do Lua runtime.
+
+    LuaRuntime není bezpečný pro souběžná volání, proto do něj smí vstupovat jen vlákno,
+    které volá process() (hlavní smyčka). Ostatní vlákna (MQTT, HTTP, hardware, HTTP výstupy)
+    události jen zařadí přes submit() do omezené fronty.
+
+    Události se zpracovávají po dávkách; po každé dávce se zavolá after_batch
+    (např. odeslání stínového registru výstupů).
+
+    Kapacita max_queue se počítá v položkách: běžná událost zabírá jedno místo, jednotka
+    ze submit_unit() tolik, kolik nese položek (viz depth()).
+    """
+    def __init__(self, max_queue=1024, policy=DROP_OLDEST, max_batch=64, after_batch=None):
+        if policy not in (DROP_OLDEST, COALESCE):
+            raise ValueError(f"Unknown dispatcher policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.max_batch = max_batch
+        self.after_batch = after_batch
+
+        self._queue = deque()
+        self._pending = 0  # součet vah čekajících událostí
+        self._by_key = {}  # key -> naposledy zařazená čekající _Event s tímto klíčem (jen pro COALESCE)
+        self._cond = threading.Condition()
+        self._owner = None # vlákno, které právě zpracovává události
+        self._woken = False
+
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.rejected = 0  # jednotky odmítnuté pro plnou frontu
+        self.batches = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, key, func, *args):
+        """
+        Zařadí volání func(*args) ke zpracování ve vlákně dispečera.
+        key identifikuje vstup pro slučování (None = nikdy neslučovat, např. hrany tlačítek).
+        """
+        with self._cond:
+            self.submitted += 1
+            if self.policy == COALESCE and key is not None and self._pending * 2 >= self.max_queue:
+                queued = self._by_key.get(key)
+                if queued is not None:
+                    queued.func, queued.args = func, args
+                    self.coalesced += 1
+                    return
+
+            if self._pending >= self.max_queue:
+                self._drop_oldest()
+
+            event = _Event(key, func, args)
+            self._append(event)
+            if self.policy == COALESCE and key is not None:
+                self._by_key[key] = event
+            self._cond.notify()
+
+    def submit_unit(self, func, *args, weight=1, reserved=False):
+        """
+        Zařadí func(*args) jako jednu nedělitelnou jednotku zabírající `weight` míst (např. dávku
+        vstupů z HTTP). Na rozdíl od submit() při nedostatku místa nic nezahazuje: jednotku
+        odmítne a vrátí False. Přijatá jednotka se nikdy neslučuje ani nezahodí.
+        reserved=True: místo už bylo vyhrazeno přes reserve(weight), jednotka se zařadí vždy.
+        """
+        with self._cond:
+            if reserved:
+                self._pending -= weight # _append ho započítá znovu
+            elif self._pending + weight > self.max_queue:
+                self.rejected += 1
+                return False
+            self.submitted += 1
+            self._append(_Event(None, func, args, weight, droppable=False))
+            self._cond.notify()
+            return True
+
+    def reserve(self, weight):
+        """
+        Vyhradí `weight` míst pro jednotku, která se zařadí později (submit_unit s reserved=True),
+        např. když se dávka rozkládá do více procesů a musí se přijmout buď všude, nebo nikde.
+        Vrací False, pokud se nevejde. Nepoužitou rezervaci je potřeba vrátit přes release().
+        """
+        with self._cond:
+            if self._pending + weight > self.max_queue:
+                self.rejected += 1
+                return False
+            self._pending += weight
+            return True
+
+    def release(self, weight):
+        with self._cond:
+            self._pending -= weight
+
+    def _append(self, event):
+        # Volající drží self._cond
+        self._queue.append(event)
+        self._pending += event.weight
+        if self._pending > self.max_depth:
+            self.max_depth = self._pending
+
+    def call(self, func, *args, timeout=None):
+        """
+        Provede func(*args) ve vlákně dispečera, počká na výsledek a vrátí ho (výjimku znovu vyvolá).
+        Ve vlákně dispečera se func zavolá rovnou. Volání se nikdy neslučuje ani nezahodí
+        (zařadí se i do plné fronty). Když do `timeout` sekund nezačne, vyřadí se z fronty
+        a vyvolá TimeoutError, takže později už neproběhne; jakmile jednou začalo, počká se na konec.
+        """
+        if self.in_dispatcher_thread():
+            return func(*args)
+
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = func(*args)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        event = _Event(None, run, (), droppable=False)
+        with self._cond:
+            self.submitted += 1
+            self._append(event)
+            self._cond.notify()
+        if not done.wait(timeout):
+            if self._cancel(event):
+                raise TimeoutError(f"Dispatcher did not run {getattr(func, '__name__', func)} within {timeout} s")
+            done.wait() # dispečer si volání už vzal, doběhne
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def _cancel(self, event):
+        """Vyřadí čekající událost z fronty. False, pokud si ji dispečer už vzal ke zpracování."""
+        with self._cond:
+            try:
+                self._queue.remove(event)
+            except ValueError:
+                return False
+            self._pending -= event.weight
+            return True
+
+    def _drop_oldest(self):
+        # Volající drží self._cond. Přijaté jednotky se přeskočí (bývají jich nanejvýš jednotky).
+        for index, oldest in enumerate(self._queue):
+            if oldest.droppable:
+                break
+        else:
+            return # ve frontě jsou jen jednotky, nová událost se zařadí nad kapacitu
+        del self._queue[index]
+        self._pending -= oldest.weight
+        if self._by_key.get(oldest.key) is oldest:
+            del self._by_key[oldest.key]
+        self.dropped += 1
+        logger.warning(f"Lua dispatcher queue full ({self.max_queue}), dropped oldest event")
+
+    def wake(self):
+        """Probudí process() bez události (např. kvůli ukončení)."""
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def process(self, timeout=None):
+        """
+        Počká nejdéle `timeout` sekund (None = bez omezení) na události a zpracuje jednu dávku.
+        Smí se volat jen z vlákna, které vlastní Lua runtime. Vrací počet zpracovaných událostí.
+        """
+        with self._cond:
+            if not self._queue and not self._woken:
+                self._cond.wait(timeout)
+            self._woken = False
+            batch = []
+            while self._queue and len(batch) < self.max_batch:
+                event = self._queue.popleft()
+                self._pending -= event.weight
+                if self._by_key.get(event.key) is event:
+                    del self._by_key[event.key]
+                batch.append(event)
+
+        if not batch:
+            return 0
+
+        self._owner = threading.current_thread()
+        try:
+            now = time.monotonic()
+            for event in batch:
+                wait = now - event.enqueued_at
+                self._wait_total += wait
+                if wait > self.max_wait:
+                    self.max_wait = wait
+                try:
+                    event.func(*event.args)
+                except Exception as e:
+                    logger.error(f"Error processing dispatcher event {event.key}: {e}", exc_info=True)
+            self.processed += len(batch)
+            self.batches += 1
+            if self.after_batch is not None:
+                self.after_batch()
+        finally:
+            self._owner = None
+        return len(batch)
+
+    def in_dispatcher_thread(self):
+        return self._owner is threading.current_thread()
+
+    def depth(self):
+        """Obsazená místa ve frontě (jednotka se počítá podle své váhy)."""
+        return self._pending
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": self._pending,
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "avg_wait_ms": (self._wait_total / self.processed * 1000) if self.processed else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
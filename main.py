@@ -1,13 +1,19 @@
-import time
 import json
 import logging
 import os
+import time
 
 from mqtt_client import MQTTClient
 from hardware_interface import HardwareInterface
+from metrics import MAX_TOPIC_LABELS, Metrics
 from block_manager import BlockManager
+from block_parser import BlockDefinitionRegistry
+from config_watcher import ConfigWatcher
+from history_store import HistoryStore
+from shard_runner import ShardedRuntime
+from snapshot import SnapshotWriter, load_snapshot
 from state_cache import StateCache
-from web_server import run_web_server
+from web_server import run_web_server, update_http_inputs
 
 # Nastavení formátu logování pro lepší přehlednost
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -15,6 +21,8 @@ logger = logging.getLogger(__name__)
 
 CONFIG_FILE = "config.json"
 LUA_BLOCK_DIR = "lua_blocks"
+SNAPSHOT_FILE = "state.snapshot"
+HISTORY_DIR = "history"
 
 def load_config(filepath):
     """Načte konfiguraci ze souboru JSON."""
@@ -30,7 +38,35 @@ def load_config(filepath):
         logger.error(f"Error decoding JSON from {filepath}: {e}")
         return None
 
+def make_reload_handler(config, block_manager, web_server):
+    """
+    Vrátí callback pro ConfigWatcher: načte novou konfiguraci a přírůstkově vymění jen
+    změněné bloky. Změny mimo sekci 'blocks' (broker, server, cache...) vyžadují restart.
+    Vrací False, když se konfiguraci nepodařilo načíst (ConfigWatcher pak reload zopakuje).
+    """
+    current = {"config": config}
+
+    def on_change(changed_paths):
+        new_config = load_config(CONFIG_FILE)
+        if not new_config:
+            logger.error("Reload skipped, keeping the running configuration.")
+            return False
+
+        old_settings = {k: v for k, v in current["config"].items() if k != "blocks"}
+        new_settings = {k: v for k, v in new_config.items() if k != "blocks"}
+        if old_settings != new_settings:
+            changed_keys = sorted(k for k in old_settings.keys() | new_settings.keys() if old_settings.get(k) != new_settings.get(k))
+            logger.warning(f"Settings {changed_keys} changed; they take effect only after restart.")
+
+        block_manager.reload_config(new_config)
+        update_http_inputs(web_server.app, new_config.get("blocks", []))
+        current["config"] = new_config
+        return True
+
+    return on_change
+
 def main():
+    startup_start = time.perf_counter()
     logger.info("Starting Smart Home Backend...")
 
     # Načtení centrální konfigurace
@@ -40,7 +76,48 @@ def main():
         return
 
     # 1. Vytvoření cache, která bude držet poslední stavy MQTT témat pro monitorování (GET požadavky)
-    state_cache = StateCache()
+    # Velikost cache lze omezit počtem témat i přibližným počtem bajtů (nejdéle nečtená témata se vyhodí)
+    cache_config = config.get("state_cache", {})
+    state_cache = StateCache(max_entries=cache_config.get("max_entries"), max_bytes=cache_config.get("max_bytes"))
+
+    # Teplý start: poslední snímek naplní cache a vrátí blokům jejich uložený stav (sekce 'snapshot')
+    snapshot_config = config.get("snapshot", {})
+    snapshot_enabled = snapshot_config.get("enabled", True)
+    snapshot_path = snapshot_config.get("path", SNAPSHOT_FILE)
+    block_states = {}
+    if snapshot_enabled:
+        load_start = time.perf_counter()
+        snapshot = load_snapshot(snapshot_path)
+        if snapshot:
+            restored = state_cache.restore(snapshot["cache"])
+            block_states = snapshot["blocks"]
+            logger.info(f"Snapshot from {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['created']))} loaded in "
+                        f"{(time.perf_counter() - load_start) * 1000:.1f} ms: {restored} topics, {len(block_states)} block states")
+
+    # Měření výkonu bloků, MQTT a hlavní smyčky pro /api/metrics (lze úplně vypnout: "metrics": {"enabled": false}).
+    # "max_topics" omezuje, kolik MQTT témat dostane vlastní label.
+    metrics_config = config.get("metrics", {})
+    metrics = Metrics(max_topics=metrics_config.get("max_topics", MAX_TOPIC_LABELS)) if metrics_config.get("enabled", True) else None
+    if metrics is not None:
+        metrics.add_collector(lambda: {f"state_cache_{k}": v for k, v in state_cache.stats().items()})
+
+    # Historie číselných témat z cache pro /api/history, jen na vyžádání ("history": {"enabled": true, "prefix": ...})
+    # Zabírá pevné místo v paměti i na disku podle kapacit a max_topics (viz HistoryStore)
+    history_config = config.get("history", {})
+    history = None
+    if history_config.get("enabled", False):
+        try:
+            history = HistoryStore(history_config.get("path", HISTORY_DIR),
+                                   raw_capacity=history_config.get("raw_capacity", 256),
+                                   minute_capacity=history_config.get("minute_capacity", 360),
+                                   quarter_capacity=history_config.get("quarter_capacity", 288),
+                                   max_topics=history_config.get("max_topics", 1000))
+        except OSError as e:
+            logger.error(f"History disabled, cannot open {history_config.get('path', HISTORY_DIR)}: {e}")
+    if history is not None:
+        history.attach(state_cache, history_config.get("prefix", ""))
+        if metrics is not None:
+            metrics.add_collector(lambda: {f"history_{k}": v for k, v in history.stats().items()})
 
     # 2. Inicializace hardwarového rozhraní (simulovaného)
     hw_interface = HardwareInterface()
@@ -50,30 +127,93 @@ def main():
     mqtt_broker_host = config.get("mqtt_broker_host", "localhost")
     mqtt_broker_port = config.get("mqtt_broker_port", 1883)
     
-    mqtt_client = MQTTClient(mqtt_broker_host, mqtt_broker_port, state_cache)
+    # Publikace jdou přes odchozí frontu; sekce 'mqtt_outbound' ji nastaví (např. spool_path pro výpadky brokeru)
+    mqtt_client = MQTTClient(mqtt_broker_host, mqtt_broker_port, state_cache,
+                             cache_topics=cache_config.get("topics", ["#"]), metrics=metrics,
+                             outbound_config=config.get("mqtt_outbound"))
+    if metrics is not None:
+        metrics.add_collector(lambda: {f"mqtt_outbound_{k}": v for k, v in mqtt_client.outbox.stats().items()})
     mqtt_client.connect()
 
+    # Definice bloků (@blockinfo) se parsují jednou a sdílí je správce bloků i webový server
+    definitions = BlockDefinitionRegistry(LUA_BLOCK_DIR)
+
     # 4. Inicializace správce bloků, který je srdcem logiky
-    block_manager = BlockManager(mqtt_client, hw_interface, state_cache, LUA_BLOCK_DIR)
-    
-    block_manager.load_blocks_from_config(config)
+    num_shards = config.get("shards", 1)
+    if num_shards > 1:
+        # Bloky se rozdělí do několika procesů (každý s vlastním Lua runtime), propojené bloky zůstanou spolu
+        block_manager = ShardedRuntime(config, num_shards, mqtt_client, hw_interface, state_cache, LUA_BLOCK_DIR,
+                                       options={"http_output": config.get("http_output"),
+                                                "dispatcher": config.get("dispatcher"),
+                                                "ordered_propagation": config.get("ordered_propagation", True),
+                                                "poll_interval": config.get("poll_interval", 0.1)})
+        block_manager.start()
+    else:
+        # Propojení mezi bloky se doručují přímo v procesu, MQTT je jen zrcadlo (lze vypnout v konfiguraci)
+        block_manager = BlockManager(mqtt_client, hw_interface, state_cache, LUA_BLOCK_DIR,
+                                     local_dispatch=config.get("local_dispatch", True),
+                                     http_output_config=config.get("http_output"),
+                                     dispatcher_config=config.get("dispatcher"),
+                                     metrics=metrics, definitions=definitions,
+                                     ordered_propagation=config.get("ordered_propagation", True))
+        
+        block_manager.load_blocks_from_config(config, block_states)
+        if metrics is not None:
+            metrics.add_collector(lambda: {f"dispatcher_{k}": v for k, v in block_manager.dispatcher.stats().items()})
+            metrics.add_collector(lambda: {f"http_output_{k}": v for k, v in block_manager.http_output.stats().items()})
+            metrics.add_collector(lambda: {f"propagation_{k}": v for k, v in block_manager.propagation_stats().items()})
+            metrics.add_collector(lambda: {f"analog_conditioning_{k}": v for k, v in block_manager.conditioning_stats().items()})
+            metrics.add_counter_collector(
+                "output_publications_total", "Outputs with a publish policy: published, suppressed and coalesced values.",
+                lambda: [({"block": block_id, "output": output, "result": result}, count)
+                         for block_id, output, published, suppressed, coalesced in block_manager.publish_stats()
+                         for result, count in (("published", published), ("suppressed", suppressed), ("coalesced", coalesced))])
 
     # 5. Spuštění webového serveru v samostatném vlákně
     # Předáme mu správce bloků a konfiguraci, aby mohl dynamicky vytvořit HTTP vstupy (POST endpointy)
     # Také mu předáme cache pro monitorovací endpointy (GET)
-    run_web_server(block_manager, config.get("blocks", []), state_cache, LUA_BLOCK_DIR)
+    # V režimu 'pooled' (sekce 'http_server') běží produkční server s omezeným počtem vláken
+    web_server = run_web_server(block_manager, config.get("blocks", []), state_cache, LUA_BLOCK_DIR,
+                                config.get("http_server"), metrics, definitions, history)
+
+    # 6. Hot reload: změny config.json a Lua skriptů se projeví bez restartu (lze vypnout "hot_reload": false)
+    # Při běhu v shardech se bloky mezi procesy nepřesouvají, tam je potřeba restart
+    config_watcher = None
+    if config.get("hot_reload", True) and num_shards <= 1:
+        config_watcher = ConfigWatcher(CONFIG_FILE, LUA_BLOCK_DIR, make_reload_handler(config, block_manager, web_server),
+                                       interval=config.get("hot_reload_interval", 1.0))
+        config_watcher.start()
+
+    # 7. Periodické ukládání snímku (cache + stav bloků s M.save_state); při běhu v shardech jen cache
+    snapshot_writer = None
+    if snapshot_enabled:
+        snapshot_writer = SnapshotWriter(snapshot_path, state_cache,
+                                         getattr(block_manager, 'collect_block_states', None),
+                                         interval=snapshot_config.get("interval", 30.0))
+        snapshot_writer.start()
+
+    logger.info(f"Ready in {(time.perf_counter() - startup_start) * 1000:.1f} ms")
 
-    # 6. Hlavní smyčka aplikace
-    # Tato smyčka se neustále opakuje a volá logiku bloků (např. pro polling hardwaru)
+    # 8. Hlavní smyčka aplikace
+    # Změny vstupů se zpracují hned, jak je hardware nahlásí; v klidu smyčka blokuje.
+    # Dotazování (polling) zůstává jen jako záloha pro hardware bez hlášení změn a pro bloky s 'run'.
     logger.info("Backend is running. Press Ctrl+C to exit.")
     try:
-        while True:
-            block_manager.process_block_logic()
-            time.sleep(0.1)  # Krátká pauza pro snížení zátěže CPU
+        block_manager.run_forever(poll_interval=config.get("poll_interval", 0.1))
 
     except KeyboardInterrupt:
         logger.info("Shutting down...")
     finally:
+        if config_watcher is not None:
+            config_watcher.stop()
+        # Poslední snímek po doběhnutí smyčky (stav bloků se už čte přímo)
+        if snapshot_writer is not None:
+            snapshot_writer.stop()
+        # Webový server přestane přijímat spojení (v režimu 'pooled' dokončí rozpracované požadavky)
+        web_server.stop()
+        block_manager.shutdown()
+        if history is not None:
+            history.stop()
         # Čisté ukončení MQTT klienta
         mqtt_client.disconnect()
         logger.info("Backend stopped.")
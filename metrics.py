@@ -0,0 +1,168 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Kolik témat dostane vlastní label v počtech MQTT zpráv; další se sčítají pod OTHER_TOPIC
+MAX_TOPIC_LABELS = 200
+OTHER_TOPIC = "__other__"
+
+# Hranice košů histogramů latence v sekundách (kumulativní koše jako v Prometheu)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    """Histogram s pevnými koši. observe() je jen bisect a dvě sčítání."""
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # poslední koš = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Vrátí [(hranice, kumulativní počet)] včetně '+Inf'."""
+        result, total = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+def _format_bound(bound):
+    return "+Inf" if bound == float('inf') else repr(bound)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}" if labels else ""
+
+class Metrics:
+    """
+    Sběr provozních metrik pro /api/metrics (textový formát Prometheus).
+
+    - latence a počty volání Lua callbacků po blocích (on_input, on_hardware_input_change, run, ...)
+    - příchozí a odchozí MQTT zprávy po tématech a doba předání příchozí zprávy handlerům
+    - délka ticku hlavní smyčky a počet zpoždění (tick nestihl svůj interval)
+    - latence HTTP výstupů
+
+    Callbacky bloků se volají jen z vlákna dispečera, jejich histogramy se proto zapisují bez zámku.
+    Počítadla MQTT a HTTP plní různá vlákna, chrání je zámek. Když jsou metriky vypnuté,
+    komponenty dostanou None a neměří vůbec nic.
+
+    Počty MQTT zpráv mají vlastní label jen pro prvních `max_topics` témat v každém směru,
+    zprávy ostatních témat se sčítají pod topic="__other__". Paměť i počet časových řad
+    v Prometheu tak zůstanou omezené; témata se nikdy nepřesouvají, aby počítadla jen rostla.
+    """
+    def __init__(self, max_topics=MAX_TOPIC_LABELS):
+        self.max_topics = max_topics
+        self._lock = threading.Lock()
+        self.block_calls = {}        # (block_id, callback) -> Histogram
+        self.messages_in = {}        # téma (nejvýš max_topics + OTHER_TOPIC) -> počet
+        self.messages_out = {}       # téma (nejvýš max_topics + OTHER_TOPIC) -> počet
+        self.mqtt_dispatch = Histogram()
+        self.tick_duration = Histogram()
+        self.tick_overruns = 0
+        self.http_output = {}        # výsledek ('ok' / 'error') -> Histogram
+        self.collectors = []         # funkce vracející {název: hodnota} pro doplňkové gauge (dispečer, cache...)
+        self.counter_collectors = [] # (název, popis, funkce vracející [({label: hodnota}, počet)])
+        self.started = time.time()
+
+    def observe_block_call(self, block_id, callback, seconds):
+        histogram = self.block_calls.get((block_id, callback))
+        if histogram is None:
+            # Nový klíč jen pod zámkem, render() mezitím kopíruje slovník z HTTP vlákna
+            with self._lock:
+                histogram = self.block_calls.setdefault((block_id, callback), Histogram())
+        histogram.observe(seconds)
+
+    def _count_topic(self, counts, topic):
+        # Volající drží self._lock
+        if topic not in counts and len(counts) >= self.max_topics:
+            topic = OTHER_TOPIC
+        counts[topic] = counts.get(topic, 0) + 1
+
+    def message_in(self, topic, dispatch_seconds):
+        with self._lock:
+            self._count_topic(self.messages_in, topic)
+            self.mqtt_dispatch.observe(dispatch_seconds)
+
+    def message_out(self, topic):
+        with self._lock:
+            self._count_topic(self.messages_out, topic)
+
+    def observe_tick(self, seconds, overrun):
+        self.tick_duration.observe(seconds)
+        if overrun:
+            self.tick_overruns += 1
+
+    def observe_http_output(self, seconds, ok):
+        with self._lock:
+            result = "ok" if ok else "error"
+            histogram = self.http_output.get(result)
+            if histogram is None:
+                histogram = self.http_output[result] = Histogram()
+            histogram.observe(seconds)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def add_counter_collector(self, name, help_text, collector):
+        """Počítadlo s labely, jehož hodnoty drží jiná komponenta (čtou se až při render())."""
+        self.counter_collectors.append((name, help_text, collector))
+
+    def render(self):
+        """Vrátí všechny metriky v textovém formátu Prometheus (verze 0.0.4)."""
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, hist in series:
+                for bound, count in hist.cumulative():
+                    lines.append(f"{name}_bucket{_labels(**labels, le=_format_bound(bound))} {count}")
+                lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+                lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+        def counter(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{_labels(**labels)} {value}")
+
+        with self._lock:
+            block_calls = sorted(self.block_calls.items())
+            messages_in = sorted(self.messages_in.items())
+            messages_out = sorted(self.messages_out.items())
+            http_output = sorted(self.http_output.items())
+        histogram("smarthome_block_call_seconds", "Duration of Lua block callbacks.",
+                  [({"block": block_id, "callback": callback}, hist)
+                   for (block_id, callback), hist in block_calls])
+        counter("smarthome_mqtt_messages_received_total", "MQTT messages received per topic.",
+                [({"topic": topic}, count) for topic, count in messages_in])
+        counter("smarthome_mqtt_messages_published_total", "MQTT messages published per topic.",
+                [({"topic": topic}, count) for topic, count in messages_out])
+        histogram("smarthome_mqtt_dispatch_seconds", "Time to hand an incoming MQTT message to cache and handlers.",
+                  [({}, self.mqtt_dispatch)])
+        histogram("smarthome_tick_seconds", "Duration of periodic main loop ticks (polling and run).",
+                  [({}, self.tick_duration)])
+        counter("smarthome_tick_overruns_total", "Ticks that started later than their interval.",
+                [({}, self.tick_overruns)])
+        histogram("smarthome_http_output_seconds", "Latency of outgoing HTTP requests from blocks.",
+                  [({"result": result}, hist) for result, hist in http_output])
+
+        for name, help_text, collector in self.counter_collectors:
+            counter(f"smarthome_{name}", help_text, collector())
+
+        lines.append("# HELP smarthome_uptime_seconds Seconds since metrics collection started.")
+        lines.append("# TYPE smarthome_uptime_seconds gauge")
+        lines.append(f"smarthome_uptime_seconds {time.time() - self.started}")
+        for collector in self.collectors:
+            for name, value in sorted(collector().items()):
+                lines.append(f"# TYPE smarthome_{name} gauge")
+                lines.append(f"smarthome_{name} {value}")
+        return "\n".join(lines) + "\n"
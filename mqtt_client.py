@@ -2,55 +2,109 @@ import paho.mqtt.client as mqtt
 from paho.mqtt.client import CallbackAPIVersion
 import json
 import logging
+import time
+
+from mqtt_outbox import OutboundQueue
+from topic_matcher import TopicMatcher
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def encode_payload(payload):
+    """Převede hodnotu na textový payload tak, jak ji uvidí broker (a zpětně i odběratelé)."""
+    if isinstance(payload, str):
+        return payload
+    try:
+        return json.dumps(payload)
+    except TypeError:
+        return str(payload)
+
 class MQTTClient:
-    def __init__(self, broker_host, broker_port, state_cache, client_id="rpi_smarthome_backend"):
+    def __init__(self, broker_host, broker_port, state_cache, client_id="rpi_smarthome_backend", cache_topics=("#",), metrics=None, outbound_config=None):
         self.client = mqtt.Client(CallbackAPIVersion.VERSION1, client_id)
         self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.subscriptions = {}
         self.message_handlers = {}
+        self._matcher = TopicMatcher() # index nad message_handlers pro rychlé hledání včetně '+' a '#'
         self.state_cache = state_cache
+        self.metrics = metrics # počty zpráv po tématech a doba předání (metrics.Metrics), None = vypnuto
+        # Poslední payload každého tématu (bajty, text): opakovaná stejná zpráva se nedekóduje znovu
+        # a handlery dostanou tentýž řetězec, na kterém mají své cache (value_codec.InputDecoder)
+        self._last_payloads = {}
+
+        # Filtry témat, která se mají ukládat do cache (výchozí '#' = vše jako dříve).
+        # Na sdíleném brokeru stačí omezit na prefixy, které bloky a dashboardy opravdu čtou.
+        self.cache_topics = list(cache_topics)
+        self._cache_matcher = TopicMatcher()
+        for cache_topic in self.cache_topics:
+            self._cache_matcher.add(cache_topic, True)
+
+        # Odchozí fronta: publish() jen zařadí zprávu, odesílá vlákno fronty (viz mqtt_outbox.py).
+        # Konfigurace 'mqtt_outbound': max_queue, batch_size, max_inflight, coalesce, spool_path, spool_max_bytes, ack_timeout
+        outbound_config = outbound_config or {}
+        self.outbox = OutboundQueue(self._send,
+                                    max_queue=outbound_config.get("max_queue", 10000),
+                                    batch_size=outbound_config.get("batch_size", 100),
+                                    max_inflight=outbound_config.get("max_inflight", 100),
+                                    coalesce=outbound_config.get("coalesce", True),
+                                    spool_path=outbound_config.get("spool_path"),
+                                    spool_max_bytes=outbound_config.get("spool_max_bytes", 10 * 1024 * 1024),
+                                    ack_timeout=outbound_config.get("ack_timeout", 60.0))
 
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             logger.info(f"Connected to MQTT Broker at {self.broker_host}:{self.broker_port}!")
             
-            # <-- ZMĚNA: Přihlásíme se k odběru všech témat pro plnění cache
-            client.subscribe("#")
-            logger.info("Subscribed to wildcard topic '#' to populate state cache.")
+            # Přihlásíme se k odběru témat pro plnění cache (podle konfigurace 'cache_topics')
+            for cache_topic in self.cache_topics:
+                client.subscribe(cache_topic)
+                logger.info(f"Subscribed to '{cache_topic}' to populate state cache.")
 
             # Původní přihlašování k odběrům pro bloky stále zůstává
             for topic in self.subscriptions:
                 self.client.subscribe(topic)
                 logger.info(f"Subscribed to: {topic}")
+
+            # Až po obnovení odběrů pustíme odchozí frontu (nejdřív přehraje spool)
+            self.outbox.set_connected(True)
         else:
             logger.error(f"Failed to connect, return code {rc}\n")
 
+    def _on_disconnect(self, client, userdata, rc):
+        self.outbox.set_connected(False)
+        if rc != 0:
+            logger.warning(f"Unexpectedly disconnected from MQTT Broker (rc={rc}), outgoing messages are queued")
+
+    def _on_publish(self, client, userdata, mid):
+        self.outbox.on_ack(mid)
+
     def _on_message(self, client, userdata, msg):
+        start = time.perf_counter()
         topic = msg.topic
-        payload = msg.payload.decode()
+        raw = msg.payload
+        last = self._last_payloads.get(topic)
+        if last is not None and last[0] == raw:
+            payload = last[1]
+        else:
+            payload = raw.decode()
+            self._last_payloads[topic] = (raw, payload)
         logger.debug(f"Received `{payload}` from `{topic}`")
 
-        # Aktualizace cache se nyní provede pro každou zprávu
-        if self.state_cache:
+        # Aktualizace cache jen pro témata odpovídající filtrům 'cache_topics'
+        if self.state_cache and self._cache_matcher.match(topic):
             self.state_cache.set(topic, payload)
 
         # Předání zprávy handlerům (logice bloků)
-        if topic in self.message_handlers:
-            for handler in self.message_handlers[topic]:
-                handler(topic, payload)
-        
-        for sub_topic, handlers in self.message_handlers.items():
-            if '#' in sub_topic or '+' in sub_topic:
-                if mqtt.topic_matches_sub(sub_topic, topic) and sub_topic != topic:
-                    for handler in handlers:
-                        handler(topic, payload)
+        for handler in self._matcher.match(topic):
+            handler(topic, payload)
+
+        if self.metrics is not None:
+            self.metrics.message_in(topic, time.perf_counter() - start)
     
     # ... zbytek souboru je beze změny ...
     def connect(self):
@@ -61,30 +115,64 @@ class MQTTClient:
             logger.error(f"Error connecting to MQTT broker: {e}")
 
     def disconnect(self):
+        # Dorovná odchozí frontu; co se nestihne, skončí ve spoolu (je-li nastaven)
+        self.outbox.stop()
         self.client.loop_stop()
         self.client.disconnect()
         logger.info("Disconnected from MQTT Broker.")
 
     def publish(self, topic, payload, qos=0, retain=False):
-        if not isinstance(payload, str):
-            try:
-                payload = json.dumps(payload)
-            except TypeError:
-                payload = str(payload)
-                
-        self.client.publish(topic, payload, qos, retain)
-        logger.debug(f"Published `{payload}` to `{topic}`")
+        payload = encode_payload(payload)
+        self.outbox.put(topic, payload, qos, retain)
+        if self.metrics is not None:
+            self.metrics.message_out(topic)
+        logger.debug(f"Queued `{payload}` for `{topic}`")
+
+    def _send(self, topic, payload, qos, retain):
+        """Odeslání jedné zprávy z odchozí fronty. Vrací (úspěch, mid)."""
+        info = self.client.publish(topic, payload, qos, retain)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            return True, info.mid
+        if info.rc == mqtt.MQTT_ERR_NO_CONN and qos > 0:
+            # QoS 1/2 si paho podrží sám a po znovupřipojení je pošle, zpráva je předaná
+            return True, info.mid
+        logger.debug(f"Publishing to `{topic}` failed (rc={info.rc}), message returned to queue")
+        return False, None
 
     def subscribe(self, topic, callback_func):
         if topic not in self.subscriptions:
             # Stále si pamatujeme, co chtějí bloky, pro případ znovupřipojení
             self.subscriptions[topic] = True
-            # Fyzické přihlášení k odběru se už děje v on_connect
-        
+            # Fyzické přihlášení k odběru se děje v on_connect; témata přidaná za běhu (hot reload) se přihlásí hned
+            if self.client.is_connected():
+                self.client.subscribe(topic)
+
         if topic not in self.message_handlers:
             self.message_handlers[topic] = []
         
         if callback_func not in self.message_handlers[topic]:
             self.message_handlers[topic].append(callback_func)
+            self._matcher.add(topic, callback_func)
             
-        logger.info(f"Registered callback for topic: {topic}")
\ No newline at end of file
+        logger.info(f"Registered callback for topic: {topic}")
+
+    def unsubscribe(self, topic, callback_func=None):
+        """Odebere handler (nebo všechny handlery) tématu. Bez handlerů se odběr zruší i na brokeru."""
+        handlers = self.message_handlers.get(topic)
+        if not handlers:
+            return
+
+        for handler in list(handlers):
+            if callback_func is None or handler == callback_func:
+                handlers.remove(handler)
+                self._matcher.remove(topic, handler)
+
+        if not handlers:
+            del self.message_handlers[topic]
+            self.subscriptions.pop(topic, None)
+            # Stejný filtr může dál plnit cache (cache_topics) nebo ho v indexu drží jiný odběratel; pak na brokeru zůstane
+            if topic in self.cache_topics or self._matcher.has_subscription(topic):
+                logger.info(f"Removed handlers for: {topic}, broker subscription kept")
+                return
+            self.client.unsubscribe(topic)
+            logger.info(f"Unsubscribed from: {topic}")
\ No newline at end of file
@@ -0,0 +1,347 @@
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Záznam ve spoolu: délka tématu, délka payloadu, QoS, retain; pak téma a payload (UTF-8)
+_RECORD = struct.Struct("<IIBB")
+
+class OutboundQueue:
+    """
+    Odchozí fronta MQTT publikací mezi bloky a paho klientem.
+
+    - Omezená fronta v paměti; pro stejné téma čeká vždy jen poslední hodnota (zachová si
+      pořadí první čekající zprávy a nejvyšší QoS ze sloučených), starší hodnoty se neposílají.
+    - Odesílací vlákno posílá zprávy po dávkách (nejvýše batch_size na jedno probuzení).
+    - Zprávy s QoS 1/2 se sledují až do potvrzení brokerem (on_publish); nepotvrzených smí být
+      nejvýše max_inflight, pak odesílání počká a fronta mezitím slučuje.
+    - Bez spojení zprávy čekají ve frontě. Když se fronta zaplní, nejstarší zprávy se přesunou
+      do spoolu na disku (pokud je nastaven spool_path), jinak se zahodí. Spool je soubor, do
+      kterého se jen připisuje; po znovupřipojení se přehraje v původním pořadí ještě před
+      frontou v paměti. Velikost spoolu je omezena spool_max_bytes, co se nevejde, se zahodí.
+      Spool z předchozího běhu se přehraje po prvním připojení (doručení je "aspoň jednou").
+
+    send(topic, payload, qos, retain) vrací (úspěch, mid); mid je potřeba jen pro QoS > 0.
+    Potvrzení, které nepřijde do ack_timeout sekund, se počítá do ack_timeouts a přestane blokovat.
+    """
+    def __init__(self, send, max_queue=10000, batch_size=100, max_inflight=100, coalesce=True,
+                 spool_path=None, spool_max_bytes=10 * 1024 * 1024, ack_timeout=60.0):
+        self.send = send
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight
+        self.coalesce = coalesce
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+        self.ack_timeout = ack_timeout
+
+        self._queue = OrderedDict() # klíč (téma, nebo (téma, pořadí) bez slučování) -> (topic, payload, qos, retain)
+        self._seq = 0
+        self._inflight = {}         # mid -> (čas odeslání, topic)
+        self._early_acks = set()    # potvrzení, která přišla dřív, než jsme si mid poznamenali
+        self._cond = threading.Condition()
+        # Zápis do spoolu (a jeho zkrácení po přehrání) běží mimo zámek fronty pod vlastním zámkem.
+        # Pořadí zámků: nejdřív _spool_lock, pak _cond.
+        self._spool_lock = threading.Lock()
+        self._spill = []            # zprávy vytlačené z plné fronty, které čekají na zápis do spoolu
+        self._connected = False
+        self._stopping = False
+        self._spool_file = None     # otevřený pro připisování až při prvním zápisu
+        self._spool_bytes = 0       # velikost spoolu na disku
+        self._spool_offset = 0      # kolik bajtů spoolu už bylo přehráno
+        if spool_path and os.path.exists(spool_path):
+            self._spool_bytes = os.path.getsize(spool_path)
+            if self._spool_bytes:
+                logger.info(f"MQTT spool {spool_path} has {self._spool_bytes} bytes from a previous run, replaying after connect")
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+        self.acked = 0
+        self.ack_timeouts = 0
+        self.batches = 0
+        self.spooled = 0
+        self.spool_dropped = 0
+        self.replayed = 0
+
+        self._thread = threading.Thread(target=self._run, name="mqtt-outbox", daemon=True)
+        self._thread.start()
+
+    # --- Strana producentů (libovolné vlákno) ---
+
+    def put(self, topic, payload, qos=0, retain=False):
+        with self._cond:
+            self.enqueued += 1
+            if self.coalesce:
+                key = topic
+                queued = self._queue.get(key)
+                if queued is not None:
+                    # Novější hodnota vyhrává, QoS zůstane vyšší z obou (doručení se nesmí zhoršit)
+                    self._queue[key] = (topic, payload, max(qos, queued[2]), retain)
+                    self.coalesced += 1
+                    return
+            else:
+                self._seq += 1
+                key = (topic, self._seq)
+
+            if len(self._queue) >= self.max_queue:
+                self._spill.append(self._queue.popitem(last=False)[1])
+            self._queue[key] = (topic, payload, qos, retain)
+            self._cond.notify()
+            spill = bool(self._spill)
+        if spill:
+            self._spill_to_spool()
+
+    def set_connected(self, connected):
+        """Volá MQTT klient z on_connect / on_disconnect."""
+        with self._cond:
+            self._connected = connected
+            if not connected:
+                # Paho nepotvrzené zprávy po znovupřipojení pošle sám, my je už jen nepočítáme
+                self._inflight.clear()
+                self._early_acks.clear()
+            self._cond.notify()
+
+    def on_ack(self, mid):
+        """Volá MQTT klient z on_publish (potvrzení QoS 1/2 od brokeru)."""
+        with self._cond:
+            if self._inflight.pop(mid, None) is not None:
+                self.acked += 1
+                self._cond.notify()
+            else:
+                # Paho volá on_publish i pro QoS 0; ta potvrzení nikdo nevyzvedne, množinu proto omezujeme
+                if len(self._early_acks) >= 1024:
+                    self._early_acks.clear()
+                self._early_acks.add(mid)
+
+    def _expire_inflight(self):
+        """Zapomene zprávy čekající na potvrzení déle než ack_timeout (volá se pod zámkem)."""
+        if not self._inflight:
+            return
+        limit = time.monotonic() - self.ack_timeout
+        for mid in [mid for mid, (sent_at, _) in self._inflight.items() if sent_at < limit]:
+            topic = self._inflight.pop(mid)[1]
+            self.ack_timeouts += 1
+            logger.warning(f"No acknowledgement for message {mid} to '{topic}' within {self.ack_timeout} s")
+
+    # --- Odesílací vlákno ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not (self._connected and self._can_send() and
+                                                   (self._queue or self._spool_pending())):
+                    self._cond.wait(1.0 if self._inflight else None)
+                    self._expire_inflight()
+                if self._stopping:
+                    return
+
+            if self._spool_pending():
+                self._replay_spool()
+                continue
+
+            with self._cond:
+                batch = []
+                while self._queue and len(batch) < self.batch_size and self._can_send(len(batch)):
+                    batch.append(self._queue.popitem(last=False)[1])
+            self._send_batch(batch)
+
+    def _can_send(self, extra=0):
+        return len(self._inflight) + extra < self.max_inflight
+
+    def _send_batch(self, batch):
+        for index, (topic, payload, qos, retain) in enumerate(batch):
+            ok, mid = self.send(topic, payload, qos, retain)
+            if not ok:
+                # Spojení spadlo uprostřed dávky: neodeslané zprávy vrátíme na začátek fronty
+                self._requeue(batch[index:])
+                return
+            self._sent(topic, qos, mid)
+        with self._cond:
+            self.batches += 1
+
+    def _sent(self, topic, qos, mid):
+        with self._cond:
+            self.sent += 1
+            if qos > 0 and mid is not None:
+                if mid in self._early_acks:
+                    self._early_acks.discard(mid)
+                    self.acked += 1
+                else:
+                    self._inflight[mid] = (time.monotonic(), topic)
+
+    def _requeue(self, messages):
+        with self._cond:
+            self._connected = False
+            pending = list(self._queue.items())
+            self._queue.clear()
+            for message in messages:
+                self._seq += 1
+                key = message[0] if self.coalesce else (message[0], self._seq)
+                self._queue[key] = message
+            for key, message in pending:
+                if key in self._queue:
+                    self._queue[key] = message # novější hodnota stejného tématu vyhrává
+                    self.coalesced += 1
+                else:
+                    self._queue[key] = message
+            while len(self._queue) > self.max_queue:
+                self._spill.append(self._queue.popitem(last=False)[1])
+        self._spill_to_spool()
+
+    # --- Spool na disku ---
+
+    def _spool_pending(self):
+        return self._spool_bytes > self._spool_offset
+
+    def _spill_to_spool(self):
+        """Zapíše zprávy vytlačené z plné fronty do spoolu v pořadí, v jakém se vytlačily."""
+        with self._spool_lock:
+            with self._cond:
+                messages, self._spill = self._spill, []
+            for message in messages:
+                if not self._spool_append([message]):
+                    with self._cond:
+                        self.dropped += 1
+
+    def _spool_append(self, messages):
+        """
+        Připíše zprávy na konec spoolu (volá se pod _spool_lock, bez zámku fronty).
+        Vrací False, pokud spool není nastaven nebo je plný.
+        """
+        if not self.spool_path:
+            return False
+        records = []
+        for topic, payload, qos, retain in messages:
+            topic_bytes = topic.encode('utf-8')
+            payload_bytes = payload.encode('utf-8') if isinstance(payload, str) else bytes(payload)
+            records.append(_RECORD.pack(len(topic_bytes), len(payload_bytes), qos, bool(retain)) + topic_bytes + payload_bytes)
+        data = b"".join(records)
+        if self._spool_bytes + len(data) > self.spool_max_bytes:
+            with self._cond:
+                self.spool_dropped += len(messages)
+                first_drop = self.spool_dropped == len(messages)
+            if first_drop:
+                logger.warning(f"MQTT spool {self.spool_path} is full ({self.spool_max_bytes} bytes), dropping messages")
+            return False
+        try:
+            if self._spool_file is None:
+                self._spool_file = open(self.spool_path, "ab")
+            self._spool_file.write(data)
+            self._spool_file.flush()
+        except OSError as e:
+            logger.error(f"Writing MQTT spool {self.spool_path} failed: {e}")
+            return False
+        with self._cond:
+            self._spool_bytes += len(data)
+            self.spooled += len(messages)
+            self._cond.notify()
+        return True
+
+    def _replay_spool(self):
+        """Přehraje spool od posledního místa; po úplném přehrání ho zkrátí na nulu."""
+        with self._cond:
+            end = self._spool_bytes # co bylo připsáno do této chvíle, je už na disku celé
+        try:
+            with open(self.spool_path, "rb") as f:
+                f.seek(self._spool_offset)
+                while f.tell() < end:
+                    with self._cond:
+                        if not self._connected or self._stopping:
+                            return
+                        if not self._can_send():
+                            self._cond.wait(0.1)
+                            self._expire_inflight()
+                            continue
+                    header = f.read(_RECORD.size)
+                    topic_len, payload_len, qos, retain = _RECORD.unpack(header) if len(header) == _RECORD.size else (0, 0, 0, 0)
+                    if len(header) < _RECORD.size or f.tell() + topic_len + payload_len > end or qos > 2:
+                        # Useknutý záznam (pád během zápisu v minulém běhu): zbytek souboru přeskočíme
+                        logger.warning(f"MQTT spool {self.spool_path} is damaged at offset {self._spool_offset}, skipping the rest")
+                        with self._cond:
+                            self._spool_offset = end
+                        break
+                    topic = f.read(topic_len).decode('utf-8', errors='replace')
+                    payload = f.read(payload_len).decode('utf-8', errors='replace')
+                    ok, mid = self.send(topic, payload, qos, bool(retain))
+                    if not ok:
+                        with self._cond:
+                            self._connected = False
+                        return
+                    self._sent(topic, qos, mid)
+                    with self._cond:
+                        self._spool_offset = f.tell()
+                        self.replayed += 1
+        except OSError as e:
+            logger.error(f"Replaying MQTT spool {self.spool_path} failed: {e}")
+            with self._cond:
+                self._spool_offset = end # jinak by se odesílací vlákno točilo na nečitelném souboru
+            return
+
+        with self._spool_lock, self._cond:
+            # Během přehrávání mohlo něco přibýt na konec, zkracujeme jen úplně přehraný soubor
+            if self._spool_bytes == self._spool_offset:
+                if self._spool_file is not None:
+                    self._spool_file.truncate(0) # v režimu připisování další zápis začne opět od nuly
+                else:
+                    open(self.spool_path, "wb").close()
+                self._spool_bytes = self._spool_offset = 0
+                logger.info(f"MQTT spool replayed ({self.replayed} messages so far)")
+
+    # --- Ukončení a statistiky ---
+
+    def flush(self, timeout=5.0):
+        """Počká, až se fronta vyprázdní (jen při spojení). Vrací True, pokud se to stihlo."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._queue or not self._connected:
+                    return not self._queue
+            time.sleep(0.01)
+        return False
+
+    def stop(self, timeout=5.0):
+        """Zkusí dorovnat frontu; co se neodeslalo, uloží do spoolu (pokud je nastaven)."""
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            remaining = list(self._queue.values())
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if remaining:
+            with self._spool_lock:
+                saved = self._spool_append(remaining)
+            if saved:
+                logger.info(f"Saved {len(remaining)} unsent MQTT messages to spool {self.spool_path}")
+            else:
+                self.dropped += len(remaining)
+                logger.warning(f"Dropped {len(remaining)} unsent MQTT messages")
+        with self._spool_lock:
+            if self._spool_file is not None:
+                self._spool_file.close()
+                self._spool_file = None
+
+    def stats(self):
+        with self._cond:
+            self._expire_inflight()
+            return {
+                "queue_depth": len(self._queue),
+                "inflight": len(self._inflight),
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "sent": self.sent,
+                "acked": self.acked,
+                "ack_timeouts": self.ack_timeouts,
+                "batches": self.batches,
+                "spool_bytes": self._spool_bytes - self._spool_offset,
+                "spooled": self.spooled,
+                "spool_dropped": self.spool_dropped,
+                "replayed": self.replayed,
+            }
@@ -0,0 +1,127 @@
+import logging
+
+from mqtt_client import encode_payload
+
+logger = logging.getLogger(__name__)
+
+# Výsledky OutputPolicy.offer()
+PUBLISH = "publish"     # publikovat hned
+DEFER = "defer"         # hodnota čeká na konec okna / intervalu (viz due), je potřeba ji naplánovat
+COALESCED = "coalesced" # hodnota nahradila jinou, už naplánovanou čekající hodnotu
+SUPPRESS = "suppress"   # hodnota se nepublikuje vůbec
+
+_KNOWN_KEYS = {"on_change", "deadband", "min_interval", "coalesce"}
+_NOTHING = object()
+
+class OutputPolicy:
+    """
+    Zásady publikace jednoho výstupu bloku (deklarované v config.publish_policy bloku):
+
+        on_change     True = publikovat jen změněnou hodnotu
+        deadband      číselné hodnoty se publikují, až se od poslední publikované liší aspoň o deadband
+        min_interval  nejvýše jedna publikace za min_interval sekund; hodnoty mezi tím čekají
+                      a po uplynutí intervalu se publikuje ta poslední
+        coalesce      hodnota se publikuje se zpožděním coalesce sekund; novější hodnoty
+                      v tomto okně ji nahradí (vyhrává poslední)
+
+    Zásady omezují jen publikaci na MQTT (a zápis do cache); bloky propojené lokálně dostanou
+    každou hodnotu hned.
+
+    Počítadla: published, suppressed (zahozené jako nezměněné), coalesced (nahrazené novější hodnotou).
+    Používá se jen z vlákna dispečera, zámky nepotřebuje.
+    """
+    __slots__ = ('on_change', 'deadband', 'min_interval', 'coalesce',
+                 'last_value', 'last_payload', 'last_time', 'pending', 'due',
+                 'published', 'suppressed', 'coalesced')
+
+    def __init__(self, on_change=False, deadband=None, min_interval=0.0, coalesce=0.0):
+        self.on_change = on_change
+        self.deadband = deadband
+        self.min_interval = min_interval or 0.0
+        self.coalesce = coalesce or 0.0
+
+        self.last_value = _NOTHING
+        self.last_payload = None
+        self.last_time = None
+        self.pending = _NOTHING
+        self.due = None
+
+        self.published = 0
+        self.suppressed = 0
+        self.coalesced = 0
+
+    def _unchanged(self, value):
+        if self.last_value is _NOTHING:
+            return False
+        if (self.deadband is not None and _is_number(value) and _is_number(self.last_value)):
+            return abs(value - self.last_value) < self.deadband
+        return self.on_change and encode_payload(value) == self.last_payload
+
+    def offer(self, value, now):
+        """Rozhodne o nové hodnotě výstupu. Vrací PUBLISH, DEFER (čas je v self.due), COALESCED nebo SUPPRESS."""
+        if self.pending is not _NOTHING:
+            # Už čekáme na konec okna: novější hodnota tu čekající nahradí
+            self.pending = value
+            self.coalesced += 1
+            return COALESCED
+
+        if self._unchanged(value):
+            self.suppressed += 1
+            return SUPPRESS
+
+        due = now + self.coalesce if self.coalesce else now
+        if self.min_interval and self.last_time is not None:
+            due = max(due, self.last_time + self.min_interval)
+        if due <= now:
+            return PUBLISH
+
+        self.pending = value
+        self.due = due
+        return DEFER
+
+    def take_pending(self):
+        """Vrátí (True, hodnota), pokud se čekající hodnota má publikovat, jinak (False, None)."""
+        value, self.pending, self.due = self.pending, _NOTHING, None
+        if value is _NOTHING:
+            return False, None
+        if self._unchanged(value):
+            self.suppressed += 1
+            return False, None
+        return True, value
+
+    def mark_published(self, value, now):
+        self.last_value = value
+        self.last_payload = encode_payload(value)
+        self.last_time = now
+        self.published += 1
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def parse_publish_policies(block_id, block_config, outputs):
+    """
+    Z config.publish_policy bloku vytvoří {output_name: OutputPolicy}. Klíč '*' platí pro
+    všechny výstupy, které nemají vlastní záznam. Výstupy bez zásad se publikují jako dřív (vždy).
+    """
+    declared = block_config.get('publish_policy') if hasattr(block_config, 'get') else None
+    if not declared:
+        return {}
+
+    policies = {}
+    for output_name in outputs:
+        settings = declared.get(output_name, declared.get('*'))
+        if not settings:
+            continue
+        unknown = set(settings) - _KNOWN_KEYS
+        if unknown:
+            logger.warning(f"Block {block_id}: unknown publish policy keys {sorted(unknown)} for output '{output_name}'")
+        try:
+            policies[output_name] = OutputPolicy(on_change=bool(settings.get('on_change', False)),
+                                                 deadband=float(settings['deadband']) if settings.get('deadband') is not None else None,
+                                                 min_interval=float(settings.get('min_interval', 0)),
+                                                 coalesce=float(settings.get('coalesce', 0)))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Block {block_id}: invalid publish policy for output '{output_name}': {e}")
+    for output_name in set(declared) - set(outputs) - {'*'}:
+        logger.warning(f"Block {block_id}: publish policy for unknown output '{output_name}'")
+    return policies
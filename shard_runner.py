@@ -0,0 +1,417 @@
+import itertools
+import logging
+import multiprocessing
+import threading
+from multiprocessing.connection import wait
+
+from block_manager import EchoFilter
+from hardware_interface import HardwareInterface
+from mqtt_client import encode_payload
+from topic_matcher import TopicMatcher
+
+logger = logging.getLogger(__name__)
+
+# --- Rozdělení grafu bloků ---
+
+def partition_blocks(blocks, num_shards):
+    """
+    Rozdělí bloky do `num_shards` skupin. Bloky propojené přes source_block_id
+    (souvislé komponenty grafu) zůstanou vždy pohromadě, aby propojení mezi nimi
+    zůstala v jednom procesu. Komponenty se rozdělují od největší do nejméně vytíženého shardu.
+    """
+    parent = {block['id']: block['id'] for block in blocks}
+
+    def find(block_id):
+        while parent[block_id] != block_id:
+            parent[block_id] = parent[parent[block_id]]
+            block_id = parent[block_id]
+        return block_id
+
+    for block in blocks:
+        for input_info in block.get('inputs', {}).values():
+            source_id = input_info.get('source_block_id')
+            if source_id in parent:
+                parent[find(block['id'])] = find(source_id)
+
+    components = {}
+    for block in blocks:
+        components.setdefault(find(block['id']), []).append(block)
+
+    shards = [[] for _ in range(max(1, num_shards))]
+    for component in sorted(components.values(), key=len, reverse=True):
+        min(shards, key=len).extend(component)
+    return [shard for shard in shards if shard]
+
+# --- Strana pracovního procesu ---
+
+class _PipeTransport:
+    """V pracovním procesu zastupuje MQTTClient; publikace a odběry posílá rodiči přes rouru."""
+    # Rodič ozvěnu publikace z brokeru zahodí (viz ShardedRuntime._handle_shard_message),
+    # BlockManager v shardu tedy nemusí hlídat ozvěny
+    echoes_publishes = False
+
+    def __init__(self, send):
+        self._send = send
+        self._matcher = TopicMatcher()
+        self._subscriptions = {}
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        # Hodnota se zakóduje stejně jako pro broker (Lua tabulky ani jiné objekty se rourou přenést nedají)
+        self._send(("publish", topic, encode_payload(payload), qos, retain))
+
+    def subscribe(self, topic, callback_func):
+        if topic not in self._subscriptions:
+            self._subscriptions[topic] = []
+            self._send(("subscribe", topic))
+        if callback_func not in self._subscriptions[topic]:
+            self._subscriptions[topic].append(callback_func)
+            self._matcher.add(topic, callback_func)
+
+    def unsubscribe(self, topic, callback_func=None):
+        handlers = self._subscriptions.get(topic, [])
+        for handler in list(handlers):
+            if callback_func is None or handler == callback_func:
+                handlers.remove(handler)
+                self._matcher.remove(topic, handler)
+        if topic in self._subscriptions and not handlers:
+            del self._subscriptions[topic]
+            self._send(("unsubscribe", topic))
+
+    def deliver(self, topic, payload):
+        for handler in self._matcher.match(topic):
+            handler(topic, payload)
+
+class _ShardHardware(HardwareInterface):
+    """Hardware v pracovním procesu: vstupy dostává od rodiče, zápisy výstupů mu posílá po dávkách."""
+    def __init__(self, send):
+        super().__init__()
+        self._send = send
+
+    def seed_inputs(self, inputs):
+        """Výchozí stav vstupů z rodiče ({(typ, adresa): hodnota}), bez hlášení změn."""
+        for (input_type, pin), value in inputs.items():
+            if input_type == "digital":
+                self.digital_inputs[pin] = value
+            elif input_type == "analog":
+                self.analog_inputs[pin] = value
+
+    def inject_input_change(self, input_type, pin, value):
+        if input_type == "digital":
+            self.digital_inputs[pin] = value
+        elif input_type == "analog":
+            self.analog_inputs[pin] = value
+        self._notify_input_change(input_type, pin, value)
+
+    def flush_outputs(self):
+        with self._outputs_lock:
+            if not self._pending_outputs:
+                return 0
+            pending, self._pending_outputs = self._pending_outputs, {}
+        changed = {pin: state for pin, state in pending.items() if self.digital_outputs.get(pin) != state}
+        if changed:
+            self.digital_outputs.update(changed)
+            self._send(("hw_output", changed))
+        return len(changed)
+
+    def set_dali_brightness(self, device_address, brightness):
+        self._send(("dali", device_address, brightness))
+
+def _shard_main(index, blocks, conn, lua_block_dir, options, inputs):
+    """Vstupní bod pracovního procesu: vlastní BlockManager a LuaRuntime pro svou část bloků."""
+    from block_manager import BlockManager
+    from state_cache import StateCache
+
+    # force=True: moduly backendu už při importu volají basicConfig, tady chceme formát s číslem shardu
+    logging.basicConfig(level=options.get('log_level', logging.INFO), force=True,
+                        format=f'%(asctime)s - shard{index} - %(name)s - %(levelname)s - %(message)s')
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    transport = _PipeTransport(send)
+    hardware = _ShardHardware(send)
+    hardware.seed_inputs(inputs)
+    block_manager = BlockManager(transport, hardware, StateCache(), lua_block_dir,
+                                 http_output_config=options.get('http_output'),
+                                 dispatcher_config=options.get('dispatcher'),
+                                 ordered_propagation=options.get('ordered_propagation', True))
+    block_manager.load_blocks_from_config({"blocks": blocks})
+
+    reservations = {} # request_id -> počet míst vyhrazených ve frontě dispečera pro dávku vstupů
+
+    def receive():
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                block_manager.stop()
+                return
+            kind = message[0]
+            if kind == "message":
+                transport.deliver(message[1], message[2])
+            elif kind == "input":
+                block_manager.inject_input(message[1], message[2], message[3])
+            elif kind == "reserve":
+                _, request_id, weight = message
+                if block_manager.dispatcher.reserve(weight):
+                    reservations[request_id] = weight
+                    send(("reply", request_id, True))
+                else:
+                    send(("reply", request_id, False))
+            elif kind == "inputs":
+                _, request_id, items = message
+                if reservations.pop(request_id, None) is not None:
+                    block_manager.inject_inputs(items, reserved=True)
+            elif kind == "release":
+                weight = reservations.pop(message[1], None)
+                if weight is not None:
+                    block_manager.dispatcher.release(weight)
+            elif kind == "hw":
+                hardware.inject_input_change(message[1], message[2], message[3])
+            elif kind == "stop":
+                block_manager.stop()
+                return
+
+    threading.Thread(target=receive, name=f"shard{index}-receiver", daemon=True).start()
+    send(("ready", [block['id'] for block in blocks]))
+    try:
+        block_manager.run_forever(poll_interval=options.get('poll_interval', 0.1))
+    finally:
+        block_manager.shutdown()
+        conn.close()
+
+# --- Strana rodičovského procesu ---
+
+class ShardedRuntime:
+    """
+    Spustí bloky v několika pracovních procesech, každý s vlastním LuaRuntime.
+
+    Rodič drží jediné spojení na MQTT broker, jediný StateCache a skutečný hardware.
+    Vůči webovému serveru a hlavní smyčce se chová jako BlockManager (inject_input,
+    run_forever, stop, shutdown), takže HTTP i /api/status vidí jeden sloučený stav.
+    Publikace z jednoho shardu se ostatním shardům, které téma odebírají, předávají
+    přímo přes rouru; jejich ozvěna z brokeru se pak zahodí (žádnému shardu, ani původnímu).
+    """
+    def __init__(self, config, num_shards, mqtt_client, hardware_interface, state_cache, lua_block_dir, options=None):
+        self.mqtt_client = mqtt_client
+        self.hardware_interface = hardware_interface
+        self.state_cache = state_cache
+        self.lua_block_dir = lua_block_dir
+        self.options = options or {}
+        self.shard_blocks = partition_blocks(config.get("blocks", []), num_shards)
+
+        self._context = multiprocessing.get_context("spawn")
+        self._connections = []
+        self._processes = []
+        self._send_locks = []
+        self._block_shard = {}          # block_id -> index shardu
+        self._hw_shards = {}            # (input_type, address) -> {index shardu}
+        self._subscriptions = TopicMatcher() # téma -> indexy shardů, které ho odebírají
+        self._echoes = EchoFilter()
+        self._stopped = threading.Event()
+        self._hw_last = {}              # (input_type, address) -> poslední hodnota předaná shardům
+        self._requests = {}             # request_id -> [threading.Event, odpověď shardu]
+        self._request_ids = itertools.count(1)
+        self.forwarded = 0
+
+        for index, blocks in enumerate(self.shard_blocks):
+            for block in blocks:
+                self._block_shard[block['id']] = index
+                for input_info in block.get('inputs', {}).values():
+                    hw = input_info.get('hardware_input')
+                    if hw:
+                        self._hw_shards.setdefault((hw['type'], hw['address']), set()).add(index)
+
+    def start(self, timeout=30):
+        # Shardy začínají se skutečným stavem vstupů, ne s výchozími hodnotami simulace
+        self._hw_last = self._read_hardware_inputs()
+        for index, blocks in enumerate(self.shard_blocks):
+            parent_conn, child_conn = self._context.Pipe()
+            inputs = {key: value for key, value in self._hw_last.items() if index in self._hw_shards[key]}
+            process = self._context.Process(target=_shard_main, name=f"shard{index}",
+                                            args=(index, blocks, child_conn, self.lua_block_dir, self.options, inputs), daemon=True)
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+            self._send_locks.append(threading.Lock())
+
+        # Počkáme, až všechny shardy načtou bloky; zprávy přijaté mezitím (odběry, publikace z init) zpracujeme
+        pending = set(range(len(self._connections)))
+        while pending:
+            ready = wait([self._connections[i] for i in pending], timeout)
+            if not ready:
+                raise TimeoutError(f"Shards {sorted(pending)} did not start in time")
+            for conn in ready:
+                index = self._connections.index(conn)
+                message = conn.recv()
+                if message[0] == "ready":
+                    pending.discard(index)
+                else:
+                    self._handle_shard_message(index, message)
+
+        for index, conn in enumerate(self._connections):
+            threading.Thread(target=self._reader, args=(index, conn), name=f"shard{index}-reader", daemon=True).start()
+        if getattr(self.hardware_interface, 'supports_change_notification', False):
+            self.hardware_interface.add_input_listener(self._on_hardware_input_event)
+        # Změny mezi přečtením výchozího stavu a registrací posluchače
+        self._poll_hardware_inputs()
+        logger.info(f"Started {len(self._processes)} block shards: {[len(b) for b in self.shard_blocks]} blocks")
+
+    def _send(self, index, message):
+        with self._send_locks[index]:
+            try:
+                self._connections[index].send(message)
+            except (OSError, ValueError) as e:
+                logger.error(f"Sending to shard {index} failed: {e}")
+
+    def _reader(self, index, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                if not self._stopped.is_set():
+                    logger.error(f"Shard {index} exited unexpectedly")
+                return
+            self._handle_shard_message(index, message)
+
+    def _handle_shard_message(self, index, message):
+        kind = message[0]
+        if kind == "publish":
+            _, topic, payload, qos, retain = message
+            self.state_cache.set(topic, payload)
+            subscribers = set(self._subscriptions.match(topic))
+            if subscribers:
+                # Ozvěna z brokeru se zahodí i pro odběr ve stejném shardu: ten si hodnotu doručil lokálně
+                self._echoes.expect(topic, payload)
+            targets = [i for i in subscribers if i != index]
+            for target in targets:
+                self._send(target, ("message", topic, payload))
+            self.forwarded += len(targets)
+            self.mqtt_client.publish(topic, payload, qos, retain)
+        elif kind == "subscribe":
+            self._subscriptions.add(message[1], index)
+            self.mqtt_client.subscribe(message[1], self._on_mqtt_message)
+        elif kind == "unsubscribe":
+            self._subscriptions.remove(message[1], index)
+            if not self._subscriptions.has_subscription(message[1]):
+                self.mqtt_client.unsubscribe(message[1], self._on_mqtt_message)
+        elif kind == "hw_output":
+            for pin, state in message[1].items():
+                self.hardware_interface.stage_digital_output(pin, state)
+            self.hardware_interface.flush_outputs()
+        elif kind == "dali":
+            self.hardware_interface.set_dali_brightness(message[1], message[2])
+        elif kind == "reply":
+            waiter = self._requests.get(message[1])
+            if waiter is not None:
+                waiter[1] = message[2]
+                waiter[0].set()
+
+    def _request(self, index, message, timeout=5.0):
+        """Pošle shardu zprávu (kind, request_id, ...) a počká na jeho odpověď. Vrací (request_id, odpověď)."""
+        request_id = next(self._request_ids)
+        waiter = [threading.Event(), None]
+        self._requests[request_id] = waiter
+        try:
+            self._send(index, (message[0], request_id) + message[1:])
+            if not waiter[0].wait(timeout):
+                logger.warning(f"Shard {index} did not answer '{message[0]}' within {timeout} s")
+            return request_id, waiter[1]
+        finally:
+            self._requests.pop(request_id, None)
+
+    def _on_mqtt_message(self, topic, payload):
+        if self._echoes.consume(topic, payload):
+            return
+        for index in set(self._subscriptions.match(topic)):
+            self._send(index, ("message", topic, payload))
+
+    def _read_hardware_inputs(self):
+        """Aktuální hodnoty všech vstupů, které některý shard používá: {(typ, adresa): hodnota}."""
+        hw = self.hardware_interface
+        values = {}
+        for input_type, address in self._hw_shards:
+            if input_type == "digital":
+                values[(input_type, address)] = hw.read_digital_input(address)
+            elif input_type == "analog":
+                values[(input_type, address)] = hw.read_analog_input(address)
+        return values
+
+    def _poll_hardware_inputs(self):
+        """Záložní dotazování pro hardware, který neumí hlásit změny: změny se rozešlou shardům."""
+        for (input_type, pin), value in self._read_hardware_inputs().items():
+            if value is not None and value != self._hw_last.get((input_type, pin)):
+                self._on_hardware_input_event(input_type, pin, value)
+
+    def _on_hardware_input_event(self, input_type, pin, value):
+        self._hw_last[(input_type, pin)] = value
+        for index in self._hw_shards.get((input_type, pin), ()):
+            self._send(index, ("hw", input_type, pin, value))
+
+    def inject_input(self, block_id, input_name, value):
+        index = self._block_shard.get(block_id)
+        if index is None:
+            logger.warning(f"Input for unknown block {block_id} ignored")
+            return
+        self._send(index, ("input", block_id, input_name, value))
+
+    def inject_inputs(self, items):
+        """
+        Dávka vstupů se rozdělí po shardech a přijme se buď celá, nebo vůbec: každý dotčený shard
+        si nejdřív vyhradí místo ve frontě dispečera, teprve když uspějí všechny, dostane každý
+        svou část jednou zprávou. Jinak se rezervace vrátí a dávka se odmítne (False).
+        """
+        by_shard = {}
+        for item in items:
+            index = self._block_shard.get(item[0])
+            if index is None:
+                logger.warning(f"Input for unknown block {item[0]} ignored")
+                continue
+            by_shard.setdefault(index, []).append(item)
+
+        reserved = {}
+        accepted = True
+        for index, shard_items in by_shard.items():
+            request_id, ok = self._request(index, ("reserve", max(1, len(shard_items))))
+            reserved[index] = request_id # i bez odpovědi: pozdní rezervaci uvolní 'release'
+            if not ok:
+                accepted = False
+                break
+        for index, request_id in reserved.items():
+            if accepted:
+                self._send(index, ("inputs", request_id, by_shard[index]))
+            else:
+                self._send(index, ("release", request_id))
+        return accepted
+
+    def run_forever(self, poll_interval=None):
+        """
+        Rodič jen přeposílá zprávy (ve vláknech); hlavní vlákno hlídá shardy a u hardwaru,
+        který neumí hlásit změny, každých poll_interval sekund čte vstupy.
+        """
+        notifies = getattr(self.hardware_interface, 'supports_change_notification', False)
+        interval = 1.0 if notifies else (poll_interval or 0.1)
+        while not self._stopped.wait(interval):
+            if not notifies:
+                self._poll_hardware_inputs()
+            for index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error(f"Shard {index} died with exit code {process.exitcode}")
+                    self._stopped.set()
+
+    def stop(self):
+        self._stopped.set()
+
+    def shutdown(self, timeout=5.0):
+        self._stopped.set()
+        for index in range(len(self._connections)):
+            self._send(index, ("stop",))
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._connections:
+            conn.close()
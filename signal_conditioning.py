@@ -0,0 +1,166 @@
+import logging
+
+try:
+    import numpy as np
+except ImportError: # numpy je potřeba jen pro vstupy s úpravou signálu
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Klíče v 'hardware_input' analogového vstupu, které zapínají úpravu signálu
+CONDITIONING_KEYS = {"deadband", "hysteresis", "smoothing", "window", "alpha", "median", "sample_interval", "report_interval"}
+SMOOTHING_MODES = ("none", "average", "ema")
+
+def parse_conditioning(block_id, input_name, hardware_input):
+    """
+    Z konfigurace 'hardware_input' analogového vstupu vytvoří normalizované nastavení úpravy signálu:
+
+        deadband         změna menší než deadband se nehlásí (v jednotkách ADC)
+        hysteresis       při obratu směru musí změna překročit deadband + hysteresis
+        smoothing        'none', 'average' (klouzavý průměr přes window vzorků) nebo 'ema' (koeficient alpha)
+        median           délka okna mediánového filtru proti špičkám (0 / 1 = vypnuto)
+        sample_interval  perioda čtení ADC v sekundách
+        report_interval  nejkratší doba mezi dvěma hlášeními změny bloku
+
+    Vrací None, pokud vstup žádné z těchto nastavení nemá (pak se chová jako dřív).
+    """
+    if not CONDITIONING_KEYS & set(hardware_input):
+        return None
+    try:
+        spec = {
+            "deadband": float(hardware_input.get("deadband", 0)),
+            "hysteresis": float(hardware_input.get("hysteresis", 0)),
+            "smoothing": hardware_input.get("smoothing", "none"),
+            "window": int(hardware_input.get("window", 1)),
+            "alpha": float(hardware_input.get("alpha", 1.0)),
+            "median": int(hardware_input.get("median", 0)),
+            "sample_interval": float(hardware_input.get("sample_interval", 0.1)),
+            "report_interval": float(hardware_input.get("report_interval", 0)),
+        }
+    except (TypeError, ValueError) as e:
+        logger.error(f"Block {block_id}: invalid signal conditioning for input '{input_name}': {e}")
+        return None
+    if spec["smoothing"] not in SMOOTHING_MODES:
+        logger.error(f"Block {block_id}: unknown smoothing '{spec['smoothing']}' for input '{input_name}', expected one of {SMOOTHING_MODES}")
+        return None
+    if not 0 < spec["alpha"] <= 1 or spec["window"] < 1 or spec["sample_interval"] <= 0:
+        logger.error(f"Block {block_id}: signal conditioning for input '{input_name}' needs 0 < alpha <= 1, window >= 1 and sample_interval > 0")
+        return None
+    return spec
+
+class AnalogConditioner:
+    """
+    Úprava signálu pro skupinu analogových kanálů se stejnou periodou vzorkování. Všechny kroky
+    běží nad NumPy poli přes všechny kanály naráz (okno posledních vzorků je matice kanály x vzorky),
+    takže další kanál přidá jen řádek, ne další průchod Pythonem:
+
+        vzorek -> medián (špičky) -> klouzavý průměr -> EMA -> deadband / hystereze -> omezení četnosti
+
+    Kanál bez nastavení daného kroku ho projde beze změny (okno 1, alpha 1, deadband 0).
+    addresses a slots jsou adresy ADC a sloty plánu čtení v BlockManageru, ve stejném pořadí jako specs.
+    """
+    def __init__(self, specs, addresses, slots, initial_values=None):
+        if np is None:
+            raise RuntimeError("numpy is required for analog signal conditioning")
+        self.addresses = list(addresses)
+        self.slots = list(slots)
+        self.sample_interval = specs[0]["sample_interval"]
+        self.next_due = 0.0
+        self.samples = 0
+        self.reports = 0
+
+        channels = len(specs)
+        median = [spec["median"] if spec["median"] > 1 else 1 for spec in specs]
+        average = [spec["window"] if spec["smoothing"] == "average" else 1 for spec in specs]
+        self._width = max(median + average)
+        self._median_groups = self._group(median)
+        self._average_groups = self._group(average)
+        self._raw = np.zeros((channels, self._width))
+        self._filtered = np.zeros((channels, self._width))
+        self._pos = -1 # sloupec s nejnovějším vzorkem
+
+        self._alpha = np.array([spec["alpha"] if spec["smoothing"] == "ema" else 1.0 for spec in specs])
+        self._deadband = np.array([spec["deadband"] for spec in specs])
+        self._hysteresis = np.array([spec["hysteresis"] for spec in specs])
+        self._report_interval = np.array([spec["report_interval"] for spec in specs])
+
+        self._smoothed = np.full(channels, np.nan)
+        # Poslední nahlášená hodnota (po hot reloadu převzatá), NaN = zatím nic, první vzorek se nahlásí vždy
+        self._reported = np.array([np.nan if value is None else float(value) for value in (initial_values or [None] * channels)])
+        self._direction = np.zeros(channels)
+        self._last_report = np.full(channels, -np.inf)
+
+    @staticmethod
+    def _group(lengths):
+        """{délka okna: indexy kanálů} jen pro okna delší než 1 (různých délek bývá málo)."""
+        groups = {}
+        for index, length in enumerate(lengths):
+            if length > 1:
+                groups.setdefault(length, []).append(index)
+        return {length: np.array(indexes) for length, indexes in groups.items()}
+
+    def _window(self, buffer, indexes, length):
+        """Posledních min(length, počet vzorků) hodnot vybraných kanálů (řádky = kanály)."""
+        count = min(length, self.samples)
+        columns = (self._pos - np.arange(count)) % self._width
+        return buffer[np.ix_(indexes, columns)]
+
+    def update(self, values, now):
+        """
+        Zpracuje jeden vzorek všech kanálů (None = kanál se nepodařilo přečíst).
+        Vrací (indexy kanálů ke hlášení, jejich nové hodnoty).
+        """
+        sample = np.array([np.nan if value is None else value for value in values], dtype=float)
+        missing = np.isnan(sample)
+        if missing.any():
+            # Nepřečtený kanál si ponechá poslední vyhlazenou hodnotu, aby nerozhodil okna
+            sample[missing] = self._smoothed[missing]
+
+        self._pos = (self._pos + 1) % self._width
+        self.samples += 1
+        self._raw[:, self._pos] = sample
+
+        filtered = sample.copy()
+        for length, indexes in self._median_groups.items():
+            filtered[indexes] = np.median(self._window(self._raw, indexes, length), axis=1)
+        self._filtered[:, self._pos] = filtered
+
+        smoothed = filtered.copy()
+        for length, indexes in self._average_groups.items():
+            smoothed[indexes] = self._window(self._filtered, indexes, length).mean(axis=1)
+        self._smoothed = np.where(np.isnan(self._smoothed), smoothed, self._smoothed + self._alpha * (smoothed - self._smoothed))
+
+        delta = self._smoothed - self._reported
+        never = np.isnan(self._reported) & ~np.isnan(self._smoothed)
+        sign = np.sign(delta)
+        reversal = (self._direction != 0) & (sign != self._direction)
+        threshold = self._deadband + self._hysteresis * reversal
+        magnitude = np.abs(delta)
+        changed = never | ((magnitude > 0) & (magnitude >= threshold))
+        # Příliš brzká změna se neztratí: nahlásí se při prvním vzorku po uplynutí report_interval
+        changed &= (now - self._last_report) >= self._report_interval
+
+        indexes = np.flatnonzero(changed)
+        if indexes.size:
+            self._direction[indexes] = np.where(never[indexes], 0, sign[indexes])
+            self._reported[indexes] = self._smoothed[indexes]
+            self._last_report[indexes] = now
+            self.reports += indexes.size
+        return indexes, self._smoothed[indexes]
+
+def build_conditioners(channels, initial_values):
+    """
+    channels je [(slot, adresa, spec)], initial_values {slot: poslední známá hodnota}.
+    Kanály se seskupí podle sample_interval, každá skupina se čte jednou transakcí.
+    """
+    groups = {}
+    for slot, address, spec in channels:
+        groups.setdefault(spec["sample_interval"], []).append((slot, address, spec))
+    return [AnalogConditioner([spec for _, _, spec in group], [address for _, address, _ in group],
+                              [slot for slot, _, _ in group], [initial_values.get(slot) for slot, _, _ in group])
+            for group in groups.values()]
+
+def to_python_number(value):
+    """Hodnota z NumPy pro Lua: celé číslo zůstane int (jako surová hodnota ADC), jinak float."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
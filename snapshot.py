@@ -0,0 +1,199 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Formát souboru: hlavička (magic, čas vytvoření, délka a CRC32 těla) + tělo.
+# Tělo je jedna hodnota v kompaktním binárním kódování s typovými značkami (viz _encode).
+MAGIC = b"SHSNAP01"
+_HEADER = struct.Struct("<8sdQI")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LEN = struct.Struct("<I")
+
+def _encode(value, out):
+    if value is None:
+        out.append(b"N")
+    elif value is True:
+        out.append(b"T")
+    elif value is False:
+        out.append(b"F")
+    elif isinstance(value, int):
+        if -2**63 <= value < 2**63:
+            out.append(b"i" + _INT.pack(value))
+        else:
+            _encode_bytes(b"j", str(value).encode(), out)
+    elif isinstance(value, float):
+        out.append(b"d" + _FLOAT.pack(value))
+    elif isinstance(value, str):
+        _encode_bytes(b"s", value.encode("utf-8"), out)
+    elif isinstance(value, (bytes, bytearray)):
+        _encode_bytes(b"b", bytes(value), out)
+    elif isinstance(value, (list, tuple)):
+        out.append(b"l" + _LEN.pack(len(value)))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(b"m" + _LEN.pack(len(value)))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise TypeError(f"Cannot snapshot value of type {type(value).__name__}")
+
+def _encode_bytes(tag, data, out):
+    out.append(tag + _LEN.pack(len(data)))
+    out.append(data)
+
+def _decode(buf, offset):
+    """Dekóduje jednu hodnotu z bufferu (memoryview nad mmap). Vrací (hodnota, nový offset)."""
+    tag = buf[offset:offset + 1].tobytes()
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"T":
+        return True, offset
+    if tag == b"F":
+        return False, offset
+    if tag == b"i":
+        return _INT.unpack_from(buf, offset)[0], offset + _INT.size
+    if tag == b"d":
+        return _FLOAT.unpack_from(buf, offset)[0], offset + _FLOAT.size
+    if tag in (b"s", b"b", b"j"):
+        length = _LEN.unpack_from(buf, offset)[0]
+        offset += _LEN.size
+        data = buf[offset:offset + length].tobytes()
+        offset += length
+        if tag == b"s":
+            return data.decode("utf-8"), offset
+        if tag == b"j":
+            return int(data), offset
+        return data, offset
+    if tag == b"l":
+        count = _LEN.unpack_from(buf, offset)[0]
+        offset += _LEN.size
+        items = []
+        for _ in range(count):
+            item, offset = _decode(buf, offset)
+            items.append(item)
+        return items, offset
+    if tag == b"m":
+        count = _LEN.unpack_from(buf, offset)[0]
+        offset += _LEN.size
+        result = {}
+        for _ in range(count):
+            key, offset = _decode(buf, offset)
+            result[key], offset = _decode(buf, offset)
+        return result, offset
+    raise ValueError(f"Unknown tag {tag!r} at offset {offset - 1}")
+
+def write_snapshot(path, cache_entries, block_states):
+    """
+    Atomicky zapíše snímek: cache_entries je [(topic, value, timestamp)], block_states {block_id: stav}.
+    Soubor se zapíše vedle cíle, fsyncne a přejmenuje, takže po pádu zůstane vždy celý starý nebo celý nový.
+    Vrací velikost souboru v bajtech.
+    """
+    body = []
+    _encode({"cache": [list(item) for item in cache_entries], "blocks": block_states}, body)
+    body = b"".join(body)
+    header = _HEADER.pack(MAGIC, time.time(), len(body), zlib.crc32(body))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    try:
+        # Přejmenování je trvalé až po fsync adresáře (na systémech, které to umí)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+    return len(header) + len(body)
+
+def load_snapshot(path):
+    """
+    Načte snímek přes mmap. Vrací {"cache": [[topic, value, timestamp]], "blocks": {...}, "created": čas},
+    nebo None, pokud soubor neexistuje nebo je poškozený (pak se začíná s prázdným stavem).
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _HEADER.size:
+            logger.warning(f"Snapshot {path} is truncated, ignoring it")
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # Dekódované hodnoty jsou kopie, pohledy do mmap se musí uvolnit před jeho zavřením
+            with memoryview(mapped) as buf, buf[_HEADER.size:] as body:
+                magic, created, body_len, crc = _HEADER.unpack_from(buf, 0)
+                if magic != MAGIC or body_len != len(body) or zlib.crc32(body) != crc:
+                    logger.warning(f"Snapshot {path} is corrupted or has unknown format, ignoring it")
+                    return None
+                try:
+                    data, _ = _decode(body, 0)
+                except (ValueError, struct.error, UnicodeDecodeError) as e:
+                    logger.warning(f"Snapshot {path} could not be decoded ({e}), ignoring it")
+                    return None
+    data["created"] = created
+    return data
+
+class SnapshotWriter:
+    """
+    Každých `interval` sekund uloží StateCache a stav bloků (M.save_state) do souboru.
+    Při stop() zapíše poslední snímek, aby po řádném vypnutí nic nechybělo.
+    collect_block_states je funkce bez argumentů vracející {block_id: stav} (nebo None).
+    """
+    def __init__(self, path, state_cache, collect_block_states=None, interval=30.0):
+        self.path = path
+        self.state_cache = state_cache
+        self.collect_block_states = collect_block_states
+        self.interval = interval
+        self.writes = 0
+        self.last_write_ms = 0.0
+        self.last_size = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        start = time.perf_counter()
+        try:
+            block_states = self.collect_block_states() if self.collect_block_states else None
+            entries = [(topic, entry.value, entry.timestamp) for topic, entry in self.state_cache.snapshot().items()]
+            self.last_size = write_snapshot(self.path, entries, block_states or {})
+        except Exception as e:
+            logger.error(f"Writing snapshot {self.path} failed: {e}")
+            return False
+        self.writes += 1
+        self.last_write_ms = (time.perf_counter() - start) * 1000
+        logger.debug(f"Snapshot written to {self.path}: {len(entries)} topics, "
+                     f"{len(block_states or {})} block states, {self.last_size} bytes in {self.last_write_ms:.1f} ms")
+        return True
+
+    def stop(self, timeout=5.0, final_write=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if final_write:
+            self.write()
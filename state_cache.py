@@ -1,22 +1,254 @@
+import sys
 import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+# Immutable cache entry. seq is a global, monotonically increasing write counter,
+# timestamp is the wall-clock time of the write.
+CacheEntry = namedtuple('CacheEntry', ['value', 'seq', 'timestamp'])
 
 class StateCache:
-    """A thread-safe class to store the latest state of MQTT topics."""
-    def __init__(self):
-        self._states = {}
+    """
+    A thread-safe class to store the latest state of MQTT topics.
+
+    Readers never take the writer lock: entries are immutable tuples that are
+    replaced as a whole, so get() is a single dict lookup. Full snapshots are
+    built at most once per cache version, outside the writer lock, and shared
+    by all readers, and
+    changes_since() returns only the topics written after a given sequence
+    number.
+
+    The cache can be bounded by entry count and by an approximate byte budget
+    (topic + value length). When a limit is exceeded, the least recently used
+    topics are evicted.
+    """
+    def __init__(self, max_entries=None, max_bytes=None, changelog_size=10000):
+        self._entries = {}           # topic -> CacheEntry, read without the lock
+        self._order = OrderedDict()  # topic -> None in LRU order, writers only
+        self._recent_reads = deque(maxlen=1024) # topics read since the last write (applied to _order lazily)
+        self._changes = deque(maxlen=changelog_size) # (seq, topic) of recent writes
         self._lock = threading.Lock()
+        self._seq = 0
+        self._generation = 0         # bumped on every write and eviction
+        self._snapshot = (-1, _ReadOnlyDict(), _ReadOnlyDict())  # (generation, {topic: CacheEntry}, {topic: value})
+        self._snapshot_lock = threading.Lock() # only one reader rebuilds a stale snapshot, writers never wait for it
+        self._subscribers = ()       # CacheSubscription objects, replaced as a whole
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(topic, value):
+        return len(topic) + (len(value) if isinstance(value, str) else 8)
+
+    @property
+    def seq(self):
+        """Sequence number of the latest write."""
+        return self._seq
 
     def set(self, topic, value):
         """Sets the value for a given topic."""
+        # Topics repeat on every message, interning keeps a single copy of each string
+        topic = sys.intern(topic)
+        with self._lock:
+            self._seq += 1
+            old = self._entries.get(topic)
+            if old is not None:
+                self._bytes -= self._entry_size(topic, old.value)
+                self._order.move_to_end(topic)
+            else:
+                self._order[topic] = None
+            self._entries[topic] = CacheEntry(value, self._seq, time.time())
+            # Bumped only after the entry is stored: a snapshot copied without the lock
+            # must never carry a generation whose write it is missing
+            self._generation += 1
+            self._bytes += self._entry_size(topic, value)
+            self._changes.append((self._seq, topic))
+            entry = self._entries[topic]
+            for subscriber in self._subscribers:
+                subscriber._push(topic, entry)
+            self._evict()
+
+    def restore(self, items):
+        """
+        Bulk-loads (topic, value, timestamp) items, e.g. from a snapshot at startup.
+        Entries get fresh sequence numbers but keep their original timestamps;
+        topics that are already present (newer data) are left untouched.
+        """
+        restored = 0
         with self._lock:
-            self._states[topic] = value
+            for topic, value, timestamp in items:
+                topic = sys.intern(topic)
+                if topic in self._entries:
+                    continue
+                self._seq += 1
+                self._order[topic] = None
+                self._entries[topic] = CacheEntry(value, self._seq, timestamp)
+                self._bytes += self._entry_size(topic, value)
+                self._changes.append((self._seq, topic))
+                restored += 1
+            self._generation += 1
+            self._evict()
+        return restored
+
+    def _evict(self):
+        # Caller holds the lock. The newest entry is always kept, even if it alone exceeds the budget.
+        if not self._over_budget():
+            return
+        self._apply_recent_reads()
+        while len(self._order) > 1 and self._over_budget():
+            topic, _ = self._order.popitem(last=False)
+            entry = self._entries.pop(topic)
+            self._bytes -= self._entry_size(topic, entry.value)
+            self.evictions += 1
+            self._generation += 1
+
+    def _over_budget(self):
+        return ((self.max_entries is not None and len(self._order) > self.max_entries) or
+                (self.max_bytes is not None and self._bytes > self.max_bytes))
+
+    def _apply_recent_reads(self):
+        # Caller holds the lock. Reads only leave a note, the LRU order is updated here.
+        while self._recent_reads:
+            topic = self._recent_reads.popleft()
+            if topic in self._order:
+                self._order.move_to_end(topic)
+
+    def get_entry(self, topic):
+        """Returns the CacheEntry for a topic (value, seq, timestamp), or None."""
+        entry = self._entries.get(topic)
+        if entry is not None and (self.max_entries is not None or self.max_bytes is not None):
+            self._recent_reads.append(topic)
+        return entry
 
     def get(self, topic):
         """Gets the value for a given topic."""
-        with self._lock:
-            return self._states.get(topic)
+        entry = self.get_entry(topic)
+        return entry.value if entry is not None else None
+
+    def _current_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot[0] == self._generation:
+            return snapshot
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+            generation = self._generation
+            if snapshot[0] != generation:
+                # Copying a dict of immutable entries is a single atomic operation, so it needs no
+                # writer lock. Writes that land after reading the generation make the copy newer
+                # than its label, and the next reader simply rebuilds it.
+                entries = _ReadOnlyDict(self._entries)
+                values = _ReadOnlyDict((topic, entry.value) for topic, entry in entries.items())
+                snapshot = (generation, entries, values)
+                self._snapshot = snapshot
+        return snapshot
+
+    def snapshot(self):
+        """Returns an immutable {topic: CacheEntry} view, shared by all readers of the same version."""
+        return self._current_snapshot()[1]
 
     def get_all(self):
-        """Returns a copy of all stored states."""
+        """Returns all stored states as a read-only {topic: value} dict, shared by all readers of the same version."""
+        return self._current_snapshot()[2]
+
+    def changes_since(self, seq):
+        """
+        Returns (latest_seq, {topic: CacheEntry}) for topics written after seq,
+        or None if the change log no longer reaches back that far (the caller
+        should then fall back to a full snapshot).
+        """
+        with self._lock:
+            latest = self._seq
+            if seq >= latest:
+                return latest, {}
+            if not self._changes or self._changes[0][0] > seq + 1:
+                return None
+            changed = {}
+            for change_seq, topic in reversed(self._changes):
+                if change_seq <= seq:
+                    break
+                if topic not in changed:
+                    entry = self._entries.get(topic)
+                    if entry is not None:
+                        changed[topic] = entry
+            return latest, changed
+
+    def subscribe(self, prefix="", max_buffer=256):
+        """
+        Registers a listener for changes of topics starting with prefix.
+        Writers never wait for listeners: a listener that falls more than
+        max_buffer changes behind is marked as overflowed and has to resync.
+        """
+        subscription = CacheSubscription(self, prefix, max_buffer)
+        with self._lock:
+            self._subscribers = self._subscribers + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+
+    def stats(self):
+        """Returns cache counters (entries, bytes, evictions, seq)."""
         with self._lock:
-            return self._states.copy()
\ No newline at end of file
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "seq": self._seq,
+            }
+
+class _ReadOnlyDict(dict):
+    """dict that refuses modification, so a shared snapshot cannot be changed by accident."""
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("StateCache snapshot is read-only")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class CacheSubscription:
+    """Bounded buffer of changes for one StateCache listener (e.g. one streaming HTTP client)."""
+    def __init__(self, cache, prefix, max_buffer):
+        self.cache = cache
+        self.prefix = prefix
+        self.max_buffer = max_buffer
+        self.overflows = 0
+        self._buffer = deque()
+        self._overflowed = False
+        self._cond = threading.Condition()
+
+    def _push(self, topic, entry):
+        # Called by the writer with the cache lock held, must never block for long.
+        if not topic.startswith(self.prefix):
+            return
+        with self._cond:
+            if self._overflowed:
+                return
+            if len(self._buffer) >= self.max_buffer:
+                self._buffer.clear()
+                self._overflowed = True
+                self.overflows += 1
+            else:
+                self._buffer.append((topic, entry))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Waits for changes and returns (changes, resync_seq). changes is a list of
+        (topic, CacheEntry). resync_seq is None normally; after an overflow it is
+        the cache sequence number from which the buffer is complete again, and the
+        listener should reload the full state.
+        """
+        with self._cond:
+            if not self._buffer and not self._overflowed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                self._overflowed = False
+                return [], self.cache.seq
+            changes = list(self._buffer)
+            self._buffer.clear()
+            return changes, None
+
+    def close(self):
+        self.cache.unsubscribe(self)
@@ -35,11 +35,34 @@ def get_status(topic=None):
     except requests.exceptions.RequestException as e:
         print(f"Chyba při odesílání požadavku na {url}: {e}")
 
+def stream_status(prefix=""):
+    """Sleduje změny stavů přes Server-Sent Events (GET /api/stream), dokud uživatel nestiskne Ctrl+C."""
+    url = f"{BASE_URL}/stream"
+    try:
+        with requests.get(url, params={"prefix": prefix}, stream=True, timeout=(5, None)) as response:
+            response.raise_for_status()
+            print("Sleduji změny (Ctrl+C pro ukončení)...")
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "change":
+                        print(f"[{data['seq']}] {data['topic']} = {data['value']}")
+                    elif event == "resync":
+                        print(f"Klient nestíhal, stav je potřeba načíst znovu (seq {data['seq']})")
+    except KeyboardInterrupt:
+        print()
+    except requests.exceptions.RequestException as e:
+        print(f"Chyba při odesílání požadavku na {url}: {e}")
+
 def print_help():
     print("\n--- HTTP Tester příkazy ---")
     print("  post <endpoint> <value>  - Pošle hodnotu na HTTP vstup (např. 'post /pocasi/teplota 21.5')")
     print("  get                      - Získá stav všech témat")
     print("  get <topic>              - Získá stav konkrétního tématu (např. 'get smarthome/light/hall/1/status')")
+    print("  stream [prefix]          - Průběžně vypisuje změny stavů (např. 'stream smarthome/light/')")
     print("  help                     - Zobrazí tuto nápovědu")
     print("  exit                     - Ukončí tester")
     print("----------------------------\n")
@@ -74,6 +97,8 @@ def main():
                     get_status(topic)
                 else:
                     get_status()
+            elif command == 'stream':
+                stream_status(user_input[1] if len(user_input) > 1 else "")
             else:
                 print(f"Neznámý příkaz: '{command}'. Napište 'help' pro nápovědu.")
 
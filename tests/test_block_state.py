@@ -0,0 +1,40 @@
+import copy
+import unittest
+
+from test_propagation import LUA_BLOCK_DIR, RecordingMQTT
+
+from block_manager import BlockManager
+from hardware_interface import HardwareInterface
+from state_cache import StateCache
+
+LOGIC = {"id": "logic", "lua_script": "logic_block.lua", "config": {"default_state": False},
+         "inputs": {}, "outputs": {"state": "t/logic"}}
+
+class BlockStateRestoreTest(unittest.TestCase):
+    def make_manager(self):
+        self.mqtt = RecordingMQTT()
+        manager = BlockManager(self.mqtt, HardwareInterface(), StateCache(), LUA_BLOCK_DIR)
+        self.addCleanup(manager.shutdown)
+        return manager
+
+    def test_warm_restart_publishes_restored_state_once(self):
+        manager = self.make_manager()
+        manager.load_blocks_from_config({"blocks": [LOGIC]}, {"logic": {"is_on": True}})
+        self.assertEqual(self.mqtt.values("t/logic"), ["true"])
+
+    def test_cold_start_publishes_default(self):
+        manager = self.make_manager()
+        manager.load_blocks_from_config({"blocks": [LOGIC]})
+        self.assertEqual(self.mqtt.values("t/logic"), ["false"])
+
+    def test_reload_of_changed_block_keeps_state_without_flapping(self):
+        manager = self.make_manager()
+        manager.load_blocks_from_config({"blocks": [LOGIC]}, {"logic": {"is_on": True}})
+        self.mqtt.published.clear()
+        changed = copy.deepcopy(LOGIC)
+        changed["config"]["note"] = "changed"
+        manager.apply_config({"blocks": [changed]})
+        self.assertEqual(self.mqtt.values("t/logic"), ["true"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from test_propagation import RecordingMQTT
+
+from block_manager import BlockManager
+from hardware_interface import HardwareInterface
+from state_cache import StateCache
+
+# Počítadlo je lokální proměnná skriptu (mimo M): každá instance musí mít vlastní
+COUNTER_SCRIPT = """
+local count = 0
+local block_id
+local M = {}
+function M.init(id) block_id = id end
+function M.on_input(input_name, value)
+    count = count + %d
+    py_set_mqtt_output(block_id, "count", count)
+end
+return M
+"""
+
+def counter(block_id):
+    return {"id": block_id, "lua_script": "counter.lua", "config": {}, "inputs": {}, "outputs": {"count": f"t/{block_id}"}}
+
+class ChunkCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.lua_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lua_dir)
+        self.write_script(1)
+        self.mqtt = RecordingMQTT()
+        self.manager = BlockManager(self.mqtt, HardwareInterface(), StateCache(), self.lua_dir)
+        self.addCleanup(self.manager.shutdown)
+
+        # Skript se čte jen kvůli kompilaci, počet čtení je tedy počet kompilací
+        self.path = os.path.join(self.lua_dir, "counter.lua")
+        reads = mock.patch("block_manager.open", side_effect=open, create=True)
+        self.open = reads.start()
+        self.addCleanup(reads.stop)
+
+    @property
+    def compiled(self):
+        return sum(1 for call in self.open.call_args_list if call.args[0] == self.path)
+
+    def write_script(self, step):
+        path = os.path.join(self.lua_dir, "counter.lua")
+        with open(path, "w") as f:
+            f.write(COUNTER_SCRIPT % step)
+        # Jiná signatura i v rámci stejného tiku hodin
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def test_script_is_compiled_once_and_instances_keep_own_locals(self):
+        self.manager.load_blocks_from_config({"blocks": [counter("a"), counter("b"), counter("c")]})
+        self.assertEqual(self.compiled, 1)
+
+        for block_id in ("a", "a", "b"):
+            self.manager.inject_input(block_id, "tick", True)
+        self.manager.process_events(0)
+        self.assertEqual(self.mqtt.values("t/a"), ["1", "2"])
+        self.assertEqual(self.mqtt.values("t/b"), ["1"])
+
+    def test_changed_script_is_recompiled(self):
+        first = self.manager._load_chunk(self.path)
+        self.assertIs(self.manager._load_chunk(self.path), first)
+        self.write_script(10)
+        self.assertIsNot(self.manager._load_chunk(self.path), first)
+        self.assertEqual(self.compiled, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from test_propagation import LUA_BLOCK_DIR, RecordingMQTT
+
+from block_manager import BlockManager
+from hardware_interface import HardwareInterface
+from state_cache import StateCache
+
+class PolledHardware(HardwareInterface):
+    def __init__(self):
+        super().__init__()
+        self.supports_change_notification = False
+
+class ShadowRegisterTest(unittest.TestCase):
+    def test_staged_writes_go_out_in_one_transaction(self):
+        hardware = HardwareInterface()
+        for pin in range(10, 20):
+            hardware.stage_digital_output(pin, True)
+        hardware.stage_digital_output(10, False) # přepsaný zápis téhož pinu se sloučí
+        self.assertFalse(hardware.digital_outputs[11]) # do flush se na pin nic nezapíše
+        before = hardware.transaction_count
+        self.assertEqual(hardware.flush_outputs(), 9) # pin 10 zůstal False
+        self.assertEqual(hardware.transaction_count - before, 1)
+        self.assertEqual([hardware.digital_outputs[pin] for pin in range(10, 20)], [False] + [True] * 9)
+
+    def test_flush_without_change_skips_the_bus(self):
+        hardware = HardwareInterface()
+        hardware.stage_digital_output(5, False)
+        before = hardware.transaction_count
+        self.assertEqual(hardware.flush_outputs(), 0)
+        self.assertEqual(hardware.transaction_count, before)
+
+    def test_direct_write_drives_the_pin_at_once(self):
+        hardware = HardwareInterface()
+        hardware.stage_digital_output(5, False)
+        hardware.write_digital_output(5, True)
+        self.assertTrue(hardware.digital_outputs[5])
+        # Starší zápis ze stínového registru už přímý zápis nepřepíše
+        hardware.flush_outputs()
+        self.assertTrue(hardware.digital_outputs[5])
+
+class ScanTransactionsTest(unittest.TestCase):
+    def test_one_read_and_one_write_per_scan(self):
+        pins = range(2, 10)
+        blocks = []
+        for pin in pins:
+            blocks.append({"id": f"in_{pin}", "lua_script": "digital_input_block.lua", "config": {"input_pin": pin},
+                           "inputs": {"pin": {"hardware_input": {"type": "digital", "address": pin}}},
+                           "outputs": {"state": f"t/in_{pin}"}})
+            blocks.append({"id": f"out_{pin}", "lua_script": "digital_output_block.lua", "config": {"output_pin": pin + 10},
+                           "inputs": {"set_state": {"source_block_id": f"in_{pin}", "source_output": "state"}},
+                           "outputs": {}})
+        hardware = PolledHardware()
+        manager = BlockManager(RecordingMQTT(), hardware, StateCache(), LUA_BLOCK_DIR)
+        self.addCleanup(manager.shutdown)
+        manager.load_blocks_from_config({"blocks": blocks})
+        manager.process_block_logic()
+
+        for pin in pins:
+            hardware.digital_inputs[pin] = True
+        before = hardware.transaction_count
+        manager.process_block_logic()
+        # Osm vstupů jedním čtením banky, osm výstupů jedním zápisem portu
+        self.assertEqual(hardware.transaction_count - before, 2)
+        self.assertTrue(all(hardware.digital_outputs[pin + 10] for pin in pins))
+
+if __name__ == "__main__":
+    unittest.main()
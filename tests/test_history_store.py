@@ -0,0 +1,89 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_store import HistoryStore, numeric_value
+
+class HistoryStoreTest(unittest.TestCase):
+    def make_store(self, path=None, **kwargs):
+        store = HistoryStore(path, **dict(dict(raw_capacity=4, minute_capacity=3, quarter_capacity=2), **kwargs))
+        self.addCleanup(store.stop)
+        return store
+
+    def record(self, store, samples):
+        for timestamp, value in samples:
+            store.record("t/temp", value, timestamp)
+
+    def test_numeric_values(self):
+        self.assertEqual([numeric_value(v) for v in ("21.5", " on ", "false", True, 3, "nan", "warm", None)],
+                         [21.5, 1.0, 0.0, 1.0, 3.0, None, None, None])
+
+    def test_tier_covering_start_is_chosen(self):
+        store = self.make_store()
+        self.record(store, [(0, 1), (30, 2), (60, 3), (90, 4), (120, 5), (150, 6)])
+
+        # Surový kruh (4 vzorky) přetekl, drží jen od t=60
+        raw = store.query("t/temp", 60, 150)
+        self.assertEqual((raw["resolution"], raw["timestamps"], raw["values"]), (0, [60, 90, 120, 150], [3, 4, 5, 6]))
+
+        minutes = store.query("t/temp", 0, 150)
+        self.assertEqual(minutes["resolution"], 60)
+        self.assertEqual((minutes["timestamps"], minutes["values"]), ([0, 60, 120], [1.5, 3.5, 5.5]))
+        self.assertEqual((minutes["min"], minutes["max"]), ([1, 3, 5], [2, 4, 6]))
+
+        quarters = store.query("t/temp", 0, 150, step=900)
+        self.assertEqual((quarters["resolution"], quarters["timestamps"], quarters["values"]), (900, [0], [3.5]))
+
+    def test_rollup_ring_wraps_around(self):
+        store = self.make_store()
+        self.record(store, [(0, 1), (30, 2), (60, 3), (90, 4), (120, 5), (150, 6), (180, 7), (240, 8)])
+        # Minutové řádky intervalů 0 a 60 přepsaly intervaly 180 a 240
+        minutes = store.query("t/temp", 120, 240, step=60)
+        self.assertEqual((minutes["timestamps"], minutes["values"]), ([120, 180, 240], [5.5, 7, 8]))
+        # Začátek mimo raw i minutový kruh -> 15min agregace
+        self.assertEqual(store.query("t/temp", 60, 240)["resolution"], 900)
+        self.assertEqual(store.query("t/temp", 125, 240)["resolution"], 0)
+
+        # Opožděný vzorek do přepsaného intervalu agregace nerozbije
+        store.record("t/temp", 100, 10)
+        self.assertEqual(store.query("t/temp", 120, 240, step=60)["values"], [5.5, 7, 8])
+
+    def test_step_merges_intervals(self):
+        store = self.make_store(raw_capacity=16)
+        self.record(store, [(0, 1), (30, 3), (60, 5), (90, 7)])
+        merged = store.query("t/temp", 0, 90, step=120)
+        self.assertEqual((merged["resolution"], merged["timestamps"], merged["values"]), (60, [0], [4]))
+        self.assertEqual((merged["min"], merged["max"]), ([1], [7]))
+        with self.assertRaises(ValueError):
+            store.query("t/temp", 0, 10**9, step=1)
+
+    def test_non_numeric_values_and_topic_limit(self):
+        store = self.make_store(max_topics=1)
+        self.assertFalse(store.record("t/text", "hello", 0))
+        self.assertTrue(store.record("t/a", 1, 0))
+        with self.assertLogs("history_store", "WARNING"):
+            self.assertFalse(store.record("t/b", 1, 0))
+        self.assertIsNone(store.query("t/b", 0, 10))
+        stats = store.stats()
+        self.assertEqual((stats["topics"], stats["ignored"], stats["rejected_topics"]), (1, 1, 1))
+
+    def test_history_survives_restart(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        first = HistoryStore(directory, raw_capacity=4, minute_capacity=3, quarter_capacity=2)
+        first.record("t/a", "1.5", 10)
+        first.record("t/b", "2.5", 20)
+        first.stop()
+
+        store = self.make_store(directory)
+        self.assertEqual(store.topics(), ["t/a", "t/b"])
+        self.assertEqual(store.query("t/b", 0, 100)["values"], [2.5])
+        store.record("t/c", 1, 30)
+        self.assertEqual(len(open(os.path.join(directory, "topics.idx")).readlines()), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from test_propagation import LUA_BLOCK_DIR, RecordingMQTT, passthrough
+
+from block_manager import BlockManager
+from config_watcher import ConfigWatcher
+from hardware_interface import HardwareInterface
+from state_cache import StateCache
+
+BROKEN_SCRIPT = "local M = {}\nfunction M.on_input(input_name, value\nreturn M\n"
+FAILING_INIT_SCRIPT = "local M = {}\nfunction M.init() error('no init today') end\nreturn M\n"
+
+class HotReloadTest(unittest.TestCase):
+    def setUp(self):
+        self.lua_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lua_dir)
+        shutil.copy(os.path.join(LUA_BLOCK_DIR, "logic_passthrough_block.lua"), self.lua_dir)
+        self.mqtt = RecordingMQTT()
+        self.manager = BlockManager(self.mqtt, HardwareInterface(), StateCache(), self.lua_dir)
+        self.addCleanup(self.manager.shutdown)
+        self.blocks = [passthrough("a"), passthrough("b", "a")]
+        self.manager.load_blocks_from_config({"blocks": self.blocks})
+
+    def write_script(self, name, source):
+        path = os.path.join(self.lua_dir, name)
+        with open(path, "w") as f:
+            f.write(source)
+        # Jiná signatura i v rámci stejného tiku hodin
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def assert_chain_works(self, value):
+        self.manager.inject_input("a", "trigger", value)
+        self.manager.process_events(0)
+        self.assertEqual(self.mqtt.values("t/b")[-1], value)
+
+    def test_script_that_fails_to_compile_keeps_running_block(self):
+        self.write_script("broken.lua", BROKEN_SCRIPT)
+        blocks = copy.deepcopy(self.blocks)
+        blocks[0]["lua_script"] = "broken.lua"
+        report = self.manager.apply_config({"blocks": blocks})
+        self.assertEqual(report["failed"], ["a"])
+        self.assertEqual(report["changed"], [])
+        self.assert_chain_works("1")
+
+        # Opravený skript se při dalším reloadu zkusí znovu
+        shutil.copy(os.path.join(LUA_BLOCK_DIR, "logic_passthrough_block.lua"), os.path.join(self.lua_dir, "broken.lua"))
+        report = self.manager.apply_config({"blocks": blocks})
+        self.assertEqual((report["changed"], report["failed"]), (["a"], []))
+        self.assert_chain_works("2")
+
+    def test_block_whose_init_fails_is_rolled_back(self):
+        self.write_script("failing.lua", FAILING_INIT_SCRIPT)
+        blocks = copy.deepcopy(self.blocks)
+        blocks[0]["lua_script"] = "failing.lua"
+        blocks[1]["config"] = {"note": "changed too"}
+        report = self.manager.apply_config({"blocks": blocks})
+        self.assertEqual(report["failed"], ["a"])
+        self.assertEqual(report["changed"], ["b"])
+        # Původní instance 'a' běží dál a nový 'b' je na ni znovu napojený
+        self.assertEqual(self.manager.block_instances["a"]["definition"]["lua_script"], "logic_passthrough_block.lua")
+        self.assert_chain_works("3")
+
+class ConfigWatcherRetryTest(unittest.TestCase):
+    def test_failed_reload_is_retried(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        config_file = os.path.join(directory, "config.json")
+        with open(config_file, "w") as f:
+            f.write("{}")
+
+        calls = []
+        done = threading.Event()
+
+        def on_change(changed_paths):
+            calls.append(changed_paths)
+            if len(calls) == 1:
+                raise TimeoutError("dispatcher busy")
+            if len(calls) == 2:
+                return False
+            done.set()
+
+        watcher = ConfigWatcher(config_file, directory, on_change, interval=0.01, settle=0.01, retry_interval=0.05)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+        with open(config_file, "w") as f:
+            f.write('{"blocks": []}')
+        self.assertTrue(done.wait(5))
+        self.assertEqual(calls, [[config_file]] * 3)
+        self.assertEqual(watcher.retries, 2)
+
+if __name__ == "__main__":
+    unittest.main()
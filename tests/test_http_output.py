@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_output import HttpOutputPool
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Lokální HTTP server: /ok -> 200, /missing -> 404, /slow a /gate čekají."""
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.received.append((self.path, body.decode()))
+        if self.path == "/slow":
+            time.sleep(1.0)
+        elif self.path == "/gate":
+            self.server.gate.wait(5)
+        status = 404 if self.path == "/missing" else 200
+        reply = f"{self.path}:{body.decode()}".encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+        except OSError:
+            pass # klient to po timeoutu vzdal
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+class HttpOutputPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.received = []
+        self.server.gate = threading.Event()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.gate.set)
+
+        self.responses = []
+        self.changed = threading.Condition()
+        self.pool = HttpOutputPool(workers=2, per_block_limit=1, timeout=0.3, on_response=self.on_response)
+        self.addCleanup(self.pool.stop)
+
+    def on_response(self, block_id, status, body):
+        with self.changed:
+            self.responses.append((block_id, status, body))
+            self.changed.notify_all()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def wait_responses(self, count):
+        with self.changed:
+            self.assertTrue(self.changed.wait_for(lambda: len(self.responses) >= count, 5))
+        return list(self.responses)
+
+    def test_success_client_error_and_timeout(self):
+        self.pool.submit("ok", "post", self.url("/ok"), "1")
+        self.pool.submit("missing", "POST", self.url("/missing"), "2")
+        responses = dict((block_id, (status, body)) for block_id, status, body in self.wait_responses(2))
+        self.assertEqual(responses["ok"], (200, "/ok:1"))
+        self.assertEqual(responses["missing"], (404, "/missing:2"))
+
+        self.pool.submit("slow", "POST", self.url("/slow"), "3")
+        block_id, status, body = self.wait_responses(3)[2]
+        self.assertEqual((block_id, status), ("slow", None))
+        self.assertIn("timed out", body)
+        self.assertEqual(self.pool.stats()["completed"], 1)
+        self.assertEqual(self.pool.stats()["failed"], 2)
+
+    def test_unsupported_method_is_reported_to_the_block(self):
+        self.pool.submit("relay", "DELETE", self.url("/ok"), "")
+        self.assertEqual(self.wait_responses(1), [("relay", None, "Unsupported HTTP method 'DELETE'")])
+        self.assertEqual(self.pool.stats()["failed"], 1)
+        self.assertEqual(self.server.received, [])
+
+    def test_newer_request_of_a_block_supersedes_queued_one(self):
+        self.pool.submit("relay", "POST", self.url("/gate"), "on")
+        while not self.server.received:
+            time.sleep(0.01)
+        # První požadavek bloku je rozpracovaný, čekající se nahrazují nejnovějším
+        self.pool.submit("relay", "POST", self.url("/ok"), "off")
+        self.pool.submit("relay", "POST", self.url("/ok"), "on again")
+        self.pool.submit("other", "POST", self.url("/ok"), "x")
+        self.assertEqual(self.wait_responses(1), [("other", 200, "/ok:x")])
+        self.server.gate.set()
+        self.assertEqual([body for _, _, body in self.wait_responses(3)[1:]], ["/gate:on", "/ok:on again"])
+        self.assertEqual(self.pool.stats()["superseded"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
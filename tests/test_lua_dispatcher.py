@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lua_dispatcher import COALESCE, DROP_OLDEST, LuaDispatcher
+
+class DispatcherQueueTest(unittest.TestCase):
+    def test_overflow_drops_oldest_events_but_not_units(self):
+        seen = []
+        dispatcher = LuaDispatcher(max_queue=3, policy=DROP_OLDEST)
+        self.assertTrue(dispatcher.submit_unit(seen.append, "unit"))
+        for value in range(5):
+            dispatcher.submit(("input", "a", "x"), seen.append, value)
+        dispatcher.process(0)
+        self.assertEqual(seen, ["unit", 3, 4])
+        self.assertEqual(dispatcher.stats()["dropped"], 3)
+        self.assertEqual(dispatcher.depth(), 0)
+
+    def test_drop_oldest_keeps_every_value_below_capacity(self):
+        seen = []
+        dispatcher = LuaDispatcher(max_queue=16)
+        for value in range(5):
+            dispatcher.submit(("input", "a", "x"), seen.append, value)
+        dispatcher.process(0)
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+
+    def test_coalesce_merges_only_under_pressure(self):
+        seen = []
+        dispatcher = LuaDispatcher(max_queue=8, policy=COALESCE)
+        for value in range(6):
+            dispatcher.submit(("input", "a", "x"), seen.append, value)
+        dispatcher.process(0)
+        # Do poloviny fronty se nic neslučuje, pak se přepisuje jen poslední čekající hodnota
+        self.assertEqual(seen, [0, 1, 2, 5])
+        self.assertEqual(dispatcher.stats()["coalesced"], 2)
+
+class DispatcherCallTest(unittest.TestCase):
+    def start_loop(self, dispatcher):
+        stop = threading.Event()
+
+        def loop():
+            while not stop.is_set():
+                dispatcher.process(0.01)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+
+    def test_call_returns_result_and_raises_errors_from_dispatcher_thread(self):
+        dispatcher = LuaDispatcher()
+        self.start_loop(dispatcher)
+        self.assertTrue(dispatcher.call(dispatcher.in_dispatcher_thread, timeout=5))
+        with self.assertRaises(ZeroDivisionError):
+            dispatcher.call(lambda: 1 / 0, timeout=5)
+
+    def test_call_survives_overflow(self):
+        seen = []
+        dispatcher = LuaDispatcher(max_queue=2)
+        result = {}
+        caller = threading.Thread(target=lambda: result.setdefault("value", dispatcher.call(lambda: "done", timeout=5)))
+        caller.start()
+        while dispatcher.depth() == 0:
+            pass
+        for value in range(10):
+            dispatcher.submit(None, seen.append, value)
+        while caller.is_alive():
+            dispatcher.process(0.01)
+        self.assertEqual(result["value"], "done")
+        # Čekající volání zabírá jedno ze dvou míst a přetečení ho nezahodí
+        self.assertEqual(seen, [9])
+
+    def test_timed_out_call_never_runs(self):
+        ran = []
+        dispatcher = LuaDispatcher()
+        with self.assertRaises(TimeoutError):
+            dispatcher.call(ran.append, 1, timeout=0.05)
+        self.assertEqual(dispatcher.depth(), 0)
+        self.assertEqual(dispatcher.process(0), 0)
+        self.assertEqual(ran, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from metrics import OTHER_TOPIC, Metrics
+from state_cache import StateCache
+from web_server import create_app
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+def parse_exposition(text):
+    """Rozebere textový formát Prometheus: vrací ({metrika: typ}, [(název, {labely}, hodnota)])."""
+    types, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, metric_type = line.split(" ")
+            types[name] = metric_type
+        elif line.startswith("#") or not line:
+            continue
+        else:
+            match = SAMPLE.match(line)
+            if match is None:
+                raise ValueError(f"Invalid sample line: {line!r}")
+            labels = dict(LABEL.findall(match.group(2) or ""))
+            samples.append((match.group(1), labels, float(match.group(3))))
+    return types, samples
+
+class MetricsExpositionTest(unittest.TestCase):
+    def test_api_metrics_is_valid_exposition(self):
+        metrics = Metrics()
+        metrics.observe_block_call("lamp", "on_input", 0.0003)
+        metrics.observe_block_call("lamp", "on_input", 0.2)
+        metrics.message_in('home/"quoted"/temp', 0.0001)
+        metrics.message_out("home/lamp")
+        metrics.add_collector(lambda: {"dispatcher_depth": 3})
+        client = create_app(None, [], StateCache(), os.path.join(ROOT, "lua_blocks"), metrics=metrics).test_client()
+
+        response = client.get("/api/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        types, samples = parse_exposition(response.get_data(as_text=True))
+
+        for name, _, _ in samples:
+            base = re.sub(r"_(bucket|sum|count)$", "", name)
+            self.assertTrue(name in types or base in types, f"{name} has no TYPE line")
+        buckets = [(labels["le"], value) for name, labels, value in samples
+                   if name == "smarthome_block_call_seconds_bucket" and labels["block"] == "lamp"]
+        counts = [value for _, value in buckets]
+        self.assertEqual(counts, sorted(counts)) # kumulativní koše
+        self.assertEqual(buckets[-1], ("+Inf", 2.0))
+        self.assertIn(("smarthome_mqtt_messages_received_total", {"topic": 'home/\\"quoted\\"/temp'}, 1.0), samples)
+        self.assertIn(("smarthome_dispatcher_depth", {}, 3.0), samples)
+
+    def test_topic_labels_are_capped(self):
+        metrics = Metrics(max_topics=3)
+        for index in range(10):
+            metrics.message_out(f"t/{index}")
+        metrics.message_out("t/0")
+        _, samples = parse_exposition(metrics.render())
+        published = {labels["topic"]: value for name, labels, value in samples
+                     if name == "smarthome_mqtt_messages_published_total"}
+        self.assertEqual(published, {"t/0": 2.0, "t/1": 1.0, "t/2": 1.0, OTHER_TOPIC: 7.0})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mqtt_client import MQTTClient
+from state_cache import StateCache
+
+class FakePahoClient:
+    """Náhrada paho klienta: jen si zapisuje odběry na brokeru."""
+    def __init__(self):
+        self.subscribed = []
+        self.unsubscribed = []
+
+    def is_connected(self):
+        return True
+
+    def subscribe(self, topic):
+        self.subscribed.append(topic)
+
+    def unsubscribe(self, topic):
+        self.unsubscribed.append(topic)
+
+class UnsubscribeTest(unittest.TestCase):
+    def make_client(self, cache_topics):
+        client = MQTTClient("localhost", 1883, StateCache(), cache_topics=cache_topics)
+        self.addCleanup(client.outbox.stop, 0)
+        client.client = FakePahoClient()
+        return client
+
+    def test_last_handler_unsubscribes_at_broker(self):
+        client = self.make_client(cache_topics=("dashboard/#",))
+        first, second = (lambda topic, payload: None), (lambda topic, payload: None)
+        client.subscribe("home/light", first)
+        client.subscribe("home/light", second)
+        client.unsubscribe("home/light", first)
+        self.assertEqual(client.client.unsubscribed, [])
+        client.unsubscribe("home/light", second)
+        self.assertEqual(client.client.unsubscribed, ["home/light"])
+        self.assertNotIn("home/light", client.subscriptions)
+
+    def test_cache_topic_stays_subscribed(self):
+        client = self.make_client(cache_topics=("home/#",))
+        client.subscribe("home/#", lambda topic, payload: None)
+        client.unsubscribe("home/#")
+        self.assertEqual(client.client.unsubscribed, [])
+        self.assertNotIn("home/#", client.message_handlers)
+
+class OnMessageTest(unittest.TestCase):
+    def test_repeated_payload_is_decoded_once(self):
+        client = MQTTClient("localhost", 1883, StateCache())
+        self.addCleanup(client.outbox.stop, 0)
+        received = []
+        client.subscribe("t/temp", lambda topic, payload: received.append(payload))
+        for raw in (b"21.5", b"21.5", b"22.0"):
+            client._on_message(None, None, SimpleNamespace(topic="t/temp", payload=raw))
+        self.assertEqual(received, ["21.5", "21.5", "22.0"])
+        # Stejné bajty -> tentýž řetězec, cache dekodérů vstupů pak porovná jen identitu
+        self.assertIs(received[0], received[1])
+        self.assertEqual(client.state_cache.get("t/temp"), "22.0")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mqtt_outbox import OutboundQueue
+
+class RecordingSender:
+    """Náhrada MQTT klienta pro OutboundQueue: zprávy jen zapisuje (QoS 0 i vyšší hned potvrdí)."""
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, topic, payload, qos, retain):
+        with self._lock:
+            self.sent.append((topic, payload, qos, retain))
+        return True, None
+
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if len(self.sent) >= count:
+                    return list(self.sent)
+            time.sleep(0.01)
+        return list(self.sent)
+
+class OutboundQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.spool_path = os.path.join(self.directory, "outbox.spool")
+
+    def make_queue(self, sender, **kwargs):
+        queue = OutboundQueue(sender, **kwargs)
+        self.addCleanup(queue.stop, 0)
+        return queue
+
+    def test_coalescing_keeps_newest_payload_and_highest_qos(self):
+        sender = RecordingSender()
+        queue = self.make_queue(sender)
+        queue.put("t/a", "1", qos=1)
+        queue.put("t/b", "x")
+        queue.put("t/a", "2", qos=0)
+        queue.set_connected(True)
+        # Sloučená zpráva si drží pořadí první čekající hodnoty
+        self.assertEqual(sender.wait_for(2), [("t/a", "2", 1, False), ("t/b", "x", 0, False)])
+        self.assertEqual(queue.stats()["coalesced"], 1)
+
+    def test_overflow_is_spooled_and_replayed_before_queue(self):
+        sender = RecordingSender()
+        queue = self.make_queue(sender, max_queue=2, spool_path=self.spool_path)
+        for index in range(5):
+            queue.put(f"t/{index}", str(index))
+        self.assertEqual(queue.stats()["spooled"], 3)
+        queue.set_connected(True)
+        sent = sender.wait_for(5)
+        self.assertEqual([payload for _, payload, _, _ in sent], ["0", "1", "2", "3", "4"])
+        self.assertEqual(queue.stats()["replayed"], 3)
+        self.assertEqual(os.path.getsize(self.spool_path), 0)
+
+    def test_unsent_messages_survive_restart(self):
+        first = OutboundQueue(RecordingSender(), spool_path=self.spool_path)
+        first.put("t/a", "1", qos=1, retain=True)
+        first.put("t/b", "2")
+        first.stop(0)
+
+        sender = RecordingSender()
+        queue = self.make_queue(sender, spool_path=self.spool_path)
+        queue.set_connected(True)
+        self.assertEqual(sender.wait_for(2), [("t/a", "1", 1, True), ("t/b", "2", 0, False)])
+
+    def test_full_spool_drops_messages(self):
+        sender = RecordingSender()
+        queue = self.make_queue(sender, max_queue=1, spool_path=self.spool_path, spool_max_bytes=20)
+        for index in range(3):
+            queue.put(f"t/{index}", str(index))
+        stats = queue.stats()
+        self.assertEqual((stats["spooled"], stats["spool_dropped"], stats["dropped"]), (1, 1, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from block_manager import BlockManager, EchoFilter
+from hardware_interface import HardwareInterface
+from mqtt_client import encode_payload
+from state_cache import StateCache
+
+LUA_BLOCK_DIR = os.path.join(ROOT, "lua_blocks")
+
+# Blok se třemi vstupy, který publikuje, co dostal v jednom volání on_inputs
+FAN_IN_SCRIPT = """
+local M = {}
+local block_id
+function M.init(id) block_id = id end
+function M.on_inputs(changes)
+    local seen = {}
+    for input_name, value in pairs(changes) do
+        seen[#seen + 1] = input_name .. "=" .. tostring(value)
+    end
+    table.sort(seen)
+    py_set_mqtt_output(block_id, "seen", table.concat(seen, ","))
+end
+return M
+"""
+
+class RecordingMQTT:
+    """Náhrada MQTTClient: jen si zapisuje publikace."""
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, encode_payload(payload)))
+
+    def subscribe(self, topic, callback_func):
+        pass
+
+    def unsubscribe(self, topic, callback_func=None):
+        pass
+
+    def values(self, topic):
+        return [payload for published_topic, payload in self.published if published_topic == topic]
+
+class EchoingMQTT(RecordingMQTT):
+    """Náhrada brokeru, který publikaci vrátí všem odběratelům tématu (včetně odesílatele)."""
+    def __init__(self):
+        super().__init__()
+        self.handlers = {}
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        super().publish(topic, payload, qos, retain)
+        for handler in list(self.handlers.get(topic, ())):
+            handler(topic, encode_payload(payload))
+
+    def subscribe(self, topic, callback_func):
+        self.handlers.setdefault(topic, []).append(callback_func)
+
+    def unsubscribe(self, topic, callback_func=None):
+        self.handlers.pop(topic, None)
+
+def passthrough(block_id, source=None, input_name="trigger"):
+    return {"id": block_id, "lua_script": "logic_passthrough_block.lua", "config": {},
+            "inputs": {input_name: {"source_block_id": source, "source_output": "output_1"}} if source else {},
+            "outputs": {"output_1": f"t/{block_id}"}}
+
+class OrderedPropagationTest(unittest.TestCase):
+    def make_manager(self, blocks, lua_dir=LUA_BLOCK_DIR, **kwargs):
+        self.mqtt = RecordingMQTT()
+        self.hardware = HardwareInterface()
+        manager = BlockManager(self.mqtt, self.hardware, StateCache(), lua_dir,
+                               dispatcher_config={"policy": "drop_oldest"}, **kwargs)
+        manager.load_blocks_from_config({"blocks": blocks})
+        self.addCleanup(manager.shutdown)
+        self.mqtt.published.clear()
+        return manager
+
+    def test_quick_press_in_one_batch_toggles_logic(self):
+        blocks = [
+            {"id": "btn", "lua_script": "digital_input_block.lua", "config": {"input_pin": 4},
+             "inputs": {"pin": {"hardware_input": {"type": "digital", "address": 4}}},
+             "outputs": {"state": "t/btn/state"}},
+            {"id": "logic", "lua_script": "logic_block.lua", "config": {"default_state": False},
+             "inputs": {"toggle": {"source_block_id": "btn", "source_output": "state"}},
+             "outputs": {"state": "t/logic/state"}},
+        ]
+        for ordered in (False, True):
+            with self.subTest(ordered_propagation=ordered):
+                manager = self.make_manager(blocks, ordered_propagation=ordered)
+                # Stisk a uvolnění dorazí dřív, než hlavní smyčka zpracuje první z nich
+                manager._on_hardware_input_event("digital", 4, True)
+                manager._on_hardware_input_event("digital", 4, False)
+                self.assertEqual(manager.process_events(0), 2)
+                self.assertEqual(self.mqtt.values("t/btn/state"), ["true", "false"])
+                self.assertEqual(self.mqtt.values("t/logic/state"), ["true"])
+
+    def test_chain_receives_every_value_in_order(self):
+        manager = self.make_manager([passthrough("a"), passthrough("b", "a"), passthrough("c", "b")])
+        for value in range(5):
+            manager.inject_input("a", "trigger", value)
+        manager.process_events(0)
+        self.assertEqual(self.mqtt.values("t/c"), ["0", "1", "2", "3", "4"])
+
+    def test_on_inputs_gets_all_changed_inputs_at_once(self):
+        lua_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lua_dir)
+        shutil.copy(os.path.join(LUA_BLOCK_DIR, "logic_passthrough_block.lua"), lua_dir)
+        with open(os.path.join(lua_dir, "fan_in.lua"), "w") as f:
+            f.write(FAN_IN_SCRIPT)
+
+        blocks = [passthrough("src")]
+        blocks += [passthrough(f"mid_{i}", "src") for i in range(3)]
+        blocks.append({"id": "fan_in", "lua_script": "fan_in.lua", "config": {},
+                       "inputs": {name: {"source_block_id": f"mid_{i}", "source_output": "output_1"}
+                                  for i, name in enumerate("abc")},
+                       "outputs": {"seen": "t/fan_in"}})
+        manager = self.make_manager(blocks, lua_dir=lua_dir)
+        manager.inject_input("src", "trigger", 1)
+        manager.process_events(0)
+        # Tři paralelní bloky a jedno volání on_inputs se všemi třemi vstupy
+        self.assertEqual(manager.propagation_stats()["invocations"], 4)
+        self.assertEqual(self.mqtt.values("t/fan_in"), ["a=1,b=1,c=1"])
+
+        # Dvě hodnoty téhož vstupu v jedné dávce se nesloučí: vstup je ve volání nejvýš jednou
+        # a každý vstup dostane obě hodnoty ve správném pořadí
+        manager.inject_input("src", "trigger", 2)
+        manager.inject_input("src", "trigger", 3)
+        manager.process_events(0)
+        received = {name: [] for name in "abc"}
+        for call in self.mqtt.values("t/fan_in")[1:]:
+            for name, value in (item.split("=") for item in call.split(",")):
+                received[name].append(value)
+        self.assertEqual(received, {name: ["2", "3"] for name in "abc"})
+
+class EchoFilterTest(unittest.TestCase):
+    def test_each_expectation_swallows_one_message(self):
+        echoes = EchoFilter()
+        echoes.expect("t/a", 5)
+        self.assertTrue(echoes.consume("t/a", "5"))
+        self.assertFalse(echoes.consume("t/a", "5"))
+
+    def test_expectation_expires(self):
+        echoes = EchoFilter(ttl=0.05)
+        echoes.expect("t/a", 5)
+        time.sleep(0.1)
+        self.assertFalse(echoes.consume("t/a", "5"))
+
+    def test_foreign_message_with_same_value_is_swallowed_instead_of_echo(self):
+        # Známé omezení: zprávy se rozlišují jen podle tématu a payloadu. Cizí zpráva se stejnou
+        # hodnotou, která předběhne naši ozvěnu, se zahodí a ozvěna se pak doručí místo ní.
+        echoes = EchoFilter()
+        echoes.expect("t/a", 5)
+        self.assertTrue(echoes.consume("t/a", "5"))  # cizí publikace
+        self.assertFalse(echoes.consume("t/a", "5")) # naše ozvěna
+
+    def test_echo_from_broker_is_not_delivered_twice(self):
+        mqtt = EchoingMQTT()
+        manager = BlockManager(mqtt, HardwareInterface(), StateCache(), LUA_BLOCK_DIR)
+        self.addCleanup(manager.shutdown)
+        manager.load_blocks_from_config({"blocks": [passthrough("a"), passthrough("b", "a"), passthrough("c", "b")]})
+        mqtt.published.clear()
+        manager.inject_input("a", "trigger", 5)
+        # Ozvěny z brokeru se zařadí do fronty, zpracujeme je až do vyprázdnění
+        while manager.process_events(0):
+            pass
+        self.assertEqual(mqtt.values("t/b"), ["5"])
+        self.assertEqual(mqtt.values("t/c"), ["5"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import time
+import unittest
+
+from test_propagation import LUA_BLOCK_DIR, RecordingMQTT, passthrough
+
+from block_manager import BlockManager
+from hardware_interface import HardwareInterface
+from publish_policy import COALESCED, DEFER, PUBLISH, SUPPRESS, OutputPolicy, parse_publish_policies
+from state_cache import StateCache
+
+def offer_and_publish(policy, value, now):
+    decision = policy.offer(value, now)
+    if decision == PUBLISH:
+        policy.mark_published(value, now)
+    return decision
+
+class OutputPolicyTest(unittest.TestCase):
+    def test_on_change_suppresses_repeated_value(self):
+        policy = OutputPolicy(on_change=True)
+        self.assertEqual([offer_and_publish(policy, value, 0) for value in (True, True, False)],
+                         [PUBLISH, SUPPRESS, PUBLISH])
+        self.assertEqual((policy.published, policy.suppressed), (2, 1))
+
+    def test_deadband_compares_with_last_published_value(self):
+        policy = OutputPolicy(deadband=0.5)
+        self.assertEqual([offer_and_publish(policy, value, 0) for value in (20.0, 20.3, 20.45, 20.6)],
+                         [PUBLISH, SUPPRESS, SUPPRESS, PUBLISH])
+
+    def test_min_interval_defers_and_keeps_latest(self):
+        policy = OutputPolicy(min_interval=1.0)
+        self.assertEqual(offer_and_publish(policy, 1, 10.0), PUBLISH)
+        self.assertEqual(offer_and_publish(policy, 2, 10.2), DEFER)
+        self.assertEqual(policy.due, 11.0)
+        self.assertEqual(offer_and_publish(policy, 3, 10.4), COALESCED)
+        self.assertEqual(policy.take_pending(), (True, 3))
+        self.assertEqual(policy.take_pending(), (False, None))
+
+    def test_coalesce_window_delays_first_value(self):
+        policy = OutputPolicy(coalesce=0.5)
+        self.assertEqual(offer_and_publish(policy, 1, 0.0), DEFER)
+        self.assertEqual(policy.due, 0.5)
+
+    def test_wildcard_applies_to_outputs_without_own_entry(self):
+        policies = parse_publish_policies("b", {"publish_policy": {"*": {"on_change": True}, "raw": {"min_interval": 2}}},
+                                          {"state": "t/state", "raw": "t/raw"})
+        self.assertTrue(policies["state"].on_change)
+        self.assertEqual((policies["raw"].on_change, policies["raw"].min_interval), (False, 2.0))
+
+class PolicyOnlyLimitsBrokerTest(unittest.TestCase):
+    def make_manager(self, policy):
+        self.mqtt = RecordingMQTT()
+        source = passthrough("a")
+        source["config"] = {"publish_policy": {"output_1": policy}}
+        manager = BlockManager(self.mqtt, HardwareInterface(), StateCache(), LUA_BLOCK_DIR)
+        self.addCleanup(manager.shutdown)
+        manager.load_blocks_from_config({"blocks": [source, passthrough("b", "a")]})
+        self.mqtt.published.clear()
+        return manager
+
+    def test_suppressed_value_still_reaches_linked_block(self):
+        manager = self.make_manager({"on_change": True})
+        for value in (5, 5, 6):
+            manager.inject_input("a", "trigger", value)
+        manager.process_events(0)
+        self.assertEqual(self.mqtt.values("t/a"), ["5", "6"])
+        self.assertEqual(self.mqtt.values("t/b"), ["5", "5", "6"])
+
+    def test_coalesced_values_reach_linked_block_immediately(self):
+        manager = self.make_manager({"coalesce": 0.05})
+        for value in (1, 2, 3):
+            manager.inject_input("a", "trigger", value)
+        manager.process_events(0)
+        self.assertEqual(self.mqtt.values("t/a"), [])
+        self.assertEqual(self.mqtt.values("t/b"), ["1", "2", "3"])
+        time.sleep(0.1)
+        manager.process_events(0)
+        self.assertEqual(self.mqtt.values("t/a"), ["3"])
+
+if __name__ == "__main__":
+    unittest.main()
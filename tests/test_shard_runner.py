@@ -0,0 +1,32 @@
+import time
+import unittest
+
+from test_propagation import LUA_BLOCK_DIR, EchoingMQTT, passthrough
+
+from hardware_interface import HardwareInterface
+from shard_runner import ShardedRuntime
+from state_cache import StateCache
+
+class ShardEchoTest(unittest.TestCase):
+    def wait_for(self, predicate, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.02)
+
+    def test_echo_of_link_inside_one_shard_is_not_delivered_again(self):
+        mqtt = EchoingMQTT()
+        runtime = ShardedRuntime({"blocks": [passthrough("a"), passthrough("b", "a")]}, 1, mqtt,
+                                 HardwareInterface(), StateCache(), LUA_BLOCK_DIR, options={"log_level": "WARNING"})
+        runtime.start()
+        self.addCleanup(runtime.shutdown)
+
+        runtime.inject_input("a", "trigger", 5)
+        self.wait_for(lambda: mqtt.values("t/b"))
+        time.sleep(0.3) # případná druhá (duplicitní) hodnota by dorazila hned po první
+        self.assertEqual(mqtt.values("t/a"), ["5"])
+        self.assertEqual(mqtt.values("t/b"), ["5"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signal_conditioning import AnalogConditioner, build_conditioners, np, parse_conditioning
+
+def spec(**settings):
+    return parse_conditioning("block", "input", settings or {"sample_interval": 0.1})
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class AnalogConditionerTest(unittest.TestCase):
+    def feed(self, conditioner, samples, step=0.1):
+        """Vrací nahlášené hodnoty prvního kanálu (None = vzorek se nehlásil)."""
+        reported = []
+        for index, value in enumerate(samples):
+            indexes, values = conditioner.update([value], index * step)
+            reported.append(float(values[0]) if indexes.size else None)
+        return reported
+
+    def test_deadband_reports_only_large_changes(self):
+        conditioner = AnalogConditioner([spec(deadband=5)], [0], [0])
+        self.assertEqual(self.feed(conditioner, [100, 103, 106, 104, 101]), [100, None, 106, None, 101])
+
+    def test_hysteresis_applies_on_direction_reversal(self):
+        conditioner = AnalogConditioner([spec(deadband=2, hysteresis=3)], [0], [0])
+        # Nahoru o 3 projde, zpět o 2 ne (obrat chce 2 + 3), o 5 ano, dál stejným směrem stačí 2
+        self.assertEqual(self.feed(conditioner, [100, 103, 101, 98, 96]), [100, 103, None, 98, 96])
+
+    def test_report_interval_delays_but_keeps_change(self):
+        conditioner = AnalogConditioner([spec(report_interval=1.0)], [0], [0])
+        self.assertEqual(self.feed(conditioner, [100, 200, 200, 200], step=0.5), [100, None, 200, None])
+
+    def test_median_removes_spike(self):
+        conditioner = AnalogConditioner([spec(median=3)], [0], [0])
+        self.assertEqual(self.feed(conditioner, [100, 100, 900, 100]), [100, None, None, None])
+
+    def test_average_and_ema_smoothing(self):
+        average = AnalogConditioner([spec(smoothing="average", window=2)], [0], [0])
+        self.assertEqual(self.feed(average, [0, 10, 10]), [0, 5, 10])
+        ema = AnalogConditioner([spec(smoothing="ema", alpha=0.5)], [0], [0])
+        self.assertEqual(self.feed(ema, [0, 10, 10]), [0, 5, 7.5])
+
+    def test_missing_sample_keeps_last_value(self):
+        conditioner = AnalogConditioner([spec(smoothing="average", window=4)], [0], [0])
+        self.assertEqual(self.feed(conditioner, [100, None, None]), [100, None, None])
+
+    def test_initial_value_is_taken_over(self):
+        conditioner = AnalogConditioner([spec(deadband=5)], [0], [0], initial_values=[100])
+        self.assertEqual(self.feed(conditioner, [102, 110]), [None, 110])
+
+    def test_channels_are_independent(self):
+        conditioner = AnalogConditioner([spec(deadband=5), spec(deadband=0.5)], [0, 1], [7, 8])
+        conditioner.update([100, 100], 0.0)
+        indexes, values = conditioner.update([102, 102], 0.1)
+        self.assertEqual(indexes.tolist(), [1])
+        self.assertEqual(values.tolist(), [102])
+
+class ParseConditioningTest(unittest.TestCase):
+    def test_input_without_settings_is_left_alone(self):
+        self.assertIsNone(parse_conditioning("block", "input", {"type": "analog", "address": 0}))
+
+    def test_invalid_settings_are_rejected(self):
+        for settings in ({"smoothing": "kalman"}, {"alpha": 0}, {"window": 0}, {"deadband": "wide"}):
+            with self.subTest(settings=settings):
+                with self.assertLogs("signal_conditioning", "ERROR"):
+                    self.assertIsNone(parse_conditioning("block", "input", settings))
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_channels_are_grouped_by_sample_interval(self):
+        channels = [(0, 10, spec(sample_interval=0.1)), (1, 11, spec(sample_interval=1.0)), (2, 12, spec(sample_interval=0.1))]
+        conditioners = build_conditioners(channels, {2: 55})
+        self.assertEqual([(c.sample_interval, c.slots, c.addresses) for c in conditioners],
+                         [(0.1, [0, 2], [10, 12]), (1.0, [1], [11])])
+        self.assertEqual(conditioners[0]._reported[1], 55)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from snapshot import _HEADER, MAGIC, SnapshotWriter, load_snapshot, write_snapshot
+from state_cache import StateCache
+
+BLOCK_STATES = {
+    "logic": {"is_on": True, "count": 2**70, "level": -3, "ratio": 0.25, "name": "Kuchyň ☀", "raw": b"\x00\xff",
+              "history": [1, [None, False]], "nested": {1: "one", "two": (2.5,)}},
+}
+
+class SnapshotFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "state.snap")
+
+    def test_round_trip(self):
+        size = write_snapshot(self.path, [("t/a", "1", 1700000000.5)], BLOCK_STATES)
+        self.assertEqual(size, os.path.getsize(self.path))
+        data = load_snapshot(self.path)
+        self.assertEqual(data["cache"], [["t/a", "1", 1700000000.5]])
+        expected = dict(BLOCK_STATES["logic"], nested={1: "one", "two": [2.5]}) # n-tice se načte jako seznam
+        self.assertEqual(data["blocks"], {"logic": expected})
+        self.assertIsInstance(data["created"], float)
+
+    def test_header_describes_body(self):
+        write_snapshot(self.path, [], {})
+        with open(self.path, "rb") as f:
+            content = f.read()
+        magic, _, body_len, _ = _HEADER.unpack_from(content)
+        self.assertEqual(magic, MAGIC)
+        self.assertEqual(body_len, len(content) - _HEADER.size)
+
+    def test_damaged_or_missing_file_is_ignored(self):
+        self.assertIsNone(load_snapshot(self.path))
+        write_snapshot(self.path, [("t/a", "1", 0.0)], BLOCK_STATES)
+        with open(self.path, "rb") as f:
+            content = bytearray(f.read())
+
+        damaged = bytearray(content)
+        damaged[-1] ^= 0xFF
+        for name, data in (("flipped byte", damaged), ("truncated body", content[:-3]), ("truncated header", content[:10])):
+            with self.subTest(name):
+                with open(self.path, "wb") as f:
+                    f.write(data)
+                with self.assertLogs("snapshot", "WARNING"):
+                    self.assertIsNone(load_snapshot(self.path))
+
+    def test_failed_write_keeps_previous_snapshot(self):
+        write_snapshot(self.path, [("t/a", "old", 0.0)], {})
+        with mock.patch("snapshot.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                write_snapshot(self.path, [("t/a", "new", 0.0)], {})
+        self.assertEqual(load_snapshot(self.path)["cache"], [["t/a", "old", 0.0]])
+        with self.assertRaises(TypeError):
+            write_snapshot(self.path, [], {"block": object()})
+        self.assertEqual(load_snapshot(self.path)["cache"], [["t/a", "old", 0.0]])
+
+    def test_writer_saves_cache_and_block_states(self):
+        cache = StateCache()
+        cache.set("t/a", "on")
+        writer = SnapshotWriter(self.path, cache, lambda: {"logic": {"is_on": True}})
+        self.assertTrue(writer.write())
+        data = load_snapshot(self.path)
+        self.assertEqual([item[:2] for item in data["cache"]], [["t/a", "on"]])
+        self.assertEqual(data["blocks"], {"logic": {"is_on": True}})
+        self.assertEqual((writer.writes, writer.last_size), (1, os.path.getsize(self.path)))
+
+if __name__ == "__main__":
+    unittest.main()
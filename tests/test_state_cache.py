@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from state_cache import StateCache
+
+class SnapshotTest(unittest.TestCase):
+    def test_snapshot_is_shared_until_next_write(self):
+        cache = StateCache()
+        cache.set("a", "1")
+        first = cache.get_all()
+        self.assertIs(cache.get_all(), first)
+        cache.set("b", "2")
+        second = cache.get_all()
+        self.assertEqual(dict(second), {"a": "1", "b": "2"})
+        self.assertEqual(dict(first), {"a": "1"})
+        with self.assertRaises(TypeError):
+            second["c"] = "3"
+
+    def test_rebuilding_a_snapshot_does_not_need_the_writer_lock(self):
+        cache = StateCache()
+        cache.set("a", "1")
+        result = {}
+        with cache._lock: # zápis právě drží zámek
+            reader = threading.Thread(target=lambda: result.setdefault("all", cache.get_all()))
+            reader.start()
+            reader.join(5)
+            self.assertFalse(reader.is_alive())
+        self.assertEqual(dict(result["all"]), {"a": "1"})
+
+    def test_snapshots_stay_consistent_under_concurrent_writes(self):
+        cache = StateCache()
+        stop = threading.Event()
+
+        def writer():
+            value = 0
+            while not stop.is_set():
+                value += 1
+                cache.set(f"t/{value % 500}", str(value))
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(200):
+                snapshot = cache.snapshot()
+                self.assertLessEqual(len(snapshot), 500)
+                # Každá položka snímku je celý zápis (hodnota patří ke svému tématu)
+                for topic, entry in snapshot.items():
+                    self.assertEqual(f"t/{int(entry.value) % 500}", topic)
+        finally:
+            stop.set()
+            thread.join()
+        # Po poslední změně se snímek dorovná
+        self.assertEqual(dict(cache.get_all()), {topic: entry.value for topic, entry in cache._entries.items()})
+
+if __name__ == "__main__":
+    unittest.main()
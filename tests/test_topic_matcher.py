@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topic_matcher import TopicMatcher
+
+class TopicMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = TopicMatcher()
+        for subscription in ("home/kitchen/temp", "home/+/temp", "home/#", "#", "+/+/+", "home/kitchen/+/raw", "$SYS/#"):
+            self.matcher.add(subscription, subscription)
+
+    def match(self, topic):
+        return sorted(self.matcher.match(topic))
+
+    def test_mqtt_wildcard_rules(self):
+        self.assertEqual(self.match("home/kitchen/temp"), sorted(["home/kitchen/temp", "home/+/temp", "home/#", "#", "+/+/+"]))
+        self.assertEqual(self.match("home/hall/temp"), sorted(["home/+/temp", "home/#", "#", "+/+/+"]))
+        self.assertEqual(self.match("home/kitchen/light/raw"), sorted(["home/kitchen/+/raw", "home/#", "#"]))
+        # '#' zahrnuje i rodičovskou úroveň, '+' ne
+        self.assertEqual(self.match("home"), sorted(["home/#", "#"]))
+        self.assertEqual(self.match("garden/pond"), ["#"])
+
+    def test_dollar_topics_do_not_match_leading_wildcards(self):
+        self.assertEqual(self.match("$SYS/broker/uptime"), ["$SYS/#"])
+
+    def test_empty_levels_are_levels(self):
+        self.assertEqual(self.match("home//temp"), sorted(["home/+/temp", "home/#", "#", "+/+/+"]))
+
+    def test_duplicate_value_is_added_once(self):
+        self.matcher.add("home/kitchen/temp", "home/kitchen/temp")
+        self.assertEqual(self.matcher.match("home/kitchen/temp").count("home/kitchen/temp"), 1)
+
+    def test_remove_prunes_empty_nodes(self):
+        matcher = TopicMatcher()
+        handler, other = object(), object()
+        matcher.add("a/b/c", handler)
+        matcher.add("a/b/c", other)
+        self.assertTrue(matcher.remove("a/b/c", handler))
+        self.assertFalse(matcher.remove("a/b/c", handler))
+        self.assertEqual(matcher.match("a/b/c"), [other])
+        self.assertTrue(matcher.has_subscription("a/b/c"))
+        matcher.remove("a/b/c", other)
+        self.assertFalse(matcher.has_subscription("a/b/c"))
+        self.assertEqual(matcher._root.children, {})
+
+    def test_remove_keeps_nodes_with_children(self):
+        matcher = TopicMatcher()
+        matcher.add("a/b", "parent")
+        matcher.add("a/b/c", "child")
+        matcher.remove("a/b", "parent")
+        self.assertFalse(matcher.has_subscription("a/b"))
+        self.assertEqual(matcher.match("a/b/c"), ["child"])
+        self.assertFalse(matcher.remove("x/y", "child"))
+
+if __name__ == "__main__":
+    unittest.main()
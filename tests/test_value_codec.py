@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from value_codec import InputDecoder, OutputEncoder, build_decoders, parse_typed_names
+
+class InputDecoderTest(unittest.TestCase):
+    def test_payloads_are_converted_to_declared_type(self):
+        cases = {
+            'bool': [("true", True), ("OFF", False), (" 1 ", True), (0, False)],
+            'int': [("42", 42), ("21.0", 21), (7.0, 7), (True, 1)],
+            'float': [("21.5", 21.5), (3, 3.0)],
+            'str': [("abc", "abc"), (5, "5"), (True, "true")],
+            'json': [('{"a": [1, 2]}', {"a": [1, 2]}), ([1], [1])],
+        }
+        for type_name, pairs in cases.items():
+            decoder = InputDecoder(type_name)
+            for raw, expected in pairs:
+                with self.subTest(type=type_name, raw=raw):
+                    self.assertEqual(decoder(raw), expected)
+
+    def test_invalid_payloads_raise(self):
+        for type_name, raw in (('bool', "maybe"), ('int', "21.5"), ('float', "warm"), ('json', "{"), ('int', None)):
+            with self.subTest(type=type_name, raw=raw):
+                with self.assertRaises((TypeError, ValueError)):
+                    InputDecoder(type_name)(raw)
+
+    def test_repeated_payload_reuses_decoded_value(self):
+        decoder = InputDecoder('json')
+        first = decoder('{"on": true}')
+        self.assertIs(decoder('{"on": true}'), first)
+        self.assertIsNot(decoder('{"on": false}'), first)
+
+class OutputEncoderTest(unittest.TestCase):
+    def test_returns_native_value_and_payload(self):
+        self.assertEqual(OutputEncoder('bool')(1), (True, "true"))
+        self.assertEqual(OutputEncoder('int')("3"), (3, "3"))
+        self.assertEqual(OutputEncoder('float')(2), (2.0, "2.0"))
+        self.assertEqual(OutputEncoder('json')({"a": 1}), ({"a": 1}, '{"a": 1}'))
+
+    def test_encoding_native_value_again_gives_same_result(self):
+        for type_name, value in (('bool', "on"), ('int', "7"), ('float', "1.5"), ('str', 4), ('json', '[1, 2]')):
+            with self.subTest(type=type_name):
+                encoder = OutputEncoder(type_name)
+                native, payload = encoder(value)
+                self.assertEqual(encoder(native), (native, payload))
+
+class TypedNamesTest(unittest.TestCase):
+    def test_unknown_type_leaves_name_untyped(self):
+        with self.assertLogs("value_codec", "WARNING"):
+            names, types = parse_typed_names(["power:bool", "level : int", "raw", "odd:decimal"])
+        self.assertEqual(names, ["power", "level", "raw", "odd"])
+        self.assertEqual(types, {"power": "bool", "level": "int"})
+        self.assertEqual(sorted(build_decoders(types)), ["level", "power"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import http.client
+import os
+import sys
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_server import PooledWSGIServer
+from state_cache import StateCache
+from web_server import create_app
+
+class RecordingBlockManager:
+    """Náhrada BlockManageru: jen si zapisuje vložené dávky."""
+    def __init__(self):
+        self.batches = []
+
+    def inject_inputs(self, items):
+        self.batches.append(list(items))
+        return True
+
+class InputBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = RecordingBlockManager()
+        blocks = [{"id": "web", "type": "HttpInput", "config": {"endpoint": "/web"}}]
+        self.client = create_app(self.manager, blocks, StateCache(), os.path.join(ROOT, "lua_blocks")).test_client()
+
+    def test_non_string_target_is_rejected_per_item(self):
+        response = self.client.post("/api/input/batch", json={"items": [{"block_id": {"a": 1}, "value": 2}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["items"][0]["error"], "'block_id' must be a string")
+
+        response = self.client.post("/api/input/batch", json={"items": [{"endpoint": ["web"], "value": 1},
+                                                                         {"endpoint": "web", "value": 2}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["accepted"] for item in response.get_json()["items"]], [False, True])
+        self.assertEqual(len(self.manager.batches), 1)
+
+class BlockDefinitionsTest(unittest.TestCase):
+    def test_gzip_representation_has_its_own_etag(self):
+        client = create_app(RecordingBlockManager(), [], StateCache(), os.path.join(ROOT, "lua_blocks")).test_client()
+        identity = client.get("/api/block-definitions")
+        compressed = client.get("/api/block-definitions", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+        self.assertNotEqual(identity.headers["ETag"], compressed.headers["ETag"])
+        self.assertEqual(compressed.headers["Vary"], "Accept-Encoding")
+
+        # ETag gzip varianty nesmí potvrdit nekomprimovanou odpověď
+        response = client.get("/api/block-definitions", headers={"If-None-Match": compressed.headers["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        response = client.get("/api/block-definitions", headers={"Accept-Encoding": "gzip",
+                                                                 "If-None-Match": compressed.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+class StreamTest(unittest.TestCase):
+    def test_subscription_lives_only_while_the_stream_is_read(self):
+        state_cache = StateCache()
+        app = create_app(RecordingBlockManager(), [], state_cache, os.path.join(ROOT, "lua_blocks"))
+        client = app.test_client()
+
+        # Odpověď, kterou server nezačne posílat (klient zmizel, HEAD), po sobě nic nenechá
+        with app.test_request_context("/api/stream"):
+            response = app.view_functions["stream_status"]()
+            response.close()
+        self.assertEqual(state_cache._subscribers, ())
+
+        response = client.get("/api/stream", buffered=False)
+        self.assertEqual(next(response.response), b"event: ready\ndata: {\"seq\": 0}\n\n")
+        self.assertEqual(len(state_cache._subscribers), 1)
+        response.close()
+        self.assertEqual(state_cache._subscribers, ())
+
+class PooledServerTest(unittest.TestCase):
+    def test_streams_do_not_occupy_pool_workers(self):
+        app = create_app(RecordingBlockManager(), [], StateCache(), os.path.join(ROOT, "lua_blocks"))
+        server = PooledWSGIServer("127.0.0.1", 0, app, workers=1, queue_size=2, max_streams=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.stop, 1.0)
+
+        def get(path):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+            self.addCleanup(connection.close)
+            connection.request("GET", path)
+            return connection.getresponse()
+
+        stream = get("/api/stream")
+        self.assertEqual(stream.status, 200)
+        self.assertEqual(stream.readline(), b"event: ready\n")
+        # Jediné vlákno poolu je po převzetí streamu nahrazené, běžné API dál odpovídá
+        response = get("/api/block-definitions")
+        response.read()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(get("/api/stream").status, 503)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+
+class _Node:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {} # úroveň tématu (včetně '+' a '#') -> _Node
+        self.values = ()   # hodnoty odběrů končících v tomto uzlu (n-tice, nahrazuje se celá)
+
+class TopicMatcher:
+    """
+    Index MQTT odběrů ve tvaru stromu po úrovních tématu.
+    Vyhledání stojí úměrně hloubce tématu (a počtu větví '+'), ne počtu odběrů.
+    Čtení (match) je bez zámku; add/remove nahrazují n-tice hodnot atomicky.
+    """
+    def __init__(self):
+        self._root = _Node()
+        self._lock = threading.Lock()
+
+    def add(self, subscription, value):
+        """Přidá hodnotu (např. handler) k odběru. Duplicitní hodnotu nepřidá."""
+        with self._lock:
+            node = self._root
+            for level in subscription.split('/'):
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _Node()
+                node = child
+            if value not in node.values:
+                node.values = node.values + (value,)
+
+    def remove(self, subscription, value):
+        """Odebere hodnotu z odběru a uklidí prázdné uzly. Vrací True, pokud byla nalezena."""
+        with self._lock:
+            path = [self._root]
+            for level in subscription.split('/'):
+                child = path[-1].children.get(level)
+                if child is None:
+                    return False
+                path.append(child)
+
+            node = path[-1]
+            if value not in node.values:
+                return False
+            node.values = tuple(v for v in node.values if v != value)
+
+            levels = subscription.split('/')
+            for depth in range(len(levels), 0, -1):
+                node = path[depth]
+                if node.values or node.children:
+                    break
+                del path[depth - 1].children[levels[depth - 1]]
+            return True
+
+    def has_subscription(self, subscription):
+        node = self._root
+        for level in subscription.split('/'):
+            node = node.children.get(level)
+            if node is None:
+                return False
+        return bool(node.values)
+
+    def match(self, topic):
+        """Vrátí seznam hodnot všech odběrů, které odpovídají tématu (pravidla MQTT pro '+' a '#')."""
+        levels = topic.split('/')
+        result = []
+        # Témata začínající '$' (např. $SYS) se podle specifikace neshodují se zástupnými znaky na první úrovni
+        self._match(self._root, levels, 0, result, not topic.startswith('$'))
+        return result
+
+    def _match(self, node, levels, index, result, wildcards_allowed):
+        children = node.children
+        if wildcards_allowed:
+            multi = children.get('#')
+            if multi is not None:
+                result.extend(multi.values)
+
+        if index == len(levels):
+            result.extend(node.values)
+            return
+
+        exact = children.get(levels[index])
+        if exact is not None:
+            self._match(exact, levels, index + 1, result, True)
+        if wildcards_allowed:
+            single = children.get('+')
+            if single is not None:
+                self._match(single, levels, index + 1, result, True)
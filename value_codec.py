@@ -0,0 +1,116 @@
+import json
+import logging
+
+from mqtt_client import encode_payload
+
+logger = logging.getLogger(__name__)
+
+_BOOL_STRINGS = {'true': True, 'false': False, '1': True, '0': False, 'on': True, 'off': False}
+
+def _decode_bool(value):
+    if value is True or value is False:
+        return value
+    if isinstance(value, str):
+        result = _BOOL_STRINGS.get(value)
+        if result is None:
+            result = _BOOL_STRINGS.get(value.strip().lower())
+        if result is None:
+            raise ValueError(f"not a boolean: {value!r}")
+        return result
+    if isinstance(value, (int, float)):
+        return value != 0
+    raise TypeError(f"cannot convert {type(value).__name__} to bool")
+
+def _decode_int(value):
+    if isinstance(value, int): # včetně bool
+        return int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f"not an integer: {value!r}")
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            return _decode_int(float(value)) # "21.0" z jiných systémů
+    raise TypeError(f"cannot convert {type(value).__name__} to int")
+
+def _decode_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return float(value)
+    raise TypeError(f"cannot convert {type(value).__name__} to float")
+
+def _decode_str(value):
+    return value if isinstance(value, str) else encode_payload(value)
+
+def _decode_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+# Typ -> (dekodér: payload nebo nativní hodnota -> nativní hodnota, formátování nativní hodnoty na payload)
+VALUE_TYPES = {
+    'bool': (_decode_bool, lambda value: "true" if value else "false"),
+    'int': (_decode_int, str),
+    'float': (_decode_float, repr),
+    'str': (_decode_str, lambda value: value),
+    'json': (_decode_json, json.dumps),
+}
+
+class InputDecoder:
+    """
+    Předkompilovaný dekodér jednoho vstupu bloku. Nativní hodnoty (lokální doručení, hardware)
+    se jen převedou na deklarovaný typ; textové payloady se parsují a výsledek se pamatuje, takže
+    opakovaný stejný payload (periodicky posílaná čidla) se znovu nedekóduje.
+    """
+    __slots__ = ('type_name', '_decode', '_last_raw', '_last_value')
+
+    def __init__(self, type_name):
+        self.type_name = type_name
+        self._decode = VALUE_TYPES[type_name][0]
+        self._last_raw = None
+        self._last_value = None
+
+    def __call__(self, value):
+        if not isinstance(value, str):
+            return self._decode(value)
+        if value == self._last_raw:
+            return self._last_value
+        decoded = self._decode(value)
+        self._last_raw, self._last_value = value, decoded
+        return decoded
+
+class OutputEncoder:
+    """Předkompilovaný kodér výstupu: vrací (hodnota převedená na deklarovaný typ, payload pro MQTT)."""
+    __slots__ = ('type_name', '_decode', '_format')
+
+    def __init__(self, type_name):
+        self.type_name = type_name
+        self._decode, self._format = VALUE_TYPES[type_name]
+
+    def __call__(self, value):
+        value = self._decode(value)
+        return value, self._format(value)
+
+def parse_typed_names(names):
+    """
+    Z položek '@blockinfo' ve tvaru 'jméno' nebo 'jméno:typ' vrátí (jména, {jméno: typ}).
+    Neznámé typy se zahodí s varováním, takový vstup/výstup se chová jako netypovaný.
+    """
+    plain, types = [], {}
+    for item in names:
+        name, _, type_name = (part.strip() for part in item.partition(':'))
+        plain.append(name)
+        if not type_name:
+            continue
+        if type_name not in VALUE_TYPES:
+            logger.warning(f"Unknown value type '{type_name}' for '{name}', expected one of {sorted(VALUE_TYPES)}")
+            continue
+        types[name] = type_name
+    return plain, types
+
+def build_decoders(input_types):
+    return {name: InputDecoder(type_name) for name, type_name in input_types.items()}
+
+def build_encoders(output_types):
+    return {name: OutputEncoder(type_name) for name, type_name in output_types.items()}
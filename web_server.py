@@ -1,93 +1,321 @@
+import json
 import threading
-from flask import Flask, jsonify, request
+import time
+from flask import Flask, Response, jsonify, request
 import logging
-from block_parser import get_all_block_definitions # <-- PŘIDAT IMPORT
+from block_parser import BlockDefinitionRegistry
+from http_server import DevelopmentWSGIServer, PooledWSGIServer
 
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
-def run_web_server(block_manager, all_blocks_config, state_cache, lua_block_dir):
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_CLIENT_BUFFER = 256 # kolik změn smí pomalý klient dlužit, než dostane 'resync'
+BATCH_MAX_ITEMS = 1000      # nejvíc položek v jednom POST /api/input/batch
+BATCH_RETRY_AFTER = 1       # sekundy v hlavičce Retry-After, když je fronta vstupů plná
+
+def _sse_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+def _sse_change(topic, entry):
+    return _sse_event("change", {"topic": topic, "value": entry.value, "seq": entry.seq, "timestamp": entry.timestamp}, entry.seq)
+
+def create_app(block_manager, all_blocks_config, state_cache, lua_block_dir, metrics=None, definitions=None, history=None,
+               server_config=None):
     """
-    Spustí Flask server, který dynamicky vytvoří endpointy na základě konfigurace.
+    Vytvoří Flask aplikaci, která dynamicky vytvoří endpointy na základě konfigurace.
     """
     app = Flask(__name__)
+    server_config = server_config or {}
+    batch_max_items = server_config.get('batch_max_items', BATCH_MAX_ITEMS)
+    batch_retry_after = server_config.get('batch_retry_after', BATCH_RETRY_AFTER)
 
-    # --- Dynamické vytváření POST endpointů ---
-    def create_post_handler(block_id):
+    # --- POST endpointy HTTP vstupů ---
+    # Flask neumí přidávat cesty za běhu, proto je jedna obecná cesta a mapa endpoint -> block_id,
+    # kterou lze při hot reloadu vyměnit (viz update_http_inputs)
+    app.config['HTTP_INPUTS'] = {}
+    update_http_inputs(app, all_blocks_config)
+
+    @app.route('/api/input/batch', methods=['POST'])
+    def post_input_batch():
         """
-        Vytvoří a vrátí funkci, která bude obsluhovat POST request pro konkrétní blok.
-        Toto je potřeba, aby se správně 'uzavřela' proměnná block_id.
+        Více hodnot HTTP vstupů v jednom požadavku: {"items": [{"endpoint": "/...", "value": ...},
+        {"block_id": "...", "value": ...}, ...]} (nebo rovnou seznam položek). Všechny položky se
+        nejdřív zkontrolují, platné se pak zařadí jako jeden celek. Odpověď má u každé položky
+        'accepted' (a u odmítnuté 'error'); při plné frontě je 429 s Retry-After a nepřijme se nic.
         """
-        def post_handler():
-            data = request.get_json()
-            if not data or 'value' not in data:
-                return jsonify({"status": "error", "message": "Missing 'value' in JSON payload"}), 400
-            
-            value = data['value']
-            
-            # Místo publikování na MQTT zavoláme přímo handler v BlockManageru
-            # 'http_input' je fiktivní název vstupu, protože Lua skript ho nepotřebuje
-            block_manager._call_lua_input_handler(block_id, 'http_input', value)
-            
-            logging.getLogger(__name__).info(f"[HTTP] Injected value '{value}' into block '{block_id}'")
-            return jsonify({"status": "success", "block_id": block_id, "value": value})
-        return post_handler
+        data = request.get_json(silent=True)
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return jsonify({"status": "error", "message": "Expected a non-empty list of items"}), 400
+        if len(items) > batch_max_items:
+            return jsonify({"status": "error", "message": f"Too many items ({len(items)}), at most {batch_max_items}"}), 413
 
-    for block in all_blocks_config:
-        if block.get('type') == 'HttpInput':
-            endpoint_url = block.get('config', {}).get('endpoint')
-            block_id = block.get('id')
+        http_inputs = app.config['HTTP_INPUTS']
+        http_blocks = set(http_inputs.values())
+        results, accepted = [], []
+        for item in items:
+            block_id, error = None, None
+            if not isinstance(item, dict) or 'value' not in item:
+                error = "Missing 'value'"
+            elif ('endpoint' in item) == ('block_id' in item):
+                error = "Expected exactly one of 'endpoint' and 'block_id'"
+            elif not isinstance(item.get('endpoint', item.get('block_id')), str):
+                error = f"'{'endpoint' if 'endpoint' in item else 'block_id'}' must be a string"
+            elif 'endpoint' in item:
+                endpoint = item['endpoint']
+                block_id = http_inputs.get(endpoint if endpoint.startswith('/') else '/' + endpoint)
+                if block_id is None:
+                    error = f"No HTTP input at {endpoint}"
+            elif item['block_id'] in http_blocks:
+                block_id = item['block_id']
+            else:
+                error = f"No HTTP input block '{item['block_id']}'"
+            if error is None:
+                accepted.append((block_id, 'http_input', item['value']))
+                results.append({"accepted": True, "block_id": block_id})
+            else:
+                results.append({"accepted": False, "error": error})
 
-            if not endpoint_url or not block_id:
-                logging.warning(f"Skipping HttpInput block due to missing 'endpoint' or 'id'. Block data: {block}")
-                continue
-            
-            # Ujistíme se, že endpoint začíná lomítkem
-            if not endpoint_url.startswith('/'):
-                endpoint_url = '/' + endpoint_url
-            
-            full_url = f"/api/input{endpoint_url}"
-            
-            # Zaregistrujeme novou URL cestu v aplikaci
-            app.add_url_rule(
-                full_url, 
-                endpoint=block_id,  # Každý endpoint musí mít unikátní název
-                view_func=create_post_handler(block_id), 
-                methods=['POST']
-            )
-            logging.getLogger(__name__).info(f"Created HTTP endpoint: POST {full_url} for block '{block_id}'")
+        if not accepted:
+            return jsonify({"status": "error", "accepted": 0, "items": results}), 400
+        if not block_manager.inject_inputs(accepted):
+            for result in results:
+                if result["accepted"]:
+                    result.update(accepted=False, error="Input queue is full")
+            response = jsonify({"status": "error", "message": "Input queue is full, retry later", "accepted": 0, "items": results})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(batch_retry_after)
+            return response
+
+        logging.getLogger(__name__).info(f"[HTTP] Injected batch of {len(accepted)} values ({len(items) - len(accepted)} rejected)")
+        return jsonify({"status": "success" if len(accepted) == len(items) else "partial", "accepted": len(accepted), "items": results})
+
+    @app.route('/api/input/<path:endpoint>', methods=['POST'])
+    def post_input(endpoint):
+        block_id = app.config['HTTP_INPUTS'].get('/' + endpoint)
+        if block_id is None:
+            return jsonify({"status": "error", "message": f"No HTTP input at /api/input/{endpoint}"}), 404
+
+        data = request.get_json()
+        if not data or 'value' not in data:
+            return jsonify({"status": "error", "message": "Missing 'value' in JSON payload"}), 400
+        
+        value = data['value']
+        
+        # Místo publikování na MQTT předáme hodnotu přímo BlockManageru (zpracuje ji hlavní smyčka)
+        # 'http_input' je fiktivní název vstupu, protože Lua skript ho nepotřebuje
+        block_manager.inject_input(block_id, 'http_input', value)
+        
+        logging.getLogger(__name__).info(f"[HTTP] Injected value '{value}' into block '{block_id}'")
+        return jsonify({"status": "success", "block_id": block_id, "value": value})
+
+    @app.route('/api/reload', methods=['GET'])
+    def get_reload_report():
+        """Zpráva o posledním hot reloadu konfigurace (co se změnilo a jak dlouho výměna trvala)."""
+        report = getattr(block_manager, 'last_reload_report', None)
+        if report is None:
+            return jsonify({"status": "error", "message": "No reload has happened yet"}), 404
+        return jsonify(report)
 
     # --- GET endpointy pro monitorování zůstávají stejné ---
     @app.route('/api/status', methods=['GET'])
     def get_all_statuses():
-        return jsonify(state_cache.get_all())
+        """
+        Vrátí stav všech témat. S parametrem ?since=<seq> vrátí jen témata změněná po dané
+        sekvenci; pokud už to cache neumí dohledat, odpoví 409 a klient si má načíst vše znovu.
+        """
+        since = request.args.get('since', type=int)
+        if since is None:
+            response = jsonify(state_cache.get_all())
+            response.headers['X-State-Seq'] = str(state_cache.seq)
+            return response
+
+        changes = state_cache.changes_since(since)
+        if changes is None:
+            return jsonify({"status": "error", "message": "Sequence too old, reload full status", "seq": state_cache.seq}), 409
+        seq, changed = changes
+        return jsonify({"seq": seq, "changes": {topic: entry.value for topic, entry in changed.items()}})
 
     @app.route('/api/status/<path:topic>', methods=['GET'])
     def get_topic_status(topic):
         """Vrátí poslední známý stav konkrétního MQTT tématu z cache."""
-        
-        # --- LADICÍ VÝPIS ---
-        all_cache_content = state_cache.get_all()
-        print(f"DEBUG: Obsah cache v momentě dotazu na '{topic}': {all_cache_content}")
-        
-        value = state_cache.get(topic)
-        if value is not None:
-            return jsonify({"topic": topic, "value": value})
+        entry = state_cache.get_entry(topic)
+        if entry is not None:
+            return jsonify({"topic": topic, "value": entry.value, "seq": entry.seq, "timestamp": entry.timestamp})
         else:
             return jsonify({"status": "error", "message": "Topic not found in cache"}), 404
 
+    @app.route('/api/history/<path:topic>', methods=['GET'])
+    def get_topic_history(topic):
+        """
+        Historie číselného tématu: ?from=&to= (unixové časy, výchozí posledních 24 h) a volitelně
+        ?step= (sekundy) pro agregaci do intervalů. 404, pokud je historie vypnutá nebo téma nezná.
+        """
+        if history is None:
+            return jsonify({"status": "error", "message": "History is disabled"}), 404
+        now = time.time()
+        end = request.args.get('to', now, type=float)
+        start = request.args.get('from', end - 86400, type=float)
+        step = request.args.get('step', type=float)
+        if start > end or (step is not None and step <= 0):
+            return jsonify({"status": "error", "message": "Expected from <= to and step > 0"}), 400
+        try:
+            result = history.query(topic, start, end, step, now=now)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        if result is None:
+            return jsonify({"status": "error", "message": "Topic has no history"}), 404
+        return jsonify({"topic": topic, "from": start, "to": end, **result})
+
+    @app.route('/api/stream', methods=['GET'])
+    def stream_status():
+        """
+        Server-Sent Events se změnami cache, volitelně jen pro témata s daným prefixem (?prefix=).
+        Po výpadku lze navázat od sekvence ?since=<seq> nebo hlavičkou Last-Event-ID.
+        Pomalý klient nikdy nebrzdí zápis: po přetečení bufferu dostane událost 'resync'
+        a má si stav načíst znovu přes GET /api/status.
+        """
+        prefix = request.args.get('prefix', '')
+        since = request.args.get('since', type=int)
+        if since is None and request.headers.get('Last-Event-ID', '').isdigit():
+            since = int(request.headers['Last-Event-ID'])
+
+        def generate():
+            # Odběr vzniká až při prvním čtení odpovědi: když ji nikdo nezačne číst (klient se odpojil,
+            # HEAD), nezůstane viset. Musí vzniknout před čtením seq, aby se žádná změna neztratila.
+            subscription = state_cache.subscribe(prefix, max_buffer=STREAM_CLIENT_BUFFER)
+            try:
+                last_sent = state_cache.seq
+                if since is not None:
+                    backlog = state_cache.changes_since(since)
+                    if backlog is None:
+                        yield _sse_event("resync", {"seq": last_sent})
+                    else:
+                        last_sent, changed = backlog
+                        for topic, entry in sorted(changed.items(), key=lambda item: item[1].seq):
+                            if topic.startswith(prefix):
+                                yield _sse_change(topic, entry)
+                yield _sse_event("ready", {"seq": last_sent})
+
+                while True:
+                    changes, resync_seq = subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                    if resync_seq is not None:
+                        last_sent = resync_seq
+                        yield _sse_event("resync", {"seq": resync_seq})
+                        continue
+                    if not changes:
+                        yield ": keepalive\n\n"
+                        continue
+                    for topic, entry in changes:
+                        # Změny do last_sent už klient má (z backlogu nebo je pokryje resync)
+                        if entry.seq > last_sent:
+                            yield _sse_change(topic, entry)
+            finally:
+                subscription.close()
+
+        return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        """Provozní metriky v textovém formátu Prometheus (404, pokud je měření vypnuté)."""
+        if metrics is None:
+            return jsonify({"status": "error", "message": "Metrics are disabled"}), 404
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    # Registr definic bloků: soubory se parsují jen po změně, tělo odpovědi a ETag jsou připravené předem
+    if definitions is None:
+        definitions = BlockDefinitionRegistry(lua_block_dir)
+
     @app.route('/api/block-definitions', methods=['GET'])
     def get_definitions():
+        compressed = 'gzip' in request.accept_encodings
         try:
-            definitions = get_all_block_definitions(lua_block_dir)
-            return jsonify(definitions)
+            body, etag = definitions.response_body(compressed)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
-    # --- Spuštění serveru ---
-    def start_server():
-        app.run(host='0.0.0.0', port=5001)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+            if compressed:
+                response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return app
+
+def update_http_inputs(app, all_blocks_config):
+    """Sestaví mapu HTTP vstupů (endpoint -> block_id) z konfigurace bloků a vymění ji v aplikaci."""
+    http_inputs = {}
+    for block in all_blocks_config:
+        if block.get('type') == 'HttpInput':
+            endpoint_url = block.get('config', {}).get('endpoint')
+            block_id = block.get('id')
+
+            if not endpoint_url or not block_id:
+                logging.warning(f"Skipping HttpInput block due to missing 'endpoint' or 'id'. Block data: {block}")
+                continue
+            
+            # Ujistíme se, že endpoint začíná lomítkem
+            if not endpoint_url.startswith('/'):
+                endpoint_url = '/' + endpoint_url
+            
+            if endpoint_url == '/batch':
+                logging.warning(f"HttpInput block '{block_id}' uses endpoint /batch, which is reserved for POST /api/input/batch")
+            http_inputs[endpoint_url] = block_id
+            if endpoint_url not in app.config['HTTP_INPUTS']:
+                logging.getLogger(__name__).info(f"Created HTTP endpoint: POST /api/input{endpoint_url} for block '{block_id}'")
+
+    # Výměna celé mapy je atomická, běžící požadavky vidí buď starou, nebo novou
+    app.config['HTTP_INPUTS'] = http_inputs
+
+def run_web_server(block_manager, all_blocks_config, state_cache, lua_block_dir, server_config=None, metrics=None, definitions=None,
+                   history=None):
+    """
+    Spustí webový server v samostatném vlákně.
+
+    server_config (sekce 'http_server' v config.json):
+        mode              'development' (výchozí, vývojový server Flasku) nebo 'pooled'
+        host, port        adresa, na které server naslouchá (výchozí 0.0.0.0:5001)
+        workers           počet pracovních vláken v režimu 'pooled'
+        queue_size        kolik spojení smí čekat ve frontě, než server začne odpovídat 503
+        keepalive_timeout po kolika sekundách nečinnosti se keep-alive spojení zavře
+        max_streams       nejvíc současných /api/stream; streamy běží mimo pool pracovních vláken
+        batch_max_items   nejvíc položek v jednom POST /api/input/batch
+        batch_retry_after Retry-After (s) v odpovědi 429, když je fronta vstupů plná
+
+    definitions je sdílený BlockDefinitionRegistry (jinak si aplikace vytvoří vlastní),
+    history HistoryStore pro /api/history (None = historie vypnutá).
+    Vrací běžící server (jeho Flask aplikace je v atributu app), který je potřeba
+    při ukončení zastavit voláním stop().
+    """
+    server_config = server_config or {}
+    host = server_config.get('host', '0.0.0.0')
+    port = server_config.get('port', 5001)
+    app = create_app(block_manager, all_blocks_config, state_cache, lua_block_dir, metrics, definitions, history, server_config)
+
+    if server_config.get('mode', 'development') == 'pooled':
+        server = PooledWSGIServer(host, port, app,
+                                  workers=server_config.get('workers', 8),
+                                  queue_size=server_config.get('queue_size', 64),
+                                  keepalive_timeout=server_config.get('keepalive_timeout', 5.0),
+                                  max_streams=server_config.get('max_streams', 32))
+        description = f"pooled, {len(server._workers)} workers"
+    else:
+        # Vývojový server: vlákno na každý požadavek
+        server = DevelopmentWSGIServer(host, port, app)
+        description = "development"
 
-    server_thread = threading.Thread(target=start_server, daemon=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
     server_thread.start()
-    logging.getLogger(__name__).info("HTTP server is running on http://localhost:5001")
\ No newline at end of file
+    logging.getLogger(__name__).info(f"HTTP server ({description}) is running on http://localhost:{port}")
+    return server